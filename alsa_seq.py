@@ -0,0 +1,264 @@
+"""
+Piano Pi Brain — ALSA Sequencer Events
+
+Listens on the ALSA sequencer's system announce port (0:1) so the MIDI
+monitor can react to controllers the moment they appear or disappear,
+instead of forking `aconnect -l` on a timer. CaptureSequencer receives
+what the controllers play, for recording (see midi_capture.py), and
+QueueSequencer sends timed events through a sequencer queue (see
+scheduler.py).
+
+Uses the `alsa-midi` package when installed. FakeSequencer offers the same
+interface for driving the monitor on a machine with no MIDI hardware;
+FakeQueueSequencer records what would have been scheduled.
+"""
+
+import logging
+import queue
+import time
+from typing import NamedTuple
+
+try:
+    import alsa_midi
+except ImportError:
+    alsa_midi = None
+
+log = logging.getLogger(__name__)
+
+# System client 0, port 1 broadcasts client/port start/exit notifications
+ANNOUNCE_ADDR = (0, 1)
+
+# Event kinds (mirrors SND_SEQ_EVENT_CLIENT_* / SND_SEQ_EVENT_PORT_*)
+CLIENT_START = "client_start"
+CLIENT_EXIT = "client_exit"
+CLIENT_CHANGE = "client_change"
+PORT_START = "port_start"
+PORT_EXIT = "port_exit"
+PORT_CHANGE = "port_change"
+PORT_SUBSCRIBED = "port_subscribed"
+PORT_UNSUBSCRIBED = "port_unsubscribed"
+
+# Events that can change which controllers are plugged in
+HOTPLUG_EVENTS = {CLIENT_START, CLIENT_EXIT, PORT_START, PORT_EXIT}
+
+
+class SeqEvent(NamedTuple):
+    """A system announcement: what happened, and to which client/port."""
+    kind: str
+    client: int
+    port: int | None = None
+
+
+class AnnounceSequencer:
+    """Sequencer client subscribed to the system announce port."""
+
+    def __init__(self, name="Piano Pi Monitor"):
+        self._client = alsa_midi.SequencerClient(name)
+        self._port = self._client.create_port(
+            "announce",
+            caps=alsa_midi.PortCaps.WRITE | alsa_midi.PortCaps.NO_EXPORT,
+            type=alsa_midi.PortType.APPLICATION,
+        )
+        self._port.connect_from(ANNOUNCE_ADDR)
+
+        t = alsa_midi.EventType
+        self._kinds = {
+            t.CLIENT_START: CLIENT_START,
+            t.CLIENT_EXIT: CLIENT_EXIT,
+            t.CLIENT_CHANGE: CLIENT_CHANGE,
+            t.PORT_START: PORT_START,
+            t.PORT_EXIT: PORT_EXIT,
+            t.PORT_CHANGE: PORT_CHANGE,
+            t.PORT_SUBSCRIBED: PORT_SUBSCRIBED,
+            t.PORT_UNSUBSCRIBED: PORT_UNSUBSCRIBED,
+        }
+
+    def read(self, timeout: float | None = None) -> SeqEvent | None:
+        """Block up to `timeout` seconds for the next announcement."""
+        event = self._client.event_input(timeout=timeout)
+        if event is None:
+            return None
+
+        kind = self._kinds.get(event.type)
+        if kind is None:
+            return None
+
+        addr = getattr(event, "addr", None)
+        if addr is None:
+            # Subscription events carry the sender instead of an address
+            addr = getattr(event, "connect_sender", None)
+        if addr is None:
+            return SeqEvent(kind, -1)
+        return SeqEvent(kind, addr.client_id, addr.port_id)
+
+    def close(self):
+        try:
+            self._client.close()
+        except Exception:
+            pass
+
+
+class CaptureSequencer:
+    """
+    Sequencer client with a port controllers can be subscribed to.
+
+    It is an extra subscriber next to FluidSynth: the kernel delivers each
+    event to both independently, so reading here never delays the sound.
+    """
+
+    def __init__(self, name="Piano Pi Capture"):
+        self._client = alsa_midi.SequencerClient(name)
+        self._port = self._client.create_port(
+            "capture",
+            caps=alsa_midi.PortCaps.WRITE | alsa_midi.PortCaps.SUBS_WRITE,
+            type=alsa_midi.PortType.MIDI_GENERIC | alsa_midi.PortType.APPLICATION,
+        )
+
+    @property
+    def address(self) -> tuple[int, int]:
+        return (self._client.client_id, self._port.port_id)
+
+    def read(self, timeout: float | None = None) -> tuple[int, bytes] | None:
+        """Block up to `timeout` seconds for the next MIDI message: (monotonic ns, bytes)."""
+        event = self._client.event_input(prefer_bytes=True, timeout=timeout)
+        if event is None:
+            return None
+        received = time.monotonic_ns()
+        data = getattr(event, "midi_bytes", None)
+        if not data:
+            return None     # not a MIDI message (e.g. a subscription notice)
+        return received, bytes(data)
+
+    def close(self):
+        try:
+            self._client.close()
+        except Exception:
+            pass
+
+
+class QueueSequencer:
+    """
+    Sequencer client that sends events at absolute times on its own queue.
+
+    The kernel delivers each event when the queue reaches its timestamp,
+    so how late Python gets around to it doesn't matter as long as it is
+    queued ahead of time.
+    """
+
+    def __init__(self, name="Piano Pi Scheduler"):
+        self._client = alsa_midi.SequencerClient(name)
+        self._port = self._client.create_port(
+            "out",
+            caps=alsa_midi.PortCaps.READ | alsa_midi.PortCaps.NO_EXPORT,
+            type=alsa_midi.PortType.MIDI_GENERIC | alsa_midi.PortType.APPLICATION,
+        )
+        self._queue = self._client.create_queue("piano-pi")
+        self._queue.start()
+        self._client.drain_output()
+        self._origin = time.monotonic_ns()     # queue time 0
+
+    def schedule(self, due_ns: int, message: bytes, dest: tuple[int, int]):
+        """Queue `message` for `dest` at monotonic time `due_ns` (sent on flush())."""
+        event = alsa_midi.MidiBytesEvent(message, time=max(0, due_ns - self._origin) / 1e9)
+        self._client.event_output(event, queue=self._queue, port=self._port, dest=dest)
+
+    def flush(self):
+        self._client.drain_output()
+
+    def close(self):
+        try:
+            self._queue.close()
+            self._client.close()
+        except Exception:
+            pass
+
+
+class FakeQueueSequencer:
+    """
+    In-memory stand-in for QueueSequencer: keeps every scheduled event as
+    (due_ns, message, dest, submitted_ns) in `events`.
+    """
+
+    def __init__(self):
+        self.events: list[tuple[int, bytes, tuple | None, int]] = []
+        self.closed = False
+
+    def schedule(self, due_ns: int, message: bytes, dest=None):
+        self.events.append((due_ns, message, dest, time.monotonic_ns()))
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+class FakeSequencer:
+    """
+    In-memory stand-in for AnnounceSequencer.
+
+    Call push() to simulate devices being plugged in or removed; the
+    monitor reads them exactly as it would read real announcements.
+    """
+
+    def __init__(self):
+        self._events: queue.Queue = queue.Queue()
+        self.closed = False
+
+    def push(self, kind: str, client: int, port: int | None = None):
+        self._events.put(SeqEvent(kind, client, port))
+
+    def read(self, timeout: float | None = None) -> SeqEvent | None:
+        if self.closed:
+            raise OSError("sequencer closed")
+        try:
+            return self._events.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.closed = True
+
+
+def open_announce_sequencer():
+    """
+    Open a sequencer client listening for hotplug announcements.
+
+    Returns None when the ALSA sequencer API isn't usable (package missing,
+    no /dev/snd/seq, permissions), so callers can fall back to polling.
+    """
+    if alsa_midi is None:
+        log.info("alsa-midi not installed — hotplug events unavailable")
+        return None
+
+    try:
+        return AnnounceSequencer()
+    except Exception as e:
+        log.warning("Could not open ALSA sequencer: %s", e)
+        return None
+
+
+def open_capture_sequencer(name="Piano Pi Capture"):
+    """Open a sequencer client to receive MIDI on; None when the ALSA sequencer API isn't usable."""
+    if alsa_midi is None:
+        log.info("alsa-midi not installed — %s unavailable", name)
+        return None
+
+    try:
+        return CaptureSequencer(name)
+    except Exception as e:
+        log.warning("Could not open ALSA sequencer for %s: %s", name, e)
+        return None
+
+
+def open_queue_sequencer():
+    """Open a sequencer client for timed output; None when the ALSA sequencer API isn't usable."""
+    if alsa_midi is None:
+        log.info("alsa-midi not installed — scheduled MIDI (metronome) unavailable")
+        return None
+
+    try:
+        return QueueSequencer()
+    except Exception as e:
+        log.warning("Could not open ALSA sequencer queue: %s", e)
+        return None
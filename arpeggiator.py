@@ -0,0 +1,267 @@
+"""
+Piano Pi Brain — Arpeggiator
+
+Plays the held keys as a pattern (up, down, updown, random, chord) over
+one or more octaves, with gate length and swing.
+
+While it is on, the MIDI monitor routes the controllers to the
+arpeggiator's own sequencer port instead of FluidSynth (see
+MidiMonitor.divert). Key presses and releases change the held notes;
+everything else (pedals, bends, program changes) is passed straight
+through to FluidSynth. The steps go out through the scheduler (see
+scheduler.py), queued ARP_LOOKAHEAD ahead with absolute timestamps, so
+Python hiccups shorter than that don't move a note.
+
+Step times come from an anchor (step number + time), like the metronome,
+so the pattern can't drift; the first key of a phrase sets the anchor.
+Swing delays every second step by `swing` × step length.
+"""
+
+import logging
+import random
+import threading
+
+import alsa_seq
+import config
+import smf
+
+log = logging.getLogger(__name__)
+
+PATTERNS = ("up", "down", "updown", "random", "chord")
+
+
+class Arpeggiator:
+    """Held keys -> scheduled note pattern; a scheduler source."""
+
+    def __init__(self, scheduler, source=None, on_route=None, on_change=None):
+        """
+        Args:
+            scheduler: Scheduler that queues the notes
+            source: MIDI input with read(timeout) -> (time_ns, bytes) | None
+                and `address` (alsa_seq.CaptureSequencer). None = open one
+                the first time the arpeggiator is switched on.
+            on_route: Callback(address | None) to send the controllers to
+                the arpeggiator's port (None = back to FluidSynth)
+            on_change: Callback(state: dict) after every change
+        """
+        self._scheduler = scheduler
+        self._source = source
+        self._on_route = on_route
+        self._on_change = on_change
+        self._lock = threading.Lock()
+        # On/off comes from web requests and buttons at once: one at a time
+        self._switch_lock = threading.RLock()
+        self._reader = None
+        self._random = random.Random()
+        self.enabled = False
+        self.pattern = config.ARP_PATTERN
+        self.bpm = float(config.ARP_BPM)
+        self.rate = config.ARP_RATE
+        self.octaves = config.ARP_OCTAVES
+        self.gate = config.ARP_GATE
+        self.swing = config.ARP_SWING
+        self._held: dict[int, int] = {}     # note -> velocity
+        self._channel = 0
+        # Step `_anchor_step` is due at `_anchor_ns`; the next step to queue is `_step`
+        self._anchor_ns = 0
+        self._anchor_step = 0
+        self._step = 0
+        scheduler.add(self)
+
+    @property
+    def active(self) -> bool:
+        return self.enabled and bool(self._held)
+
+    @property
+    def lookahead(self) -> float:
+        return config.ARP_LOOKAHEAD
+
+    # --- Control -----------------------------------------------------------------
+
+    def enable(self) -> bool:
+        """Switch on: take over the controllers. False if there's no MIDI input."""
+        with self._switch_lock:
+            if self.enabled:
+                return True
+            if self._source is None:
+                self._source = alsa_seq.open_capture_sequencer("Piano Pi Arpeggiator")
+                if self._source is None:
+                    return False
+            self.enabled = True
+            self._reader = threading.Thread(target=self._read_loop, name="arp-read", daemon=True)
+            self._reader.start()
+            self._route(getattr(self._source, "address", None))
+        log.info("Arpeggiator on (%s, %g bpm)", self.pattern, self.bpm)
+        self._changed()
+        return True
+
+    def disable(self):
+        """Switch off: controllers go straight to FluidSynth again."""
+        with self._switch_lock:
+            if not self.enabled:
+                return
+            self.enabled = False
+            with self._lock:
+                self._held.clear()
+            self._route(None)
+            if self._reader:
+                self._reader.join(timeout=2)
+                self._reader = None
+        log.info("Arpeggiator off")
+        self._changed()
+
+    def toggle(self) -> bool:
+        with self._switch_lock:
+            if self.enabled:
+                self.disable()
+                return True
+            return self.enable()
+
+    def close(self):
+        with self._switch_lock:
+            self.disable()
+            if self._source is not None:
+                self._source.close()
+
+    def set(self, pattern=None, bpm=None, rate=None, octaves=None, gate=None, swing=None):
+        """Change settings. Raises ValueError (nothing is changed) for an invalid value."""
+        if pattern is not None and pattern not in PATTERNS:
+            raise ValueError(f"pattern must be one of {', '.join(PATTERNS)}")
+        bpm = float(bpm) if bpm is not None else self.bpm
+        if not config.METRONOME_MIN_BPM <= bpm <= config.METRONOME_MAX_BPM:
+            raise ValueError(f"bpm must be {config.METRONOME_MIN_BPM}–{config.METRONOME_MAX_BPM}")
+        rate = int(rate) if rate is not None else self.rate
+        if not 1 <= rate <= 8:
+            raise ValueError("rate must be 1–8 steps per beat")
+        octaves = int(octaves) if octaves is not None else self.octaves
+        if not 1 <= octaves <= 4:
+            raise ValueError("octaves must be 1–4")
+        gate = float(gate) if gate is not None else self.gate
+        if not 0.05 <= gate <= 1.0:
+            raise ValueError("gate must be 0.05–1.0")
+        swing = float(swing) if swing is not None else self.swing
+        if not 0.0 <= swing <= 0.5:
+            raise ValueError("swing must be 0–0.5")
+
+        with self._lock:
+            if bpm != self.bpm or rate != self.rate:
+                self._reanchor()
+            self.pattern = pattern or self.pattern
+            self.bpm, self.rate, self.octaves = bpm, rate, octaves
+            self.gate, self.swing = gate, swing
+        self._changed()
+
+    def next_pattern(self, delta: int = 1):
+        self.set(pattern=PATTERNS[(PATTERNS.index(self.pattern) + delta) % len(PATTERNS)])
+
+    def state(self) -> dict:
+        with self._lock:
+            held = sorted(self._held)
+        return {
+            "enabled": self.enabled,
+            "pattern": self.pattern,
+            "bpm": self.bpm,
+            "rate": self.rate,
+            "octaves": self.octaves,
+            "gate": self.gate,
+            "swing": self.swing,
+            "held": held,
+            "available": self._scheduler.available,
+        }
+
+    def _route(self, address):
+        if self._on_route:
+            try:
+                self._on_route(address)
+            except Exception as e:
+                log.error("Arpeggiator routing failed: %s", e)
+
+    def _changed(self):
+        self._scheduler.wake()
+        if self._on_change:
+            try:
+                self._on_change(self.state())
+            except Exception as e:
+                log.error("Arpeggiator callback failed: %s", e)
+
+    # --- Input ---------------------------------------------------------------------
+
+    def _read_loop(self):
+        source = self._source
+        while self.enabled:
+            try:
+                event = source.read(timeout=0.5)
+            except Exception as e:
+                log.error("Arpeggiator input stopped: %s", e)
+                return
+            if event is not None:
+                self.feed(*event)
+
+    def feed(self, time_ns: int, message: bytes):
+        """One message from the controllers: keys change the held notes, the rest passes through."""
+        status = message[0] & 0xF0
+        if status == 0x90 and len(message) == 3 and message[2]:
+            with self._lock:
+                if not self._held:
+                    # First key of a phrase: the pattern starts on it
+                    self._anchor_ns = time_ns
+                    self._anchor_step = self._step = 0
+                self._held[message[1]] = message[2]
+                self._channel = message[0] & 0x0F
+            self._scheduler.wake()
+        elif status in (0x80, 0x90) and len(message) == 3:
+            with self._lock:
+                self._held.pop(message[1], None)
+        else:
+            self._scheduler.send_now(message)
+
+    # --- Scheduler source ----------------------------------------------------------
+
+    def _step_ns(self) -> float:
+        return 60e9 / self.bpm / self.rate
+
+    def _grid(self, step: int) -> int:
+        return self._anchor_ns + round((step - self._anchor_step) * self._step_ns())
+
+    def _reanchor(self):
+        """Keep the next unqueued step where the current tempo puts it (lock held)."""
+        self._anchor_ns = self._grid(self._step)
+        self._anchor_step = self._step
+
+    def _sequence(self) -> list[tuple[int, int]]:
+        """The pattern's (note, velocity) cycle for the held keys (lock held)."""
+        seq = [(note + 12 * octave, velocity)
+               for octave in range(self.octaves)
+               for note, velocity in sorted(self._held.items())
+               if note + 12 * octave <= 127]
+        if self.pattern == "down":
+            seq.reverse()
+        elif self.pattern == "updown" and len(seq) > 2:
+            seq += seq[-2:0:-1]
+        return seq
+
+    def events_until(self, horizon_ns: int) -> list[tuple[int, bytes]]:
+        ch = self._channel
+        events = []
+        with self._lock:
+            if not self.active:
+                return events
+            seq = self._sequence()
+            step_ns = self._step_ns()
+            gate_ns = round(self.gate * step_ns)
+            swing_ns = round(self.swing * step_ns)
+            while True:
+                due = self._grid(self._step) + (swing_ns if self._step % 2 else 0)
+                if due >= horizon_ns:
+                    break
+                if self.pattern == "chord":
+                    notes = seq
+                elif self.pattern == "random":
+                    notes = [self._random.choice(seq)]
+                else:
+                    notes = [seq[self._step % len(seq)]]
+                for note, velocity in notes:
+                    events.append((due, smf.note_on(ch, note, velocity)))
+                    events.append((due + gate_ns, smf.note_off(ch, note)))
+                self._step += 1
+        return events
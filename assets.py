@@ -0,0 +1,203 @@
+"""
+Piano Pi Brain — Web Assets
+
+Builds the web portal's files once at startup instead of reading them
+from the SD card on every request:
+
+  - CSS/JS/HTML are minified (conservatively: comments and indentation)
+  - static files get a content-hashed alias (app.3f2a1c9b7e01.css) that
+    index.html links to, so they can be cached forever ("immutable");
+    the page itself and sw.js are revalidated with strong ETags
+  - every text asset is precompressed with gzip, and brotli when the
+    `brotli` package is installed
+  - sw.js (the service worker) is stamped with the asset version and the
+    list of files to precache
+
+Run `python3 assets.py` to see what gets built and the compressed sizes.
+"""
+
+import gzip
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+import re
+from typing import NamedTuple
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+log = logging.getLogger(__name__)
+
+WEB_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "web")
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+
+_TEXT_TYPES = ("text/", "application/javascript", "application/json", "image/svg+xml")
+
+# Suffixes added to the ETag of each encoding (a strong ETag must differ
+# between representations)
+_ENCODING_TAGS = {"identity": "", "gzip": "-gz", "br": "-br"}
+
+
+class Asset(NamedTuple):
+    url: str
+    content_type: str
+    digest: str
+    bodies: dict            # encoding -> bytes
+    cache_control: str
+
+    def etag(self, encoding: str) -> str:
+        return f"{self.digest}{_ENCODING_TAGS[encoding]}"
+
+    def etags(self) -> list[str]:
+        return [self.etag(encoding) for encoding in self.bodies]
+
+
+# ---------------------------------------------------------------------------
+# Minifiers (whitespace and comments only — nothing that could change meaning)
+# ---------------------------------------------------------------------------
+
+def minify_css(text: str) -> str:
+    text = re.sub(r"/\*.*?\*/", "", text, flags=re.DOTALL)
+    text = re.sub(r"\s+", " ", text)
+    text = re.sub(r"\s*([{};,>])\s*", r"\1", text)
+    text = re.sub(r":\s+", ":", text)
+    return text.replace(";}", "}").strip()
+
+
+def minify_js(text: str) -> str:
+    lines = []
+    for line in text.splitlines():
+        line = line.strip()
+        if line and not line.startswith("//"):
+            lines.append(line)
+    return "\n".join(lines) + "\n"
+
+
+def minify_html(text: str) -> str:
+    text = re.sub(r"<!--.*?-->", "", text, flags=re.DOTALL)
+    return "\n".join(line.strip() for line in text.splitlines() if line.strip()) + "\n"
+
+
+_MINIFIERS = {".css": minify_css, ".js": minify_js, ".html": minify_html}
+
+
+# ---------------------------------------------------------------------------
+# Bundle
+# ---------------------------------------------------------------------------
+
+def _content_type(path: str) -> str:
+    if path.endswith(".js"):
+        return "text/javascript; charset=utf-8"
+    kind = mimetypes.guess_type(path)[0] or "application/octet-stream"
+    return f"{kind}; charset=utf-8" if kind.startswith("text/") else kind
+
+
+def _compress(data: bytes, content_type: str) -> dict:
+    bodies = {"identity": data}
+    if not content_type.startswith(_TEXT_TYPES):
+        return bodies
+    gz = gzip.compress(data, compresslevel=9, mtime=0)
+    if len(gz) < len(data):
+        bodies["gzip"] = gz
+    if brotli is not None:
+        br = brotli.compress(data, quality=11)
+        if len(br) < len(data):
+            bodies["br"] = br
+    return bodies
+
+
+def _digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()[:12]
+
+
+class AssetBundle:
+    """All web assets, built in memory and keyed by URL."""
+
+    def __init__(self, root: str = WEB_DIR):
+        self.root = root
+        self._assets: dict[str, Asset] = {}
+        self.build()
+
+    def get(self, url: str) -> Asset | None:
+        return self._assets.get(url)
+
+    def __iter__(self):
+        return iter(self._assets.values())
+
+    def _add(self, url: str, data: bytes, cache_control: str, path: str | None = None) -> Asset:
+        content_type = _content_type(path or url)
+        asset = Asset(url, content_type, _digest(data), _compress(data, content_type), cache_control)
+        self._assets[url] = asset
+        return asset
+
+    def build(self):
+        self._assets = {}
+        hashed = {}     # "/static/app.css" -> "/static/app.<hash>.css"
+
+        static_dir = os.path.join(self.root, "static")
+        for dirpath, _, files in os.walk(static_dir):
+            for name in sorted(files):
+                path = os.path.join(dirpath, name)
+                url = "/static/" + os.path.relpath(path, static_dir).replace(os.sep, "/")
+                data = self._read(path)
+                # The plain name stays valid (revalidated) for anything linking to it
+                asset = self._add(url, data, REVALIDATE)
+                stem, ext = os.path.splitext(url)
+                hashed[url] = f"{stem}.{asset.digest}{ext}"
+                self._add(hashed[url], data, IMMUTABLE, path=url)
+
+        index_path = os.path.join(self.root, "index.html")
+        if os.path.isfile(index_path):
+            html = self._read(index_path).decode()
+            for plain, versioned in hashed.items():
+                html = html.replace(f'"{plain}"', f'"{versioned}"')
+            index = self._add("/", html.encode(), REVALIDATE, path="index.html")
+
+            sw_path = os.path.join(self.root, "sw.js")
+            if os.path.isfile(sw_path):
+                sw = self._read(sw_path).decode()
+                version = _digest("".join([index.digest, *sorted(hashed.values())]).encode())
+                sw = sw.replace("__VERSION__", version)
+                sw = sw.replace("__PRECACHE__", json.dumps(["/", *sorted(hashed.values())]))
+                self._add("/sw.js", sw.encode(), REVALIDATE)
+
+        log.info("Built %d web assets%s", len(self._assets),
+                 "" if brotli else " (gzip only — brotli not installed)")
+
+    @staticmethod
+    def _read(path: str) -> bytes:
+        with open(path, "rb") as f:
+            data = f.read()
+        minify = _MINIFIERS.get(os.path.splitext(path)[1])
+        return minify(data.decode()).encode() if minify else data
+
+
+def choose_encoding(asset: Asset, accept_encoding: str) -> str:
+    """Best encoding of `asset` the client accepts (br > gzip > identity)."""
+    accepted = {}
+    for part in accept_encoding.split(","):
+        token, _, params = part.strip().partition(";")
+        q = 1.0
+        if params.strip().startswith("q="):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                pass
+        accepted[token.strip().lower()] = q
+    for encoding in ("br", "gzip"):
+        if encoding in asset.bodies and accepted.get(encoding, accepted.get("*", 0)) > 0:
+            return encoding
+    return "identity"
+
+
+if __name__ == "__main__":
+    bundle = AssetBundle()
+    for asset in bundle:
+        sizes = ", ".join(f"{enc} {len(body)}" for enc, body in asset.bodies.items())
+        print(f"{asset.url:40} {asset.cache_control:38} {sizes}")
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Compare two bench/run.py result files.
+
+    python3 bench/compare.py base.json new.json [--threshold 20]
+
+Prints each metric side by side and exits 1 if any metric got worse by
+more than the threshold (percent). Absolute differences below a per-unit
+floor (NOISE_FLOOR) are ignored, so sub-millisecond jitter on tiny values
+doesn't fail the run.
+"""
+
+import argparse
+import json
+import sys
+
+# Smallest absolute change, per unit, that can count as a regression
+NOISE_FLOOR = {"ms": 0.5, "s": 0.01, "cpu-s": 1.0, "forks": 1.0, "ns": 100, "µs": 1.0, "%": 1.0, "ev/s": 1000}
+
+
+def load(path: str) -> dict:
+    with open(path) as f:
+        return json.load(f)
+
+
+def compare(base: dict, new: dict, threshold: float) -> list[str]:
+    """Print the comparison table; return the names of regressed metrics."""
+    regressions = []
+    names = sorted(set(base["results"]) | set(new["results"]))
+
+    print(f"{'metric':34} {'base':>12} {'new':>12} {'change':>9}")
+    for name in names:
+        a, b = base["results"].get(name), new["results"].get(name)
+        if a is None or b is None:
+            which = "base" if a is None else "new"
+            print(f"{name:34} {'(missing in ' + which + ')':>35}")
+            continue
+
+        delta = b["value"] - a["value"]
+        pct = delta / a["value"] * 100 if a["value"] else (0.0 if not delta else float("inf"))
+        worse = delta > 0 if a.get("better", "lower") == "lower" else delta < 0
+        flag = ""
+        if worse and abs(pct) > threshold and abs(delta) > NOISE_FLOOR.get(b["unit"], 0.0):
+            regressions.append(name)
+            flag = "  REGRESSION"
+
+        print(f"{name:34} {a['value']:12.4f} {b['value']:12.4f} {pct:+8.1f}% {b['unit']}{flag}")
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files")
+    parser.add_argument("base")
+    parser.add_argument("new")
+    parser.add_argument("--threshold", type=float, default=20.0,
+                        help="percent change counted as a regression (default 20)")
+    args = parser.parse_args()
+
+    base, new = load(args.base), load(args.new)
+    print(f"base: {base['meta'].get('commit')}  new: {new['meta'].get('commit')}")
+    regressions = compare(base, new, args.threshold)
+    if regressions:
+        print(f"\n{len(regressions)} regression(s): {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
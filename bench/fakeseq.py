@@ -0,0 +1,140 @@
+"""
+Fake ALSA sequencer shared by the stub `aconnect` and `fluidsynth`.
+
+State lives in a JSON file (BENCH_SEQ_STATE) guarded by flock; after
+every change it is rendered in /proc/asound/seq/clients format to
+BENCH_SEQ_PROC, which the benchmark points topology.PROC_CLIENTS at.
+"""
+
+import fcntl
+import json
+import os
+import time
+from contextlib import contextmanager
+
+
+def _paths():
+    return os.environ["BENCH_SEQ_STATE"], os.environ["BENCH_SEQ_PROC"]
+
+
+def log_event(env_var: str, text: str):
+    """Append a timestamped line (CLOCK_MONOTONIC, shared across processes)."""
+    path = os.environ.get(env_var)
+    if path:
+        with open(path, "a") as f:
+            f.write(f"{time.monotonic():.6f} {text}\n")
+
+
+def read_log(path: str) -> list[tuple[float, str]]:
+    try:
+        with open(path) as f:
+            return [(float(t), rest) for t, _, rest in
+                    (line.rstrip("\n").partition(" ") for line in f) if t]
+    except FileNotFoundError:
+        return []
+
+
+@contextmanager
+def transaction():
+    """Lock, load, yield the state for editing, then save and render."""
+    state_path, proc_path = _paths()
+    with open(state_path + ".lock", "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            with open(state_path) as f:
+                state = json.load(f)
+        except (FileNotFoundError, ValueError):
+            state = {"clients": {}}
+
+        yield state
+
+        tmp = state_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp, state_path)
+        tmp = proc_path + ".tmp"
+        with open(tmp, "w") as f:
+            f.write(render_proc(state))
+        os.replace(tmp, proc_path)
+
+
+def snapshot() -> dict:
+    with transaction() as state:
+        return json.loads(json.dumps(state))
+
+
+def reset():
+    with transaction() as state:
+        state["clients"] = {
+            "0": {"name": "System", "ports": {
+                "0": {"name": "Timer", "caps": "Rwe-", "to": []},
+                "1": {"name": "Announce", "caps": "R-e-", "to": []},
+            }},
+            "14": {"name": "Midi Through", "ports": {
+                "0": {"name": "Midi Through Port-0", "caps": "RWe-", "to": []},
+            }},
+        }
+
+
+def add_client(name: str, ports: list[tuple[str, str]], user=False) -> int:
+    """Add a client with [(port name, caps), ...]; returns its id."""
+    with transaction() as state:
+        used = {int(c) for c in state["clients"]}
+        cid = 128 if user else 20
+        while cid in used:
+            cid += 1
+        state["clients"][str(cid)] = {
+            "name": name,
+            "ports": {str(i): {"name": n, "caps": caps, "to": []}
+                      for i, (n, caps) in enumerate(ports)},
+        }
+    return cid
+
+
+def remove_client(cid: int):
+    with transaction() as state:
+        state["clients"].pop(str(cid), None)
+        for client in state["clients"].values():
+            for port in client["ports"].values():
+                port["to"] = [a for a in port["to"] if not a.startswith(f"{cid}:")]
+
+
+def set_connected(src: str, dst: str, on: bool) -> bool:
+    """Add/remove a subscription "c:p" -> "c:p"; False if either end is missing."""
+    with transaction() as state:
+        sc, sp = src.split(":")
+        dc, dp = dst.split(":")
+        try:
+            port = state["clients"][sc]["ports"][sp]
+            state["clients"][dc]["ports"][dp]
+        except KeyError:
+            return False
+        if on and dst not in port["to"]:
+            port["to"].append(dst)
+        elif not on and dst in port["to"]:
+            port["to"].remove(dst)
+        return True
+
+
+def render_proc(state: dict) -> str:
+    lines = ["Client info", f"  cur  clients : {len(state['clients'])}", ""]
+    for cid, client in sorted(state["clients"].items(), key=lambda kv: int(kv[0])):
+        kind = "User" if int(cid) >= 128 else "Kernel"
+        lines.append(f'Client {int(cid):3d} : "{client["name"]}" [{kind}]')
+        for num, port in sorted(client["ports"].items(), key=lambda kv: int(kv[0])):
+            lines.append(f'  Port {int(num):3d} : "{port["name"]}" ({port["caps"]})')
+            if port["to"]:
+                lines.append(f'    Connecting To: {", ".join(port["to"])}')
+    return "\n".join(lines) + "\n"
+
+
+def render_aconnect(state: dict) -> str:
+    lines = []
+    for cid, client in sorted(state["clients"].items(), key=lambda kv: int(kv[0])):
+        kind = "user" if int(cid) >= 128 else "kernel"
+        lines.append(f"client {cid}: '{client['name']}' [type={kind}]")
+        for num, port in sorted(client["ports"].items(), key=lambda kv: int(kv[0])):
+            lines.append(f"    {num} '{port['name']}'")
+            if port["to"]:
+                lines.append(f"\tConnecting To: {', '.join(port['to'])}")
+    return "\n".join(lines) + "\n"
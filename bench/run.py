@@ -0,0 +1,694 @@
+#!/usr/bin/env python3
+"""
+Piano Pi Brain — Control-plane Benchmarks
+
+Boots the real components (piano_pi.startup) against stub `aconnect` and
+`fluidsynth` executables (bench/stubs) sharing a fake sequencer graph,
+with gpiozero's MockFactory standing in for the pins, and measures:
+
+  - boot to ready, FluidSynth cold restart and standby failover
+  - button press -> program change reaching FluidSynth
+  - web instrument selection round trip
+  - hotplug -> controller routed to FluidSynth
+  - MIDI poll loop CPU and forks per hour (/proc vs aconnect fallback)
+  - FluidSynth crash -> detected, and -> replacement playing
+  - tracing span overhead, off and on
+  - MIDI capture throughput and drop rate (synthetic events)
+  - metronome timing under load: queued clicks vs a sleep() loop
+  - arpeggiator step timing under load, CPU per generated note
+  - backing-track player: time to first note and memory for a large file
+  - config.py reload with a channel change, applied without a restart
+  - primary soundfont switch while running (load, re-select, unload)
+
+Results are written as JSON for bench/compare.py:
+
+    python3 bench/run.py -o before.json
+    ... change things ...
+    python3 bench/run.py -o after.json
+    python3 bench/compare.py before.json after.json
+"""
+
+import argparse
+import datetime
+import json
+import logging
+import os
+import platform
+import resource
+import signal
+import socket
+import statistics
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, REPO_DIR)
+
+import fakeseq  # noqa: E402
+
+log = logging.getLogger("bench")
+
+
+# ---------------------------------------------------------------------------
+# Environment
+# ---------------------------------------------------------------------------
+
+def write_soundfont(path: str, programs=range(128)):
+    """Write a minimal SF2 with one preset per GM program (no samples)."""
+    def chunk(cid, data):
+        return cid + struct.pack("<I", len(data)) + data + b"\0" * (len(data) & 1)
+
+    phdr = b"".join(struct.pack("<20sHHHIII", f"GM {p}".encode(), p, 0, i, 0, 0, 0)
+                    for i, p in enumerate(programs))
+    phdr += struct.pack("<20sHHHIII", b"EOP", 0, 0, len(programs), 0, 0, 0)
+    body = (b"sfbk"
+            + chunk(b"LIST", b"INFO" + chunk(b"ifil", struct.pack("<HH", 2, 1)))
+            + chunk(b"LIST", b"sdta" + chunk(b"smpl", b""))
+            + chunk(b"LIST", b"pdta" + chunk(b"phdr", phdr)))
+    with open(path, "wb") as f:
+        f.write(b"RIFF" + struct.pack("<I", len(body)) + body)
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def setup(workdir: str, load_seconds: float):
+    """Point the stubs, config and topology at a private fake system."""
+    env = {
+        "BENCH_SEQ_STATE": os.path.join(workdir, "seq.json"),
+        "BENCH_SEQ_PROC": os.path.join(workdir, "clients"),
+        "BENCH_FLUID_LOG": os.path.join(workdir, "fluidsynth.log"),
+        "BENCH_ACONNECT_LOG": os.path.join(workdir, "aconnect.log"),
+        "BENCH_FLUID_LOAD_SECONDS": str(load_seconds),
+        "PATH": os.path.join(BENCH_DIR, "stubs") + os.pathsep + os.environ["PATH"],
+        "PYTHONPATH": REPO_DIR,
+    }
+    os.environ.update(env)
+    fakeseq.reset()
+
+    import config
+    import topology
+    import alsa_seq
+
+    sf2 = os.path.join(workdir, "bench.sf2")
+    write_soundfont(sf2)
+    config.SOUNDFONT_PATH = sf2
+    config.SOUNDFONT_FALLBACK = os.path.join(workdir, "missing.sf2")
+    config.FLUIDSYNTH_SHELL_PORT = free_port()
+    config.FLUIDSYNTH_STANDBY = False
+    config.BOOT_TRACE_FILE = os.path.join(workdir, "boot-trace.json")
+    config.CAPTURE_DIR = os.path.join(workdir, "recordings")
+    config.PLAYER_DIR = os.path.join(workdir, "midi")
+    config.CONFIG_WATCH = False
+    # The background poll thread must not interfere with the measurements
+    config.MIDI_POLL_INTERVAL = 3600.0
+    topology.PROC_CLIENTS = env["BENCH_SEQ_PROC"]
+
+    # Hotplug announcements come from a fake sequencer the bench drives
+    sequencer = alsa_seq.FakeSequencer()
+    alsa_seq.open_announce_sequencer = lambda: sequencer
+
+    try:
+        from gpiozero import Device
+        from gpiozero.pins.mock import MockFactory
+        Device.pin_factory = MockFactory()
+        mock_pins = True
+    except ImportError:
+        mock_pins = False
+
+    return env, sequencer, mock_pins
+
+
+def wait_for(predicate, timeout=10.0, interval=0.001):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        value = predicate()
+        if value:
+            return value
+        time.sleep(interval)
+    return None
+
+
+def log_entries_after(path: str, since: float, prefix: str) -> list[float]:
+    return [t for t, line in fakeseq.read_log(path) if t >= since and line.startswith(prefix)]
+
+
+def cpu_seconds() -> float:
+    """User + system CPU of this process and its reaped children (µs resolution)."""
+    total = 0.0
+    for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN):
+        usage = resource.getrusage(who)
+        total += usage.ru_utime + usage.ru_stime
+    return total
+
+
+def summary(samples: list[float]) -> dict:
+    samples = sorted(samples)
+    return {
+        "p50": statistics.median(samples),
+        "p95": samples[min(len(samples) - 1, int(len(samples) * 0.95))],
+        "n": len(samples),
+    }
+
+
+# ---------------------------------------------------------------------------
+# Benchmarks
+# ---------------------------------------------------------------------------
+
+class Bench:
+    def __init__(self, env, sequencer, mock_pins, iterations, poll_interval):
+        self.env = env
+        self.sequencer = sequencer
+        self.mock_pins = mock_pins
+        self.iterations = iterations
+        # The configured interval (setup() slows the background thread down)
+        self.poll_interval = poll_interval
+        self.results = {}
+
+    def record(self, name, value, unit, better="lower", **extra):
+        self.results[name] = {"value": value, "unit": unit, "better": better, **extra}
+        log.info("%-34s %10.4f %s", name, value, unit)
+
+    def record_latency(self, name, samples):
+        stats = summary(samples)
+        self.record(f"{name}_p50", stats["p50"] * 1000, "ms", n=stats["n"])
+        self.record(f"{name}_p95", stats["p95"] * 1000, "ms", n=stats["n"])
+
+    def boot(self):
+        import config
+        import piano_pi
+
+        t0 = time.monotonic()
+        self.app = piano_pi.startup(web_port=None, install_signals=False)
+        self.record("boot_to_ready", time.monotonic() - t0, "s")
+        with open(config.BOOT_TRACE_FILE) as f:
+            trace = json.load(f)
+        if trace["playable"] is not None:
+            self.record("boot_to_playable", trace["playable"] - trace["pipeline_start"], "s")
+        self.piano_pi = piano_pi
+        if not piano_pi.synth.is_running:
+            raise RuntimeError("synth did not start against the stub")
+
+    def restart(self):
+        import config
+
+        synth, samples = self.piano_pi.synth, []
+        for _ in range(max(1, self.iterations // 10)):
+            t0 = time.monotonic()
+            self.piano_pi.controller.restart().result()
+            samples.append(time.monotonic() - t0)
+        self.record("restart_cold", statistics.median(samples), "s", n=len(samples))
+
+        config.FLUIDSYNTH_STANDBY = True
+        samples = []
+        for _ in range(max(1, self.iterations // 10)):
+            synth.ensure_standby()
+            if not wait_for(lambda: synth.standby_ready, timeout=15):
+                log.warning("standby never became ready — skipping failover bench")
+                break
+            t0 = time.monotonic()
+            self.piano_pi.controller.restart().result()
+            samples.append(time.monotonic() - t0)
+        config.FLUIDSYNTH_STANDBY = False
+        synth.ensure_standby()
+        if samples:
+            self.record("restart_standby", statistics.median(samples), "s", n=len(samples))
+
+    def button_latency(self):
+        """Release of the Next button -> last `select` logged by the stub."""
+        import config
+
+        buttons = self.piano_pi.buttons
+        expected = len(config.MIDI_CHANNELS)
+        samples = []
+        for _ in range(self.iterations):
+            time.sleep(config.DEBOUNCE_SECONDS * 2)
+            if self.mock_pins:
+                buttons.btn_next.pin.drive_low()
+                time.sleep(config.DEBOUNCE_SECONDS * 2)
+                t0 = time.monotonic()
+                buttons.btn_next.pin.drive_high()
+            else:
+                buttons._btn2_press_time = time.monotonic()
+                t0 = time.monotonic()
+                buttons._on_btn2_released()
+
+            selects = wait_for(lambda: len(log_entries_after(
+                self.env["BENCH_FLUID_LOG"], t0, "select")) >= expected and
+                log_entries_after(self.env["BENCH_FLUID_LOG"], t0, "select"))
+            if selects:
+                samples.append(max(selects) - t0)
+        if samples:
+            self.record_latency("button_to_select", samples)
+
+    def web_latency(self):
+        try:
+            client = self.app.test_client()
+        except AttributeError:
+            log.info("Flask not installed — skipping web round trip")
+            return
+        count = len(self.piano_pi.synth.instruments)
+        samples = []
+        for i in range(self.iterations):
+            t0 = time.perf_counter()
+            resp = client.post(f"/api/instrument/{i % count}")
+            samples.append(time.perf_counter() - t0)
+            if resp.status_code != 200:
+                raise RuntimeError(f"web select failed: {resp.status_code}")
+        self.record_latency("web_select_roundtrip", samples)
+
+        samples = []
+        for _ in range(self.iterations):
+            t0 = time.perf_counter()
+            client.get("/api/state")
+            samples.append(time.perf_counter() - t0)
+        self.record_latency("web_state", samples)
+
+    def hotplug_latency(self):
+        """Announce a new controller -> `aconnect` routing it to FluidSynth."""
+        import alsa_seq
+
+        samples = []
+        for i in range(max(1, self.iterations // 5)):
+            cid = fakeseq.add_client(f"Bench Keyboard {i}", [("MIDI 1", "R-e-")])
+            t0 = time.monotonic()
+            self.sequencer.push(alsa_seq.CLIENT_START, cid)
+            self.sequencer.push(alsa_seq.PORT_START, cid, 0)
+            hits = wait_for(lambda: [t for t, line in fakeseq.read_log(self.env["BENCH_ACONNECT_LOG"])
+                                     if t >= t0 and line.startswith(f"{cid}:0 ")])
+            if hits:
+                samples.append(hits[0] - t0)
+            fakeseq.remove_client(cid)
+            self.sequencer.push(alsa_seq.CLIENT_EXIT, cid)
+            time.sleep(0.1)
+        if samples:
+            self.record_latency("hotplug_to_connect", samples)
+
+    def poll_cost(self):
+        """Steady-state cost of one MIDI poll, scaled to an hour."""
+        import topology
+        from midi_monitor import MidiMonitor
+
+        polls_per_hour = 3600.0 / self.poll_interval
+        proc_path = topology.PROC_CLIENTS
+        for mode, path in (("proc", proc_path), ("aconnect", "/nonexistent/clients")):
+            topology.PROC_CLIENTS = path
+            monitor = MidiMonitor(synth_ident=lambda: self.piano_pi.synth.seq_ident)
+            monitor._poll_once()
+
+            forks_before = len(fakeseq.read_log(self.env["BENCH_ACONNECT_LOG"]))
+            cpu_before = cpu_seconds()
+            for _ in range(self.iterations):
+                monitor._poll_once()
+            cpu = cpu_seconds() - cpu_before
+            forks = len(fakeseq.read_log(self.env["BENCH_ACONNECT_LOG"])) - forks_before
+
+            self.record(f"poll_cpu_per_hour_{mode}", cpu / self.iterations * polls_per_hour,
+                        "cpu-s")
+            self.record(f"poll_forks_per_hour_{mode}", forks / self.iterations * polls_per_hour,
+                        "forks")
+        topology.PROC_CLIENTS = proc_path
+
+    def crash_recovery(self):
+        """SIGKILL of the active FluidSynth -> a new one playing (includes backoff)."""
+        synth, supervisor = self.piano_pi.synth, self.piano_pi.supervisor
+        detect, recover = [], []
+        for _ in range(max(1, self.iterations // 10)):
+            supervisor.reset()
+            pid = synth.pid
+            t0 = time.monotonic()
+            os.kill(pid, signal.SIGKILL)
+            if not wait_for(lambda: supervisor.crashes and supervisor.crashes[-1].signal,
+                            timeout=5, interval=0.0005):
+                log.warning("crash not detected — skipping crash bench")
+                return
+            detect.append(time.monotonic() - t0)
+            if not wait_for(lambda: synth.is_running and synth.pid != pid
+                            and not self.piano_pi.controller.restart_pending, timeout=15):
+                log.warning("no recovery after crash — skipping crash bench")
+                return
+            recover.append(time.monotonic() - t0)
+            supervisor.crashes.clear()
+        self.record_latency("crash_detect", detect)
+        self.record("crash_to_playing", statistics.median(recover), "s", n=len(recover))
+
+    def trace_overhead(self):
+        """Cost of one tracing.span() around an empty block, off and on."""
+        import tracing
+
+        n = self.iterations * 2000
+        was = tracing.enabled()
+        for on in (False, True):
+            tracing.enable(on)
+            t0 = time.perf_counter_ns()
+            for _ in range(n):
+                with tracing.span("bench", "bench"):
+                    pass
+            self.record(f"trace_span_{'on' if on else 'off'}_ns",
+                        (time.perf_counter_ns() - t0) / n, "ns")
+        tracing.enable(was)
+        tracing.clear()
+
+    def capture_throughput(self):
+        """MIDI capture fed by a synthetic source: flat out, and at a dense-playing rate."""
+        from midi_capture import MidiCapture, SyntheticSource
+
+        def run(rate, count):
+            source = SyntheticSource(rate=rate, count=count)
+            capture = MidiCapture(source=source)
+            t0 = time.perf_counter()
+            capture.start()
+            source.done.wait(timeout=60)
+            elapsed = time.perf_counter() - t0
+            capture.stop()
+            ring = capture.ring
+            return capture, elapsed, 100 * ring.dropped / max(1, ring.pushed + ring.dropped)
+
+        capture, elapsed, dropped = run(0, self.iterations * 5000)
+        self.record("capture_events_per_s", capture.ring.pushed / elapsed, "ev/s", better="higher")
+        self.record("capture_drop_pct_flood", dropped, "%")
+        # 2000 events/s is far beyond two hands on a keyboard: nothing may be lost
+        capture, _, dropped = run(2000, self.iterations * 100)
+        self.record("capture_drop_pct_2k", dropped, "%")
+        if capture.written != capture.ring.pushed:
+            log.warning("capture wrote %d of %d events", capture.written, capture.ring.pushed)
+
+    def metronome_jitter(self):
+        """
+        Clicks queued ahead (error against the ideal beat grid, and how far
+        ahead of its time each was queued) vs a sleep() loop's wake-up
+        error, both while two busy threads compete for the GIL.
+        """
+        import alsa_seq
+        from metronome import Metronome
+        from scheduler import Scheduler
+
+        bpm = 300
+        beats = max(16, self.iterations * 2)
+        period = 60e9 / bpm
+        done = threading.Event()
+
+        def busy():     # stands in for the web server / MIDI threads
+            while not done.is_set():
+                sum(range(2000))
+
+        for _ in range(2):
+            threading.Thread(target=busy, daemon=True).start()
+        sequencer = alsa_seq.FakeQueueSequencer()
+        scheduler = Scheduler(sequencer)
+        scheduler.start()
+        metronome = Metronome(scheduler)
+        errors = []
+        try:
+            metronome.set(bpm=bpm, beats=4, unit=4, accents=[1, 1, 1, 1])
+            metronome.start()
+            origin = time.monotonic_ns()
+            for k in range(1, beats + 1):
+                due = origin + k * period
+                time.sleep(max(0.0, (due - time.monotonic_ns()) / 1e9))
+                errors.append((time.monotonic_ns() - due) / 1e9)
+            metronome.stop()
+        finally:
+            done.set()
+            scheduler.stop()
+
+        clicks = [(due, submitted) for due, message, _, submitted in sequencer.events
+                  if message[0] & 0xF0 == 0x90]
+        first = clicks[0][0]
+        grid = [abs(due - first - round(k * period)) for k, (due, _) in enumerate(clicks)]
+        self.record("metronome_grid_error_ns", max(grid), "ns", n=len(clicks))
+        self.record("metronome_min_lead_ms", min(due - sub for due, sub in clicks) / 1e6, "ms",
+                    better="higher")
+        self.record("metronome_late", scheduler.late, "events")
+        self.record_latency("sleep_click_error", errors)
+
+    def arp_timing(self):
+        """
+        Arpeggiator with four held keys (sixteenths at 150 bpm) while two
+        busy threads compete for the GIL: step error against the grid, how
+        far ahead steps were queued, and CPU time per generated note.
+        """
+        import alsa_seq
+        import smf
+        from arpeggiator import Arpeggiator
+        from scheduler import Scheduler
+
+        class Silence:      # no controller input; keys are fed directly
+            address = None
+
+            def read(self, timeout=None):
+                time.sleep(timeout or 0)
+
+            def close(self):
+                pass
+
+        keys = (60, 64, 67, 72)
+        done = threading.Event()
+
+        def busy():
+            while not done.is_set():
+                sum(range(2000))
+
+        for _ in range(2):
+            threading.Thread(target=busy, daemon=True).start()
+        sequencer = alsa_seq.FakeQueueSequencer()
+        scheduler = Scheduler(sequencer)
+        scheduler.start()
+        arp = Arpeggiator(scheduler, source=Silence())
+        try:
+            arp.set(pattern="up", bpm=150, rate=4, octaves=1, swing=0)
+            arp.enable()
+            start = time.monotonic_ns()
+            for key in keys:
+                arp.feed(start, smf.note_on(0, key, 100))
+            time.sleep(max(2.0, self.iterations * 0.2))
+            for key in keys:
+                arp.feed(time.monotonic_ns(), smf.note_off(0, key))
+            arp.disable()
+        finally:
+            done.set()
+            scheduler.stop()
+
+        steps = [(due, submitted) for due, message, _, submitted in sequencer.events
+                 if message[0] & 0xF0 == 0x90]
+        step_ns = 60e9 / 150 / 4
+        grid = [abs(due - start - round(k * step_ns)) for k, (due, _) in enumerate(steps)]
+        self.record("arp_grid_error_ns", max(grid), "ns", n=len(steps))
+        # The first step is due on the key press itself, so it's skipped here
+        self.record("arp_min_lead_ms", min(due - sub for due, sub in steps[1:]) / 1e6, "ms",
+                    better="higher")
+
+        # CPU: generate a long run of steps on an idle scheduler
+        arp = Arpeggiator(Scheduler(alsa_seq.FakeQueueSequencer()), source=Silence())
+        arp.enabled = True
+        for key in keys:
+            arp.feed(0, smf.note_on(0, key, 100))
+        notes, horizon = 0, 0
+        t0 = time.thread_time_ns()
+        for _ in range(self.iterations * 500):
+            horizon += 50_000_000
+            notes += len(arp.events_until(horizon)) // 2
+        self.record("arp_cpu_us_per_note", (time.thread_time_ns() - t0) / notes / 1000, "µs",
+                    n=notes)
+
+    def player_streaming(self):
+        """
+        A 16-track file with ~500k events: load + play -> first event queued,
+        and the Python heap peak while streaming all of it.
+        """
+        import tracemalloc
+
+        import alsa_seq
+        import config
+        import smf
+        from player import Player
+        from scheduler import Scheduler
+
+        directory = config.PLAYER_DIR
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, "large.mid")
+        tracks = [[(0, smf.tempo_event(400_000))]]
+        for ch in range(15):
+            events = []
+            for i in range(16_000):
+                events.append((i * 60, smf.note_on(ch, 36 + i % 48, 90)))
+                events.append((i * 60 + 50, smf.note_off(ch, 36 + i % 48)))
+            tracks.append(events)
+        smf.write(path, tracks)
+        del tracks, events
+        size_mb = os.path.getsize(path) / 1e6
+
+        sequencer = alsa_seq.FakeQueueSequencer()
+        scheduler = Scheduler(sequencer)
+        scheduler.start()
+        player = Player(scheduler)
+        try:
+            t0 = time.perf_counter()
+            player.load("large.mid")
+            player.play()
+            wait_for(lambda: sequencer.events, timeout=5, interval=0.0002)
+            self.record("player_first_event_ms", (time.perf_counter() - t0) * 1000, "ms",
+                        file_mb=round(size_mb, 1))
+            player.stop()
+        finally:
+            scheduler.stop()
+
+        # Stream the whole file one lookahead window at a time, as fast as
+        # the decoder goes (no scheduler thread)
+        player = Player(Scheduler(alsa_seq.FakeQueueSequencer()))
+        player.load("large.mid")
+        tracemalloc.start()
+        player.play()
+        base = tracemalloc.get_traced_memory()[0]
+        events, horizon = 0, time.monotonic_ns()
+        while player.playing:
+            horizon += int(config.SCHEDULE_LOOKAHEAD * 1e9)
+            events += len(player.events_until(horizon))
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        self.record("player_stream_peak_kb", (peak - base) / 1024, "KiB", n=events,
+                    file_mb=round(size_mb, 1))
+        os.remove(path)
+
+    def config_reload(self):
+        """
+        A copy of config.py reloaded with MIDI_CHANNELS switching between two
+        lists: time to apply, and FluidSynth must keep running throughout.
+        """
+        import config
+        from config_reload import ConfigReloader
+
+        piano_pi = self.piano_pi
+        channels = list(config.MIDI_CHANNELS)
+        path = os.path.join(os.path.dirname(config.BOOT_TRACE_FILE), "config.py")
+        with open(config.__file__) as f:
+            source = f.read() + (f"\nSOUNDFONT_PATH = {config.SOUNDFONT_PATH!r}"
+                                 f"\nSOUNDFONT_FALLBACK = {config.SOUNDFONT_FALLBACK!r}\n")
+        with open(path, "w") as f:
+            f.write(source)
+        reloader = ConfigReloader(on_apply=piano_pi.apply_config, path=path)
+
+        pid, restarts, samples = piano_pi.synth.pid, 0, []
+        for i in range(self.iterations):
+            with open(path, "w") as f:
+                f.write(source + f"MIDI_CHANNELS = {channels + [15] if i % 2 == 0 else channels}\n")
+            t0 = time.perf_counter()
+            report = reloader.reload()
+            samples.append(time.perf_counter() - t0)
+            if report["status"] != "applied" or report.get("synth_restart"):
+                log.warning("config reload: %s", report)
+            if piano_pi.synth.pid != pid:
+                restarts += 1
+                pid = piano_pi.synth.pid
+        self.record_latency("config_reload_live", samples)
+        self.record("config_reload_restarts", restarts, "restarts", n=len(samples))
+        config.MIDI_CHANNELS = channels
+
+    def soundfont_swap(self):
+        """Switch the primary soundfont back and forth; FluidSynth must keep running."""
+        import config
+
+        synth = self.piano_pi.synth
+        original = config.SOUNDFONT_PATH
+        other = os.path.join(os.path.dirname(original), "bench-gm.sf2")
+        write_soundfont(other)
+        pid, samples, failed = synth.pid, [], 0
+        for i in range(self.iterations):
+            t0 = time.perf_counter()
+            ok = self.piano_pi.controller.call(
+                synth.switch_soundfont, other if i % 2 == 0 else original).result()
+            samples.append(time.perf_counter() - t0)
+            failed += not ok
+        if synth.pid != pid or failed:
+            log.warning("soundfont swap: %d failed, pid %s -> %s", failed, pid, synth.pid)
+        if synth.soundfonts != [config.SOUNDFONT_PATH]:
+            log.warning("soundfont swap left %s loaded", synth.soundfonts)
+        self.record_latency("soundfont_swap", samples)
+        if config.SOUNDFONT_PATH != original:
+            self.piano_pi.controller.call(synth.switch_soundfont, original).result()
+
+    def run(self):
+        try:
+            self.boot()
+            self.button_latency()
+            self.web_latency()
+            self.hotplug_latency()
+            self.poll_cost()
+            self.restart()
+            self.crash_recovery()
+            self.trace_overhead()
+            self.capture_throughput()
+            self.metronome_jitter()
+            self.arp_timing()
+            self.player_streaming()
+            self.config_reload()
+            self.soundfont_swap()
+        finally:
+            if getattr(self, "piano_pi", None):
+                self.piano_pi.cleanup()
+        return self.results
+
+
+def git_commit() -> str | None:
+    try:
+        out = subprocess.run(["git", "-C", REPO_DIR, "rev-parse", "--short", "HEAD"],
+                             capture_output=True, text=True, timeout=5)
+        dirty = subprocess.run(["git", "-C", REPO_DIR, "status", "--porcelain", "-uno"],
+                               capture_output=True, text=True, timeout=5)
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    return out.stdout.strip() + ("-dirty" if dirty.stdout.strip() else "") or None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("-o", "--output", help="write results JSON here (default: stdout)")
+    parser.add_argument("-n", "--iterations", type=int, default=50)
+    parser.add_argument("--load-seconds", type=float, default=0.2,
+                        help="simulated soundfont load time of the stub fluidsynth")
+    parser.add_argument("-v", "--verbose", action="store_true")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING,
+                        format="%(asctime)s [%(name)s] %(levelname)s: %(message)s")
+    log.setLevel(logging.INFO)
+
+    import config
+    poll_interval = config.MIDI_POLL_INTERVAL
+
+    with tempfile.TemporaryDirectory(prefix="piano-pi-bench-") as workdir:
+        env, sequencer, mock_pins = setup(workdir, args.load_seconds)
+        results = Bench(env, sequencer, mock_pins, args.iterations, poll_interval).run()
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "date": datetime.datetime.now().isoformat(timespec="seconds"),
+            "host": platform.node(),
+            "machine": platform.machine(),
+            "python": platform.python_version(),
+            "iterations": args.iterations,
+            "stub_load_seconds": args.load_seconds,
+            "mock_pins": mock_pins,
+        },
+        "results": results,
+    }
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
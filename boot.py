@@ -0,0 +1,174 @@
+"""
+Piano Pi Brain — Boot Pipeline
+
+Startup as a small dependency graph instead of one long sequence: every
+phase runs on its own thread as soon as the phases it depends on have
+finished, so the web portal, GPIO and MIDI discovery come up while the
+soundfont is still loading (that happens in the fluidsynth process, so
+it doesn't compete for the GIL).
+
+Every phase is timed, and the trace is written to BOOT_TRACE_FILE and
+shown in /api/state. Times are seconds since kernel boot
+(CLOCK_BOOTTIME), so after a power cycle the trace shows the whole way
+from power-on to the first playable note:
+
+  {"process_start": 9.8,                  # kernel + systemd until we ran
+   "pipeline_start": 11.2,                # ... plus interpreter and imports
+   "phases": {"synth": {"after": [], "start": 11.2, "end": 14.9,
+                        "seconds": 3.7, "ok": true, "error": null}, ...},
+   "playable": 15.0,                      # the `playable_after` phases finished
+   "critical_path": ["synth", "midi_connect"]}
+"""
+
+import datetime
+import json
+import logging
+import os
+import threading
+import time
+
+import procfs
+
+log = logging.getLogger(__name__)
+
+
+def since_boot() -> float:
+    return time.clock_gettime(time.CLOCK_BOOTTIME)
+
+
+class _Phase:
+    def __init__(self, name: str, fn, after: tuple[str, ...]):
+        self.name = name
+        self.fn = fn
+        self.after = after
+        self.done = threading.Event()
+        self.start: float | None = None
+        self.end: float | None = None
+        self.ok = False
+        self.error: str | None = None
+
+
+class BootPipeline:
+    """Runs named phases in dependency order, in parallel where possible."""
+
+    def __init__(self, playable_after=(), on_phase=None):
+        """
+        Args:
+            playable_after: Phases that must be done before a key press makes sound
+            on_phase: Callback(name, trace) after each phase finishes
+        """
+        self._phases: dict[str, _Phase] = {}
+        self._on_phase = on_phase
+        self.process_start = procfs.process_start_seconds(os.getpid())
+        self.pipeline_start: float | None = None
+        self.playable_after = tuple(playable_after)
+
+    def add(self, name: str, fn, after=()):
+        """Add phase `name` running fn(); it starts once all `after` phases are done."""
+        for dep in after:
+            if dep not in self._phases:
+                raise ValueError(f"phase {name!r} depends on unknown phase {dep!r}")
+        self._phases[name] = _Phase(name, fn, tuple(after))
+
+    def run(self) -> dict:
+        """Run every phase; returns the trace once all have finished."""
+        self.pipeline_start = since_boot()
+        threads = [
+            threading.Thread(target=self._run_phase, args=(phase,),
+                             name=f"boot-{phase.name}", daemon=True)
+            for phase in self._phases.values()
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        trace = self.trace()
+        slowest = max(self._phases.values(), key=lambda p: p.end or 0)
+        log.info("Boot pipeline done in %.2fs (critical path: %s)",
+                 slowest.end - self.pipeline_start, " → ".join(trace["critical_path"]))
+        return trace
+
+    def _run_phase(self, phase: _Phase):
+        deps = [self._phases[dep] for dep in phase.after]
+        for dep in deps:
+            dep.done.wait()
+
+        phase.start = since_boot()
+        failed = [dep.name for dep in deps if not dep.ok]
+        if failed:
+            phase.error = f"skipped: {', '.join(failed)} failed"
+        else:
+            try:
+                result = phase.fn()
+                phase.ok = result is not False
+                if not phase.ok:
+                    phase.error = "failed"
+            except Exception as e:
+                log.error("Boot phase %s failed: %s", phase.name, e)
+                phase.error = str(e)
+        phase.end = since_boot()
+        log.info("Boot phase %-14s %6.0f ms%s", phase.name, (phase.end - phase.start) * 1000,
+                 "" if phase.ok else f" ({phase.error})")
+        phase.done.set()
+
+        if self._on_phase:
+            try:
+                self._on_phase(phase.name, self.trace())
+            except Exception as e:
+                log.error("Boot progress callback failed: %s", e)
+
+    # --- Trace -----------------------------------------------------------------
+
+    def trace(self) -> dict:
+        phases = {
+            p.name: {
+                "after": list(p.after),
+                "start": _round(p.start),
+                "end": _round(p.end),
+                "seconds": _round(p.end - p.start) if p.end is not None else None,
+                "ok": p.ok,
+                "error": p.error,
+            }
+            for p in self._phases.values()
+        }
+        playable = None
+        if self.playable_after and all(self._phases[n].ok for n in self.playable_after):
+            playable = max(self._phases[n].end for n in self.playable_after)
+        return {
+            "time": datetime.datetime.now().isoformat(timespec="seconds"),
+            "process_start": _round(self.process_start),
+            "pipeline_start": _round(self.pipeline_start),
+            "phases": phases,
+            "playable": _round(playable),
+            "critical_path": self.critical_path(),
+        }
+
+    def critical_path(self) -> list[str]:
+        """The chain of phases that decided when the last one finished."""
+        finished = [p for p in self._phases.values() if p.end is not None]
+        if not finished:
+            return []
+        phase, path = max(finished, key=lambda p: p.end), []
+        while phase is not None:
+            path.append(phase.name)
+            deps = [self._phases[d] for d in phase.after if self._phases[d].end is not None]
+            phase = max(deps, key=lambda p: p.end) if deps else None
+        return path[::-1]
+
+
+def _round(value: float | None) -> float | None:
+    return round(value, 4) if value is not None else None
+
+
+def write_trace(trace: dict, path: str) -> bool:
+    """Save the trace (atomically, it is read by tools after a reboot)."""
+    try:
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(trace, f, indent=2)
+        os.replace(tmp, path)
+        return True
+    except OSError as e:
+        log.warning("Could not write boot trace to %s: %s", path, e)
+        return False
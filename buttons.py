@@ -3,8 +3,13 @@ Piano Pi Brain — Button Handler
 
 Manages 3 breadboard buttons via gpiozero:
   - Button 1: Short press = restart synth, Long press (3s) = safe shutdown
-  - Button 2: Next instrument
-  - Button 3: Previous instrument
+  - Button 2: Next instrument, hold = reset to core piano
+  - Button 3: Previous instrument, hold = metronome on/off,
+    longer hold = arpeggiator on/off
+
+While the metronome runs, piano_pi.py turns Next/Prev into tempo up/down
+and holding Next into the next time signature; while the arpeggiator is
+on, Next/Prev pick its pattern.
 """
 
 import logging
@@ -18,6 +23,7 @@ except ImportError:
     Button = None
 
 import config
+import tracing
 
 log = logging.getLogger(__name__)
 
@@ -27,22 +33,27 @@ class ButtonHandler:
 
     def __init__(self, on_restart=None, on_shutdown=None,
                  on_next_instrument=None, on_prev_instrument=None,
-                 on_reset_instrument=None):
+                 on_reset_instrument=None, on_metronome=None, on_arp=None):
         """
         Args:
             on_restart: Callback when short-press on button 1
             on_shutdown: Callback when long-press on button 1
             on_next_instrument: Callback when short-press on button 2
             on_reset_instrument: Callback when hold button 2 (reset to core piano)
-            on_prev_instrument: Callback when button 3 pressed
+            on_prev_instrument: Callback when short-press on button 3
+            on_metronome: Callback when hold button 3 (metronome on/off)
+            on_arp: Callback when hold button 3 longer (arpeggiator on/off)
         """
         self._on_restart = on_restart
         self._on_shutdown = on_shutdown
         self._on_next = on_next_instrument
         self._on_prev = on_prev_instrument
         self._on_reset = on_reset_instrument
+        self._on_metronome = on_metronome
+        self._on_arp = on_arp
         self._btn1_press_time = None
         self._btn2_press_time = None
+        self._btn3_press_time = None
 
         if Button is None:
             log.warning("gpiozero not available — buttons disabled (dev mode)")
@@ -69,21 +80,30 @@ class ButtonHandler:
         self.btn_next.when_pressed = self._on_btn2_pressed
         self.btn_next.when_released = self._on_btn2_released
 
-        # Button 3: previous instrument
+        # Button 3: previous instrument / hold for the metronome
         self.btn_prev = Button(
             config.BUTTON_PREV_INST,
             pull_up=True,
             bounce_time=config.DEBOUNCE_SECONDS,
         )
         self.btn_prev.when_pressed = self._on_btn3_pressed
+        self.btn_prev.when_released = self._on_btn3_released
 
         log.info("Buttons initialized (pins %d, %d, %d)",
                  config.BUTTON_RESTART, config.BUTTON_NEXT_INST, config.BUTTON_PREV_INST)
 
+    def set_debounce(self, seconds: float | None):
+        """Apply a reloaded DEBOUNCE_SECONDS to the buttons."""
+        if not self._enabled:
+            return
+        for btn in (self.btn_restart, self.btn_next, self.btn_prev):
+            btn.pin.bounce = seconds
+
     def _on_btn1_pressed(self):
         """Record when button 1 was pressed."""
         self._btn1_press_time = time.monotonic()
 
+    @tracing.traced("button1.release", "button")
     def _on_btn1_released(self):
         """On release, decide short press vs long press."""
         if self._btn1_press_time is None:
@@ -105,6 +125,7 @@ class ButtonHandler:
         """Record when button 2 was pressed."""
         self._btn2_press_time = time.monotonic()
 
+    @tracing.traced("button2.release", "button")
     def _on_btn2_released(self):
         """Short press = next instrument, hold = reset to core piano."""
         if self._btn2_press_time is None:
@@ -123,10 +144,30 @@ class ButtonHandler:
                 self._on_next()
 
     def _on_btn3_pressed(self):
-        """Button 3 pressed -> previous instrument."""
-        log.info("Button 3: previous instrument")
-        if self._on_prev:
-            self._on_prev()
+        """Record when button 3 was pressed."""
+        self._btn3_press_time = time.monotonic()
+
+    @tracing.traced("button3.release", "button")
+    def _on_btn3_released(self):
+        """Short press = previous instrument, hold = metronome, longer hold = arpeggiator."""
+        if self._btn3_press_time is None:
+            return
+
+        held = time.monotonic() - self._btn3_press_time
+        self._btn3_press_time = None
+
+        if held >= config.ARP_HOLD_SECONDS:
+            log.info("Button 3: LONG hold (%.1fs) -> arpeggiator on/off", held)
+            if self._on_arp:
+                self._on_arp()
+        elif held >= config.METRONOME_HOLD_SECONDS:
+            log.info("Button 3: HOLD (%.1fs) -> metronome on/off", held)
+            if self._on_metronome:
+                self._on_metronome()
+        else:
+            log.info("Button 3: press -> previous instrument")
+            if self._on_prev:
+                self._on_prev()
 
     def cleanup(self):
         """Release GPIO resources."""
@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+"""
+Piano Pi Brain — FluidSynth Calibration
+
+Finds FLUIDSYNTH_CMD settings for the soundfont(s) actually loaded and
+the board it runs on, instead of tuning by ear. A dense, repeatable MIDI
+workload (sustained chords plus fast runs on every MIDI_CHANNELS channel,
+using the configured instruments) is rendered offline with the file
+audio driver for each combination of period size (-z), synth.polyphony
+and synth.cpu-cores. Each render reports:
+
+  - real-time factor (render wall time / workload length; < 1 = faster
+    than real time)
+  - peak RSS of the fluidsynth process
+  - utilisation of every CPU core while it ran
+
+The proposal is the lowest-latency period size, then the highest
+polyphony, that renders within CALIBRATION_MAX_RTF, keeps at least
+CALIBRATION_MIN_POLYPHONY voices and fits in memory. The periods count (-c) only matters for a live audio device, so it is
+kept from FLUIDSYNTH_CMD and only used to compute latency.
+
+Usage:
+    sudo systemctl stop piano-pi    # keep the CPU to ourselves
+    python3 calibrate.py            # sweep and print the proposal
+    python3 calibrate.py --write    # ... and save it to FLUIDSYNTH_TUNING_FILE
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+import config
+import procfs
+import smf
+import tuning
+from synth import FluidSynthManager
+from synth_backend import apply_settings, cli_settings
+
+log = logging.getLogger("calibrate")
+
+# Live-only options dropped from FLUIDSYNTH_CMD for the offline render
+_LIVE_FLAGS = {"-a": 1, "-m": 1, "-s": 0, "-i": 0, "-n": 0}
+
+
+# ---------------------------------------------------------------------------
+# Workload
+# ---------------------------------------------------------------------------
+
+def write_workload(path: str, programs: list[int], channels: list[int],
+                   seconds: float, seed: int = 1):
+    """
+    Write the calibration piece: on each channel a four-note chord every
+    eighth note and a sixteenth-note run, all under the sustain pedal,
+    which is released every two bars. Voice counts climb well past 128,
+    so polyphony limits are actually exercised.
+    """
+    rng = random.Random(seed)
+    beat = smf.DEFAULT_DIVISION
+    end = smf.ticks(seconds)
+    events = [(0, smf.tempo_event())]
+
+    for i, ch in enumerate(channels):
+        events.append((0, smf.program_change(ch, programs[i % len(programs)])))
+        events.append((0, smf.control_change(ch, 64, 127)))
+
+        for bar in range(0, end, beat * 8):
+            # Pedal up/down at the start of every second bar drops the tail
+            events.append((bar, smf.control_change(ch, 64, 0)))
+            events.append((bar + 1, smf.control_change(ch, 64, 127)))
+
+        for tick in range(0, end, beat // 2):
+            root = rng.randrange(36, 60)
+            for note in (root, root + 4, root + 7, root + 12):
+                events.append((tick, smf.note_on(ch, note, rng.randrange(60, 110))))
+                events.append((min(tick + beat * 2, end), smf.note_off(ch, note)))
+
+        for tick in range(0, end, beat // 4):
+            note = rng.randrange(60, 96)
+            events.append((tick, smf.note_on(ch, note, rng.randrange(50, 100))))
+            events.append((min(tick + beat // 4, end), smf.note_off(ch, note)))
+
+    smf.write(path, [events])
+
+
+# ---------------------------------------------------------------------------
+# Rendering
+# ---------------------------------------------------------------------------
+
+def render_cmd(soundfonts: list[str], midi_path: str, settings: dict) -> list[str]:
+    """Offline fluidsynth command for FLUIDSYNTH_CMD with `settings` applied."""
+    cmd, args = [], iter(config.FLUIDSYNTH_CMD)
+    for arg in args:
+        if arg in _LIVE_FLAGS:
+            for _ in range(_LIVE_FLAGS[arg]):
+                next(args, None)
+        else:
+            cmd.append(arg)
+    cmd = apply_settings(cmd, settings)
+    return cmd + ["-n", "-i", "-q", "-F", os.devnull, "-T", "raw", *soundfonts, midi_path]
+
+
+def render(cmd: list[str], seconds: float) -> dict:
+    """Run one offline render; returns its measurements (ok=False on failure)."""
+    cores_before = procfs.cpu_times()
+    started = time.monotonic()
+    # stderr goes to a file: a pipe nobody reads until exit would fill up
+    # with sample warnings and block the render
+    with tempfile.TemporaryFile() as errors:
+        try:
+            proc = subprocess.Popen(cmd, stdin=subprocess.DEVNULL,
+                                    stdout=subprocess.DEVNULL, stderr=errors)
+        except OSError as e:
+            return {"ok": False, "error": str(e)}
+
+        # wait4 instead of wait() for the child's own peak RSS (ru_maxrss, KiB)
+        _, status, usage = os.wait4(proc.pid, 0)
+        proc.returncode = os.waitstatus_to_exitcode(status)
+        wall = time.monotonic() - started
+        cores = procfs.core_utilisation(cores_before, procfs.cpu_times())
+        errors.seek(0)
+        stderr = errors.read().decode(errors="replace").strip()
+
+    return {
+        "ok": proc.returncode == 0,
+        "error": stderr.splitlines()[-1] if proc.returncode and stderr else None,
+        "wall_seconds": round(wall, 3),
+        "rtf": round(wall / seconds, 4),
+        "cpu_seconds": round(usage.ru_utime + usage.ru_stime, 3),
+        "peak_rss_bytes": usage.ru_maxrss * 1024,
+        "core_utilisation": [round(u, 3) for u in cores],
+    }
+
+
+def latency_ms(settings: dict) -> float:
+    """Output buffer latency of the live audio driver with these settings."""
+    live = {**cli_settings(config.FLUIDSYNTH_CMD), **settings}
+    rate = float(live.get("synth.sample-rate") or 44100)
+    periods = int(live.get("audio.periods") or 2)
+    return int(live["audio.period-size"]) * periods / rate * 1000
+
+
+def sweep(soundfonts: list[str], midi_path: str, seconds: float,
+          period_sizes, polyphony, cpu_cores) -> list[dict]:
+    results = []
+    total = len(period_sizes) * len(polyphony) * len(cpu_cores)
+    for period in period_sizes:
+        for voices in polyphony:
+            for cores in cpu_cores:
+                settings = {
+                    "audio.period-size": period,
+                    "synth.polyphony": voices,
+                    "synth.cpu-cores": cores,
+                }
+                m = render(render_cmd(soundfonts, midi_path, settings), seconds)
+                results.append({"settings": settings, "latency_ms": round(latency_ms(settings), 2), **m})
+                log.info("[%d/%d] -z %-4d poly %-4d cores %d: %s", len(results), total,
+                         period, voices, cores,
+                         f"RTF {m['rtf']:.3f}, RSS {m['peak_rss_bytes'] // 2**20} MB"
+                         if m["ok"] else f"FAILED {m.get('error')}")
+    return results
+
+
+def choose(results: list[dict], mem_available: int | None) -> dict | None:
+    """
+    Fastest safe result: renders within CALIBRATION_MAX_RTF, meets the
+    latency and polyphony limits and leaves STANDBY_MIN_FREE_MB free.
+    Prefers the smallest period size, then the most polyphony, then the
+    lowest RTF.
+    """
+    safe = [
+        r for r in results
+        if r["ok"]
+        and r["rtf"] <= config.CALIBRATION_MAX_RTF
+        and r["latency_ms"] <= config.CALIBRATION_MAX_LATENCY_MS
+        and r["settings"]["synth.polyphony"] >= config.CALIBRATION_MIN_POLYPHONY
+        and (mem_available is None
+             or r["peak_rss_bytes"] + config.STANDBY_MIN_FREE_MB * 2**20 <= mem_available)
+    ]
+    if not safe:
+        return None
+    return min(safe, key=lambda r: (r["settings"]["audio.period-size"],
+                                    -r["settings"]["synth.polyphony"], r["rtf"]))
+
+
+# ---------------------------------------------------------------------------
+# CLI
+# ---------------------------------------------------------------------------
+
+def _int_list(text: str) -> list[int]:
+    return [int(v) for v in text.split(",") if v]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Calibrate FluidSynth settings offline")
+    parser.add_argument("--soundfont", action="append",
+                        help="soundfont(s) to calibrate (default: those the instrument list loads)")
+    parser.add_argument("--seconds", type=float, default=config.CALIBRATION_SECONDS)
+    parser.add_argument("--period-sizes", type=_int_list, default=config.CALIBRATION_PERIOD_SIZES)
+    parser.add_argument("--polyphony", type=_int_list, default=config.CALIBRATION_POLYPHONY)
+    parser.add_argument("--cpu-cores", type=_int_list,
+                        default=config.CALIBRATION_CPU_CORES or list(range(1, (os.cpu_count() or 1) + 1)))
+    parser.add_argument("--write", action="store_true",
+                        help=f"save the proposal to {config.FLUIDSYNTH_TUNING_FILE}")
+    parser.add_argument("--json", help="also write every measurement to this file")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO,
+                        format="%(asctime)s [%(name)s] %(levelname)s: %(message)s",
+                        datefmt="%H:%M:%S")
+
+    manager = FluidSynthManager()
+    soundfonts = args.soundfont or manager._plan_soundfonts()
+    if not soundfonts:
+        log.error("No soundfont to calibrate")
+        sys.exit(1)
+    programs = [inst["program"] for inst in manager.instruments] or [0]
+
+    mem_available = procfs.mem_available()
+    with tempfile.TemporaryDirectory(prefix="piano-pi-calibrate-") as tmp:
+        midi_path = os.path.join(tmp, "workload.mid")
+        write_workload(midi_path, programs, config.MIDI_CHANNELS, args.seconds)
+        log.info("Calibrating %s on %s (%d CPUs), %.0fs workload",
+                 ", ".join(map(os.path.basename, soundfonts)),
+                 procfs.device_model(), os.cpu_count(), args.seconds)
+        results = sweep(soundfonts, midi_path, args.seconds,
+                        args.period_sizes, args.polyphony, args.cpu_cores)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"soundfonts": soundfonts, "device": tuning.device_key(),
+                       "results": results}, f, indent=2)
+
+    best = choose(results, mem_available)
+    if best is None:
+        log.error("No setting rendered within %.2fx real time — keeping FLUIDSYNTH_CMD",
+                  config.CALIBRATION_MAX_RTF)
+        sys.exit(1)
+
+    log.info("Proposed: %s (RTF %.3f, latency %.1f ms, peak RSS %d MB)",
+             best["settings"], best["rtf"], best["latency_ms"], best["peak_rss_bytes"] // 2**20)
+    log.info("FLUIDSYNTH_CMD = %s", apply_settings(config.FLUIDSYNTH_CMD, best["settings"]))
+
+    if args.write:
+        measured = {k: best[k] for k in ("rtf", "latency_ms", "peak_rss_bytes", "core_utilisation")}
+        tuning.save(soundfonts, best["settings"], measured)
+
+
+if __name__ == "__main__":
+    main()
@@ -11,7 +11,7 @@ Edit this file to match your wiring and preferences.
 
 BUTTON_RESTART = 17     # Short press = restart synth, Long press = shutdown
 BUTTON_NEXT_INST = 27   # Next instrument (hold = reset to core piano)
-BUTTON_PREV_INST = 22   # Previous instrument
+BUTTON_PREV_INST = 22   # Previous instrument (hold = metronome, longer = arpeggiator)
 
 LED_RED = 24            # Single status LED (solid=ready, blink=shutting down)
 
@@ -27,9 +27,39 @@ DEBOUNCE_SECONDS = 0.05
 # FluidSynth Settings (tuned for Raspberry Pi 3)
 # ---------------------------------------------------------------------------
 
+# "subprocess" = run the fluidsynth CLI and control it over its shell;
+# "libfluidsynth" = load libfluidsynth in-process (direct C calls, no IPC).
+# Both take their settings from FLUIDSYNTH_CMD below.
+SYNTH_BACKEND = "subprocess"
+
 SOUNDFONT_PATH = "/home/pi/piano-pi-brain/soundfonts/SalamanderGrandPiano.sf2"
 SOUNDFONT_FALLBACK = "/usr/share/sounds/sf2/FluidR3_GM.sf2"
 
+# More soundfonts to stack: instruments are looked up in SOUNDFONT_PATH,
+# then these, then the fallback (only fonts some instrument uses are
+# loaded). A font listed in SOUNDFONT_BANK_OFFSETS ({path: offset}) answers
+# MIDI bank selects at bank + offset, so a controller or backing track can
+# reach it without clashing with the others.
+SOUNDFONT_EXTRAS = []
+SOUNDFONT_BANK_OFFSETS = {}
+
+# Soundfonts change while FluidSynth runs (config reload, /api/soundfonts):
+# the new one is loaded before the old one is unloaded, so the sound never
+# stops. A load that would leave less than this much RAM available (the
+# Pi 3 has 1 GB and swapping stalls the audio) is refused.
+SOUNDFONT_MIN_FREE_MB = 100
+
+# How FluidSynth holds the sample data. "preload" reads every sample into
+# RAM at start (slow boot for a big piano, no disk reads while playing);
+# "dynamic" reads only the samples of the presets in use (fast boot, small
+# footprint, a short load when an instrument is first picked; FluidSynth
+# >= 2.0.7). "auto" preloads when the fonts' sample data (twice with
+# FLUIDSYNTH_STANDBY) fits the budget: MemAvailable minus
+# SOUNDFONT_MIN_FREE_MB, and at most SOUNDFONT_PRELOAD_BUDGET_MB if set.
+# Chosen when FluidSynth starts; the result is in /api/state.
+SOUNDFONT_LOADING = "auto"
+SOUNDFONT_PRELOAD_BUDGET_MB = None
+
 FLUIDSYNTH_CMD = [
     "fluidsynth",
     "-a", "alsa",
@@ -44,9 +74,78 @@ FLUIDSYNTH_CMD = [
     "-R0",
 ]
 
+# Calibrated overrides for the settings above. `python3 calibrate.py
+# --write` renders a dense workload offline across period sizes, polyphony
+# and cpu-cores and stores the fastest safe combination for the current
+# soundfont(s) and board here; it is applied at launch when
+# FLUIDSYNTH_AUTOTUNE is on and the soundfont files and board still match.
+FLUIDSYNTH_TUNING_FILE = "/home/pi/piano-pi-brain/tuning.json"
+FLUIDSYNTH_AUTOTUNE = True
+
+# Calibration sweep (calibrate.py). None for CPU cores = 1..cpu_count.
+CALIBRATION_PERIOD_SIZES = [64, 128, 256]
+CALIBRATION_POLYPHONY = [32, 64, 96, 128]
+CALIBRATION_CPU_CORES = None
+CALIBRATION_SECONDS = 20.0
+# "Safe" = renders at most this fraction of real time (headroom for the
+# audio driver, MIDI and the web server) ...
+CALIBRATION_MAX_RTF = 0.5
+# ... with output latency (period-size * periods / rate) no higher than this,
+# and at least this many voices (sustained piano chords steal below it)
+CALIBRATION_MAX_LATENCY_MS = 20.0
+CALIBRATION_MIN_POLYPHONY = 64
+
+# TCP command shell (`fluidsynth -s`) used for acknowledged commands and
+# state queries. 0 = disabled, commands go to stdin unacknowledged.
+FLUIDSYNTH_SHELL_PORT = 9800
+FLUIDSYNTH_SHELL_TIMEOUT = 2.0
+
+# Startup readiness probe: how long to wait for the soundfont to load
+# (the big Salamander SF2 on a cold SD card is slow), and how often to check
+FLUIDSYNTH_READY_TIMEOUT = 30.0
+FLUIDSYNTH_READY_POLL = 0.05
+
+# Hot standby: keep a second FluidSynth loaded with the same soundfont and
+# program, so a restart or crash just moves MIDI over to it. Costs RAM for
+# a second copy of the soundfont, some idle CPU, and needs an ALSA output
+# both processes can open (dmix). Only spawned while MemAvailable covers
+# the active instance's footprint plus STANDBY_MIN_FREE_MB.
+FLUIDSYNTH_STANDBY = False
+STANDBY_MIN_FREE_MB = 150
+
+# Restart sequence (restart.py): a failed phase is retried this many times,
+# waiting RESTART_BACKOFF seconds before the first retry, doubling each time
+RESTART_RETRIES = 3
+RESTART_BACKOFF = 1.0
+
+# Crash supervision (supervisor.py): restart a crashed FluidSynth after
+# BACKOFF_MIN seconds, doubling per consecutive crash up to BACKOFF_MAX;
+# an instance that ran STABLE_SECONDS resets the count. CRASH_LIMIT
+# crashes within CRASH_WINDOW seconds stop automatic restarts until a
+# manual restart (button or web).
+SUPERVISOR_BACKOFF_MIN = 0.5
+SUPERVISOR_BACKOFF_MAX = 30.0
+SUPERVISOR_STABLE_SECONDS = 60.0
+SUPERVISOR_CRASH_LIMIT = 5
+SUPERVISOR_CRASH_WINDOW = 120.0
+# Crashes kept for /api/supervisor, stderr lines kept per crash, and the
+# fallback check for a synth that isn't running at all
+SUPERVISOR_CRASH_HISTORY = 20
+SUPERVISOR_STDERR_LINES = 50
+SUPERVISOR_CHECK_INTERVAL = 5.0
+
+# The in-process backend has no process to exit: it counts as crashed once
+# its audio driver has rendered nothing for this long
+FLUIDSYNTH_STALL_SECONDS = 2.0
+
 # ---------------------------------------------------------------------------
 # Instruments (General MIDI program numbers)
 # Core 3 = hold Next button to reset to #1
+#
+# At startup each entry is checked against the presets actually in
+# SOUNDFONT_PATH / SOUNDFONT_EXTRAS / SOUNDFONT_FALLBACK and played from
+# the first font that has it (optional keys: "bank", default 0; "soundfont" to pin a font).
+# Entries no font provides are skipped with a warning.
 # ---------------------------------------------------------------------------
 
 INSTRUMENTS = [
@@ -73,4 +172,106 @@ DEFAULT_INSTRUMENT_INDEX = 0
 # Keystation 49 MK3 = ch 4, Arturia MiniLab 3 = ch 0
 MIDI_CHANNELS = [0, 4]
 
+# Hotplug detection: "auto" = ALSA sequencer announce events when the
+# alsa-midi package is installed, else polling; "poll" = always poll aconnect
+MIDI_HOTPLUG_BACKEND = "auto"
+
 MIDI_POLL_INTERVAL = 2.0
+
+# After a hotplug event, wait this long for the rest of the burst
+# (client + port announcements) before rescanning
+MIDI_HOTPLUG_SETTLE = 0.05
+
+# Record everything played to MIDI files (midi_capture.py): one file per
+# take in CAPTURE_DIR, a take ends after CAPTURE_IDLE_GAP seconds of
+# silence. Events are buffered in a ring of CAPTURE_RING_SIZE (allocated
+# up front) and written to the SD card every CAPTURE_FLUSH_INTERVAL.
+CAPTURE_ENABLED = False
+CAPTURE_DIR = "/home/pi/piano-pi-brain/recordings"
+CAPTURE_RING_SIZE = 8192
+CAPTURE_FLUSH_INTERVAL = 1.0
+CAPTURE_IDLE_GAP = 30.0
+
+# Timed output (scheduler.py): events are queued on the ALSA sequencer this
+# far ahead, topped up this often. A longer lookahead survives longer
+# stalls; a shorter one makes tempo changes and stops take effect sooner.
+SCHEDULE_LOOKAHEAD = 0.2
+SCHEDULE_INTERVAL = 0.05
+
+# Metronome (metronome.py, /api/metronome). Hold Prev to switch it on/off;
+# while it runs, Next/Prev change the tempo by METRONOME_BPM_STEP and
+# holding Next cycles the presets. Accents per beat: 2 = accented,
+# 1 = normal, 0 = silent. Clicks are GM percussion (channel 10, 0-based 9):
+# high / low wood block.
+METRONOME_BPM = 90
+METRONOME_BPM_STEP = 5
+METRONOME_MIN_BPM = 20
+METRONOME_MAX_BPM = 300
+METRONOME_HOLD_SECONDS = 1.0
+METRONOME_CHANNEL = 9
+METRONOME_NOTES = {2: 76, 1: 77}
+METRONOME_PRESETS = [
+    {"beats": 4, "unit": 4, "accents": [2, 1, 1, 1]},
+    {"beats": 3, "unit": 4, "accents": [2, 1, 1]},
+    {"beats": 2, "unit": 4, "accents": [2, 1]},
+    {"beats": 6, "unit": 8, "accents": [2, 1, 1, 2, 1, 1]},
+]
+
+# Arpeggiator (arpeggiator.py, /api/arp). Hold Prev for ARP_HOLD_SECONDS to
+# switch it on/off; while it is on (and the metronome is off) Next/Prev
+# pick the pattern: "up", "down", "updown", "random" or "chord".
+# Rate = steps per beat (2 = eighths, 3 = triplets, 4 = sixteenths); gate =
+# note length as a fraction of a step; swing delays every second step by
+# that fraction of a step (0 = straight). Steps are queued ARP_LOOKAHEAD
+# ahead, shorter than SCHEDULE_LOOKAHEAD so released keys stop sooner.
+ARP_HOLD_SECONDS = 2.5
+ARP_LOOKAHEAD = 0.1
+ARP_PATTERN = "up"
+ARP_BPM = 120
+ARP_RATE = 4
+ARP_OCTAVES = 1
+ARP_GATE = 0.5
+ARP_SWING = 0.0
+
+# Backing tracks (player.py, /api/player): .mid files in PLAYER_DIR. Their
+# channels are moved off MIDI_CHANNELS so they never touch the live sound.
+PLAYER_DIR = "/home/pi/piano-pi-brain/midi"
+
+# ---------------------------------------------------------------------------
+# Web Portal & Metrics
+# ---------------------------------------------------------------------------
+
+# Web state store: change events kept for SSE clients to resume from, and
+# how long an SSE stream waits after a send so bursts go out as one update
+STATE_EVENT_RING = 256
+SSE_COALESCE_SECONDS = 0.1
+
+# How long a web request waits for its action (e.g. an instrument change
+# queued behind a restart) before answering 504
+CONTROL_ACTION_TIMEOUT = 35.0
+
+# Metrics (/api/metrics): sample FluidSynth's CPU/RSS/voices this often and
+# keep this many samples (and recent latencies per control path)
+METRICS_SAMPLE_INTERVAL = 2.0
+METRICS_RING_SIZE = 300
+
+# Tracing (tracing.py, GET /api/trace): record spans from startup, and how
+# many of the most recent spans to keep (memory is allocated up front).
+# Can be switched on at runtime with POST /api/trace {"enabled": true}.
+TRACE_ENABLED = False
+TRACE_RING_SIZE = 4096
+
+# Per-phase startup timing (boot.py), written after every start and also
+# shown in /api/state as "boot"
+BOOT_TRACE_FILE = "/home/pi/piano-pi-brain/boot-trace.json"
+
+# Hot reload (config_reload.py, POST /api/config/reload): edits to this file
+# are applied CONFIG_RELOAD_SETTLE seconds after the last write (inotify;
+# without it the file is checked every CONFIG_POLL_INTERVAL). Only changed
+# settings are applied; FluidSynth is restarted only for a new
+# FLUIDSYNTH_CMD, SYNTH_BACKEND, SOUNDFONT_BANK_OFFSETS or SOUNDFONT_LOADING
+# (soundfonts are swapped while it runs), or a soundfont too big to load
+# next to the old.
+CONFIG_WATCH = True
+CONFIG_RELOAD_SETTLE = 0.5
+CONFIG_POLL_INTERVAL = 2.0
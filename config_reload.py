@@ -0,0 +1,342 @@
+"""
+Piano Pi Brain — Config Hot Reload
+
+Picks up edits to config.py without restarting the service (and so
+without reloading the soundfont): the file is re-executed in a fresh
+namespace, validated, and only the settings whose value changed are
+copied onto the config module. Nothing is applied if the file doesn't
+load or a value is invalid.
+
+Most settings are read where they are used (button timings, poll
+interval, lookaheads ...), so copying them is enough. The rest is
+applied by a callback (see piano_pi.apply_config):
+
+  INSTRUMENT_KEYS   instrument list re-checked against the soundfonts,
+                    fonts swapped while running, program replayed on
+                    MIDI_CHANNELS
+  SYNTH_KEYS        FluidSynth restarted (new command, bank offsets or
+                    sample loading mode)
+  STARTUP_KEYS      only read at startup; reported, take effect on the
+                    next service start
+
+The file is watched with inotify (its directory, since editors replace
+files by renaming); without inotify it is polled every
+CONFIG_POLL_INTERVAL. A burst of writes is applied once, CONFIG_RELOAD_SETTLE
+after the last one.
+"""
+
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+import threading
+
+import config
+
+log = logging.getLogger(__name__)
+
+# Change the FluidSynth instance itself: applied by a restart
+SYNTH_KEYS = frozenset({
+    "SYNTH_BACKEND", "FLUIDSYNTH_CMD", "SOUNDFONT_BANK_OFFSETS", "SOUNDFONT_LOADING",
+})
+
+# Applied live by re-resolving the instrument list (and swapping soundfonts)
+INSTRUMENT_KEYS = frozenset({
+    "INSTRUMENTS", "MIDI_CHANNELS",
+    "SOUNDFONT_PATH", "SOUNDFONT_EXTRAS", "SOUNDFONT_FALLBACK",
+})
+
+# Read once while starting up
+STARTUP_KEYS = frozenset({
+    "BUTTON_RESTART", "BUTTON_NEXT_INST", "BUTTON_PREV_INST", "LED_RED",
+    "DEFAULT_INSTRUMENT_INDEX", "MIDI_HOTPLUG_BACKEND",
+    "CAPTURE_ENABLED", "CAPTURE_RING_SIZE",
+    "METRONOME_BPM", "ARP_PATTERN", "ARP_BPM", "ARP_RATE", "ARP_OCTAVES", "ARP_GATE",
+    "ARP_SWING",
+    "STATE_EVENT_RING", "METRICS_RING_SIZE", "TRACE_ENABLED", "TRACE_RING_SIZE",
+    "CONFIG_WATCH",
+})
+
+# Must be positive numbers
+_DURATIONS = (
+    "LONG_PRESS_SECONDS", "RESET_HOLD_SECONDS", "METRONOME_HOLD_SECONDS", "ARP_HOLD_SECONDS",
+    "MIDI_POLL_INTERVAL", "SCHEDULE_LOOKAHEAD", "SCHEDULE_INTERVAL", "ARP_LOOKAHEAD",
+    "CONTROL_ACTION_TIMEOUT", "FLUIDSYNTH_READY_TIMEOUT", "SUPERVISOR_CHECK_INTERVAL",
+)
+
+_IN_MODIFY = 0x002
+_IN_CLOSE_WRITE = 0x008
+_IN_MOVED_TO = 0x080
+_IN_CREATE = 0x100
+_EVENT = struct.Struct("iIII")
+
+
+def load(path: str) -> dict:
+    """The settings (UPPERCASE names) `path` defines. Raises ValueError if it doesn't run."""
+    try:
+        with open(path, encoding="utf-8") as f:
+            source = f.read()
+        namespace = {"__name__": "config", "__file__": path}
+        exec(compile(source, path, "exec"), namespace)
+    except Exception as e:
+        raise ValueError(f"{os.path.basename(path)}: {e}") from e
+    return {name: value for name, value in namespace.items()
+            if name.isupper() and not name.startswith("_")}
+
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def validate(values: dict) -> list[str]:
+    """Everything wrong with `values` (empty = safe to apply)."""
+    errors = []
+
+    instruments = values.get("INSTRUMENTS")
+    if not isinstance(instruments, list) or not instruments:
+        errors.append("INSTRUMENTS must be a non-empty list")
+    else:
+        for i, inst in enumerate(instruments):
+            if not isinstance(inst, dict) or not isinstance(inst.get("name"), str):
+                errors.append(f"INSTRUMENTS[{i}] needs a name")
+                continue
+            if not isinstance(inst.get("program"), int) or not 0 <= inst["program"] <= 127:
+                errors.append(f"INSTRUMENTS[{i}] ({inst['name']}): program must be 0-127")
+            if not isinstance(inst.get("bank", 0), int) or not 0 <= inst.get("bank", 0) <= 16383:
+                errors.append(f"INSTRUMENTS[{i}] ({inst['name']}): bank must be 0-16383")
+
+    channels = values.get("MIDI_CHANNELS")
+    if (not isinstance(channels, list) or not channels
+            or not all(isinstance(ch, int) and 0 <= ch <= 15 for ch in channels)
+            or len(set(channels)) != len(channels)):
+        errors.append("MIDI_CHANNELS must be a list of distinct channels 0-15")
+
+    for name in _DURATIONS:
+        if name in values and not (_is_number(values[name]) and values[name] > 0):
+            errors.append(f"{name} must be a positive number")
+    debounce = values.get("DEBOUNCE_SECONDS")
+    if debounce is not None and not (_is_number(debounce) and 0 <= debounce < 1):
+        errors.append("DEBOUNCE_SECONDS must be 0-1 (or None)")
+    if (_is_number(values.get("METRONOME_HOLD_SECONDS"))
+            and _is_number(values.get("ARP_HOLD_SECONDS"))
+            and values["ARP_HOLD_SECONDS"] <= values["METRONOME_HOLD_SECONDS"]):
+        errors.append("ARP_HOLD_SECONDS must be longer than METRONOME_HOLD_SECONDS")
+
+    if values.get("SYNTH_BACKEND") not in ("subprocess", "libfluidsynth"):
+        errors.append('SYNTH_BACKEND must be "subprocess" or "libfluidsynth"')
+    cmd = values.get("FLUIDSYNTH_CMD")
+    if not isinstance(cmd, list) or not cmd or not all(isinstance(arg, str) for arg in cmd):
+        errors.append("FLUIDSYNTH_CMD must be a non-empty list of strings")
+    extras = values.get("SOUNDFONT_EXTRAS", [])
+    fonts = [values.get("SOUNDFONT_PATH"), values.get("SOUNDFONT_FALLBACK")]
+    if (not isinstance(fonts[0], str) or not (fonts[1] is None or isinstance(fonts[1], str))
+            or not isinstance(extras, list) or not all(isinstance(p, str) for p in extras)):
+        errors.append("SOUNDFONT_PATH / SOUNDFONT_EXTRAS / SOUNDFONT_FALLBACK must be paths")
+    elif not any(path and os.path.isfile(path) for path in fonts + extras):
+        errors.append("no soundfont in SOUNDFONT_PATH / SOUNDFONT_EXTRAS / SOUNDFONT_FALLBACK exists")
+    offsets = values.get("SOUNDFONT_BANK_OFFSETS", {})
+    if not isinstance(offsets, dict) or not all(
+            isinstance(k, str) and isinstance(v, int) and 0 <= v <= 16383
+            for k, v in offsets.items()):
+        errors.append("SOUNDFONT_BANK_OFFSETS must map paths to banks 0-16383")
+    if values.get("SOUNDFONT_LOADING", "auto") not in ("auto", "preload", "dynamic"):
+        errors.append('SOUNDFONT_LOADING must be "auto", "preload" or "dynamic"')
+    budget = values.get("SOUNDFONT_PRELOAD_BUDGET_MB")
+    if budget is not None and not (_is_number(budget) and budget >= 0):
+        errors.append("SOUNDFONT_PRELOAD_BUDGET_MB must be a number of MB (or None)")
+    return errors
+
+
+def changed(old: dict, new: dict) -> set[str]:
+    """Names defined in `new` whose value differs from `old`."""
+    return {name for name, value in new.items()
+            if name not in old or old[name] != value}
+
+
+class ConfigReloader:
+    """Re-reads config.py on request or when it changes; see module docstring."""
+
+    def __init__(self, on_apply=None, path: str | None = None):
+        """
+        Args:
+            on_apply: Callback(changed: set[str]) -> dict | None, called after
+                the changed values were copied onto the config module;
+                applies what isn't read at use. Its result is added to
+                the report.
+            path: File to watch (default: config.py itself)
+        """
+        self.path = os.path.abspath(path or config.__file__)
+        self._on_apply = on_apply
+        self._lock = threading.Lock()
+        try:
+            self._values = load(self.path)
+        except ValueError:
+            self._values = {name: getattr(config, name) for name in dir(config)
+                            if name.isupper()}
+        self.last: dict | None = None       # report of the last reload
+        self._thread = None
+        self._running = False
+        self._wake_r = self._wake_w = None
+
+    # --- Reloading -----------------------------------------------------------------
+
+    def reload(self) -> dict:
+        """
+        Load, validate and apply the file. Returns a report:
+        {"status": "applied" | "unchanged" | "invalid", "changed": [...],
+         "errors": [...], "startup_only": [...], ...on_apply's result}.
+        """
+        with self._lock:
+            report = self._reload()
+        self.last = report
+        return report
+
+    def _reload(self) -> dict:
+        try:
+            values = load(self.path)
+        except ValueError as e:
+            log.error("Config not reloaded: %s", e)
+            return {"status": "invalid", "changed": [], "errors": [str(e)]}
+
+        errors = validate(values)
+        if errors:
+            for error in errors:
+                log.error("Config not reloaded: %s", error)
+            return {"status": "invalid", "changed": [], "errors": errors}
+
+        names = changed(self._values, values)
+        self._values = values
+        if not names:
+            return {"status": "unchanged", "changed": [], "errors": []}
+
+        for name in names:
+            setattr(config, name, values[name])
+        startup = sorted(names & STARTUP_KEYS)
+        log.info("Config reloaded: %s changed", ", ".join(sorted(names)))
+        if startup:
+            log.warning("Config: %s take effect on the next start", ", ".join(startup))
+
+        report = {"status": "applied", "changed": sorted(names), "errors": [],
+                  "startup_only": startup}
+        if self._on_apply:
+            try:
+                report.update(self._on_apply(names) or {})
+            except Exception as e:
+                log.error("Applying the new config failed: %r", e)
+                report["errors"].append(str(e) or type(e).__name__)
+        return report
+
+    # --- Watching ------------------------------------------------------------------
+
+    def start(self):
+        """Reload whenever the file changes (inotify, else polling)."""
+        self._running = True
+        self._wake_r, self._wake_w = os.pipe()
+        self._thread = threading.Thread(target=self._watch, name="config-watch", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        if self._wake_w is not None:
+            os.write(self._wake_w, b"x")
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
+        for fd in (self._wake_r, self._wake_w):
+            if fd is not None:
+                os.close(fd)
+        self._wake_r = self._wake_w = None
+
+    def _watch(self):
+        fd = _inotify_watch(os.path.dirname(self.path),
+                            _IN_CLOSE_WRITE | _IN_MOVED_TO | _IN_CREATE | _IN_MODIFY)
+        if fd is None:
+            log.info("Watching %s (polling every %.1fs)", self.path, config.CONFIG_POLL_INTERVAL)
+            self._poll_loop()
+            return
+        log.info("Watching %s (inotify)", self.path)
+        try:
+            self._inotify_loop(fd)
+        finally:
+            os.close(fd)
+
+    def _inotify_loop(self, fd: int):
+        name = os.path.basename(self.path).encode()
+        poller = select.poll()
+        poller.register(fd, select.POLLIN)
+        poller.register(self._wake_r, select.POLLIN)
+        pending = False
+        while self._running:
+            # Once the file was touched, wait for the burst to settle
+            timeout = config.CONFIG_RELOAD_SETTLE * 1000 if pending else None
+            events = poller.poll(timeout)
+            if not self._running:
+                return
+            if not events:
+                pending = False
+                self._reload_logged()
+                continue
+            for ready, _ in events:
+                if ready == fd and name in _read_names(fd):
+                    pending = True
+
+    def _poll_loop(self):
+        last = self._stat()
+        poller = select.poll()
+        poller.register(self._wake_r, select.POLLIN)
+        while self._running:
+            poller.poll(config.CONFIG_POLL_INTERVAL * 1000)
+            if not self._running:
+                return
+            current = self._stat()
+            if current != last:
+                last = current
+                poller.poll(config.CONFIG_RELOAD_SETTLE * 1000)
+                last = self._stat()
+                self._reload_logged()
+
+    def _stat(self):
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return st.st_ino, st.st_size, st.st_mtime_ns
+
+    def _reload_logged(self):
+        try:
+            self.reload()
+        except Exception as e:
+            log.error("Config reload error: %s", e)
+
+
+def _read_names(fd: int) -> list[bytes]:
+    """File names in the pending inotify events."""
+    try:
+        data = os.read(fd, 4096)
+    except BlockingIOError:
+        return []
+    names, pos = [], 0
+    while pos + _EVENT.size <= len(data):
+        _, _, _, length = _EVENT.unpack_from(data, pos)
+        pos += _EVENT.size
+        names.append(data[pos:pos + length].rstrip(b"\0"))
+        pos += length
+    return names
+
+
+def _inotify_watch(directory: str, mask: int) -> int | None:
+    """Non-blocking inotify fd watching `directory`, or None without inotify."""
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+    except (OSError, AttributeError):
+        return None
+    if fd < 0:
+        return None
+    if libc.inotify_add_watch(fd, os.fsencode(directory), ctypes.c_uint32(mask)) < 0:
+        log.warning("inotify on %s failed: %s", directory, os.strerror(ctypes.get_errno()))
+        os.close(fd)
+        return None
+    return fd
@@ -0,0 +1,216 @@
+"""
+Piano Pi Brain — Control Actor
+
+Buttons (gpiozero threads), the web portal (Flask request threads) and
+the MIDI monitor all act on the same synth. Instead of each touching it
+directly, they submit actions here; one actor thread executes them in
+order, so two actions never interleave.
+
+Every submit returns a concurrent.futures.Future with the action's
+result. Queued actions are handled in batches:
+
+  - runs of instrument moves (next / prev / reset / select) collapse
+    into one program change to the final instrument; every future in the
+    run resolves to that instrument's name
+  - a restart requested while one is queued or running gets the same
+    future instead of a second restart
+
+The restart itself runs on its own thread (restart.py), so instrument
+changes and other actions keep being served while FluidSynth reloads;
+its steps that change the synth are handed back to this actor (call()),
+so they never interleave with those actions.
+"""
+
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import NamedTuple
+
+import metrics
+import tracing
+
+log = logging.getLogger(__name__)
+
+_INSTRUMENT_MOVES = ("next", "prev", "reset", "select")
+
+
+class _Action(NamedTuple):
+    kind: str
+    args: tuple
+    future: Future
+    source: str | None
+    submitted: float
+
+
+class Controller:
+    """Owns the synth's control path; see module docstring."""
+
+    def __init__(self, synth, restart_fn, on_instrument=None):
+        """
+        Args:
+            synth: FluidSynthManager
+            restart_fn: Callable() -> Future[bool] that starts a full restart
+            on_instrument: Callback(name, index) after the instrument changed
+        """
+        self._synth = synth
+        self._restart_fn = restart_fn
+        self._on_instrument = on_instrument
+        self._queue: queue.Queue[_Action | None] = queue.Queue()
+        self._restart_future: Future | None = None
+        self._restart_lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def restart_pending(self) -> bool:
+        future = self._restart_future
+        return future is not None and not future.done()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="controller", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread:
+            self._queue.put(None)
+            self._thread.join(timeout=10)
+            self._thread = None
+
+    # --- Submitting ------------------------------------------------------------
+
+    def submit(self, kind: str, *args, source: str | None = None) -> Future:
+        """
+        Queue an action. `source` ("button", "web") records the time from
+        submit to completion as that control path's latency.
+        """
+        future = Future()
+        action = _Action(kind, args, future, source, time.monotonic())
+        if source in metrics.LATENCY_PATHS:
+            future.add_done_callback(
+                lambda _: metrics.observe(source, time.monotonic() - action.submitted))
+        self._queue.put(action)
+        return future
+
+    def next_instrument(self, source=None) -> Future:
+        return self.submit("next", source=source)
+
+    def prev_instrument(self, source=None) -> Future:
+        return self.submit("prev", source=source)
+
+    def reset_instrument(self, source=None) -> Future:
+        return self.submit("reset", source=source)
+
+    def select_instrument(self, index: int, source=None) -> Future:
+        return self.submit("select", index, source=source)
+
+    def restart(self, source=None) -> Future:
+        """Queue a restart, or join the one already queued/running."""
+        with self._restart_lock:
+            if self.restart_pending:
+                log.info("Restart already in progress — merging request")
+                return self._restart_future
+            self._restart_future = self.submit("restart", source=source)
+            return self._restart_future
+
+    def call(self, fn, *args, source=None) -> Future:
+        """Run any callable on the actor thread, in order with other actions."""
+        return self.submit("call", fn, *args, source=source)
+
+    # --- Actor -----------------------------------------------------------------
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            # Take whatever else is already waiting: that's the burst to collapse
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            stop = None in batch
+            batch = [a for a in batch if a is not None]
+            if tracing.enabled():
+                started = tracing.now()
+                for action in batch:
+                    tracing.record("control.queued", "control",
+                                   int(action.submitted * 1e9), started,
+                                   {"kind": action.kind, "source": action.source})
+            i = 0
+            while i < len(batch):
+                if batch[i].kind in _INSTRUMENT_MOVES:
+                    j = i
+                    while j < len(batch) and batch[j].kind in _INSTRUMENT_MOVES:
+                        j += 1
+                    self._run_moves(batch[i:j])
+                    i = j
+                else:
+                    self._run_one(batch[i])
+                    i += 1
+
+            if stop:
+                return
+
+    def _run_moves(self, moves: list[_Action]):
+        if len(moves) > 1:
+            log.info("Collapsing %d instrument changes into one", len(moves))
+        with tracing.span("control.instrument", "control", moves=len(moves)):
+            self._apply_moves(moves)
+
+    def _apply_moves(self, moves: list[_Action]):
+        synth = self._synth
+        try:
+            count = len(synth.instruments)
+            index = synth.current_index
+            for move in moves:
+                if move.kind == "next":
+                    index = (index + 1) % count
+                elif move.kind == "prev":
+                    index = (index - 1) % count
+                elif move.kind == "reset":
+                    index = 0
+                else:
+                    index = move.args[0]
+                    if not 0 <= index < count:
+                        raise IndexError(f"instrument index {index} out of range")
+
+            name = synth.select_instrument(index)
+            if self._on_instrument:
+                self._on_instrument(name, index)
+        except Exception as e:
+            log.error("Instrument change failed: %s", e)
+            for move in moves:
+                move.future.set_exception(e)
+            return
+        for move in moves:
+            move.future.set_result(name)
+
+    def _run_one(self, action: _Action):
+        with tracing.span(f"control.{action.kind}", "control", source=action.source):
+            self._execute(action)
+
+    def _execute(self, action: _Action):
+        try:
+            if action.kind == "restart":
+                # Resolve when the restart sequence finishes, not when it starts
+                self._restart_fn().add_done_callback(
+                    lambda done: _copy_result(done, action.future))
+                return
+            elif action.kind == "call":
+                fn, *args = action.args
+                result = fn(*args)
+            else:
+                raise ValueError(f"unknown action {action.kind!r}")
+        except Exception as e:
+            log.error("Action %s failed: %s", action.kind, e)
+            action.future.set_exception(e)
+            return
+        action.future.set_result(result)
+
+
+def _copy_result(source: Future, target: Future):
+    if source.exception() is not None:
+        target.set_exception(source.exception())
+    else:
+        target.set_result(source.result())
@@ -0,0 +1,305 @@
+"""
+Piano Pi Brain — FluidSynth Shell Client
+
+Persistent connection to FluidSynth's TCP command shell (`fluidsynth -s`,
+port `shell.port`). Every command is followed by an `echo <token>`, so the
+token marks the end of that command's output and replies can be matched to
+requests even when several are in flight (pipelined in one write).
+
+FakeShellServer speaks enough of the same protocol to exercise the client
+(and the synth manager) without FluidSynth installed.
+"""
+
+import itertools
+import logging
+import os
+import re
+import socket
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import NamedTuple
+
+log = logging.getLogger(__name__)
+
+DEFAULT_TIMEOUT = 2.0
+
+_QUICKACK = getattr(socket, "TCP_QUICKACK", None)
+
+# FluidSynth reports command failures as text, not status codes
+_ERROR_RE = re.compile(
+    r"failed|invalid|unknown command|error|not found|too few arguments",
+    re.IGNORECASE,
+)
+
+
+class ShellError(Exception):
+    """The shell connection is down or a reply did not arrive in time."""
+
+
+class ShellReply(NamedTuple):
+    command: str
+    lines: list
+    ok: bool
+
+
+class _Pending:
+    __slots__ = ("command", "token", "future", "lines")
+
+    def __init__(self, command, token):
+        self.command = command
+        self.token = token
+        self.future = Future()
+        self.lines = []
+
+
+class FluidShell:
+    """Request/response client for FluidSynth's shell socket."""
+
+    def __init__(self, host="127.0.0.1", port=9800):
+        self.host = host
+        self.port = port
+        self._sock = None
+        self._reader = None
+        self._pending: deque[_Pending] = deque()
+        self._write_lock = threading.Lock()
+        self._tokens = itertools.count(1)
+
+    @property
+    def connected(self) -> bool:
+        return self._sock is not None
+
+    def connect(self, timeout: float = DEFAULT_TIMEOUT) -> bool:
+        """Open the socket; returns False if nothing is listening yet."""
+        if self.connected:
+            return True
+        try:
+            sock = socket.create_connection((self.host, self.port), timeout=timeout)
+        except OSError:
+            return False
+
+        sock.settimeout(None)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._sock = sock
+        self._reader = threading.Thread(target=self._read_loop, args=(sock,), daemon=True)
+        self._reader.start()
+        log.debug("Shell connected to %s:%d", self.host, self.port)
+        return True
+
+    def close(self):
+        sock, self._sock = self._sock, None
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            sock.close()
+        self._fail_pending("shell closed")
+
+    def submit(self, commands: list[str]) -> list[Future]:
+        """
+        Send `commands` in one write without waiting.
+        Returns one Future per command, resolving to a ShellReply.
+        """
+        if not self.connected:
+            raise ShellError("shell not connected")
+
+        entries = [_Pending(cmd, f"__pp_ack_{next(self._tokens)}__") for cmd in commands]
+        payload = "".join(f"{e.command}\necho {e.token}\n" for e in entries).encode()
+
+        with self._write_lock:
+            self._pending.extend(entries)
+            try:
+                self._sock.sendall(payload)
+            except (OSError, AttributeError) as e:
+                self.close()
+                raise ShellError(f"send failed: {e}") from e
+
+        return [e.future for e in entries]
+
+    def send(self, commands: list[str], timeout: float = DEFAULT_TIMEOUT) -> list[ShellReply]:
+        """Pipeline `commands` and wait for every reply."""
+        futures = self.submit(commands)
+        deadline = time.monotonic() + timeout
+        replies = []
+        for f in futures:
+            try:
+                replies.append(f.result(timeout=max(0.0, deadline - time.monotonic())))
+            except TimeoutError as e:
+                raise ShellError(f"no reply within {timeout:.1f}s") from e
+        return replies
+
+    def request(self, command: str, timeout: float = DEFAULT_TIMEOUT) -> ShellReply:
+        """Send one command and wait for its reply."""
+        return self.send([command], timeout)[0]
+
+    def _read_loop(self, sock):
+        buf = b""
+        try:
+            while True:
+                chunk = sock.recv(4096)
+                if not chunk:
+                    break
+                if _QUICKACK:
+                    # FluidSynth writes each reply line separately without
+                    # TCP_NODELAY; ACK at once so Nagle doesn't hold the
+                    # next line back for a delayed-ACK period (~40 ms)
+                    sock.setsockopt(socket.IPPROTO_TCP, _QUICKACK, 1)
+                buf += chunk
+                *lines, buf = buf.split(b"\n")
+                for raw in lines:
+                    self._on_line(raw.decode(errors="replace"))
+        except OSError:
+            pass
+
+        if self._sock is sock:
+            log.warning("FluidSynth shell connection lost")
+            self._sock = None
+        self._fail_pending("connection lost")
+
+    def _on_line(self, line: str):
+        # Strip any interactive prompt ("> ") FluidSynth may prepend
+        while line.startswith("> "):
+            line = line[2:]
+        line = line.rstrip("\r")
+
+        try:
+            head = self._pending[0]
+        except IndexError:
+            return  # unsolicited output
+
+        if head.token in line:
+            self._pending.popleft()
+            ok = not any(_ERROR_RE.search(l) for l in head.lines)
+            head.future.set_result(ShellReply(head.command, head.lines, ok))
+        elif line:
+            head.lines.append(line)
+
+    def _fail_pending(self, reason: str):
+        while self._pending:
+            entry = self._pending.popleft()
+            if not entry.future.done():
+                entry.future.set_exception(ShellError(reason))
+
+
+# ---------------------------------------------------------------------------
+# Fake server for development without FluidSynth
+# ---------------------------------------------------------------------------
+
+class FakeShellServer:
+    """
+    Minimal FluidSynth shell over TCP: remembers selects, gains and
+    settings, and records every command it receives with a timestamp.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, presets=None, fonts=None):
+        """
+        Args:
+            port: 0 = pick a free port (see .port)
+            presets: {(bank, program): name} reported by `inst <id>`, the
+                same for every font
+            fonts: Paths loaded at start (ids 1, 2, ...)
+        """
+        self.presets = presets or {(0, 0): "Grand Piano"}
+        # font id -> (path, bank offset)
+        self.fonts = {i: (path, 0) for i, path in enumerate(["fake.sf2"] if fonts is None else fonts, start=1)}
+        self._next_font = len(self.fonts) + 1
+        self.channels: dict[int, tuple] = {}
+        self.settings = {"synth.gain": "1.0", "synth.polyphony": "64"}
+        self.commands: list[tuple[float, str]] = []
+        self._conns: set = set()
+        self._server = socket.create_server((host, port))
+        self.port = self._server.getsockname()[1]
+        self._thread = threading.Thread(target=self._accept_loop, daemon=True)
+        self._thread.start()
+
+    def close(self):
+        # shutdown() wakes the accept loop; close() alone leaves it listening
+        try:
+            self._server.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self._server.close()
+        self.drop_clients()
+
+    def drop_clients(self):
+        """Close every client connection (the server keeps listening)."""
+        for conn in list(self._conns):
+            try:
+                conn.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def _accept_loop(self):
+        while True:
+            try:
+                conn, _ = self._server.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def _serve(self, conn):
+        self._conns.add(conn)
+        try:
+            with conn, conn.makefile("rwb", buffering=0) as f:
+                for raw in f:
+                    line = raw.decode().strip()
+                    if not line:
+                        continue
+                    if line == "quit":
+                        return
+                    self.commands.append((time.monotonic(), line))
+                    out = self.handle(line.split())
+                    if out:
+                        f.write(("\n".join(out) + "\n").encode())
+        except OSError:
+            pass
+        finally:
+            self._conns.discard(conn)
+
+    def handle(self, av: list[str]) -> list[str]:
+        cmd, args = av[0], av[1:]
+        if cmd == "echo":
+            return [" ".join(args)]
+        if cmd == "select" and len(args) == 4:
+            ch, sfont, bank, prog = map(int, args)
+            if sfont not in self.fonts or (bank - self.fonts[sfont][1], prog) not in self.presets:
+                return ["select: program select failed"]
+            self.channels[ch] = (sfont, bank, prog)
+            return []
+        if cmd == "gain" and args:
+            self.settings["synth.gain"] = args[0]
+            return []
+        if cmd == "get" and args:
+            return [self.settings.get(args[0], f"get: unknown setting {args[0]}")]
+        if cmd == "set" and len(args) == 2:
+            self.settings[args[0]] = args[1]
+            return []
+        if cmd == "channels":
+            return [
+                f"chan {ch}, {self.presets.get(self.channels[ch][1:], '')}"
+                for ch in sorted(self.channels)
+            ]
+        if cmd == "fonts":
+            return ["ID  Name", *(f"{i:3d}  {path}" for i, (path, _) in sorted(self.fonts.items()))]
+        if cmd == "load" and args:
+            path = args[0].strip('"')
+            if not os.path.isfile(path):
+                return ["failed to load the SoundFont"]
+            font_id, self._next_font = self._next_font, self._next_font + 1
+            self.fonts[font_id] = (path, int(args[2]) if len(args) > 2 else 0)
+            return [f"loaded SoundFont has ID {font_id}"]
+        if cmd == "unload" and args:
+            font_id = int(args[0])
+            if self.fonts.pop(font_id, None) is None:
+                return ["Failed to unload SoundFont"]
+            # Channels playing from it lose their preset
+            for ch in [ch for ch, program in self.channels.items() if program[0] == font_id]:
+                del self.channels[ch]
+            return []
+        if cmd == "inst":
+            return [f"{b:03d}-{p:03d} {n}" for (b, p), n in sorted(self.presets.items())]
+        if cmd in ("cc", "reverb", "chorus", "prog", "noteon", "noteoff", "reset"):
+            return []
+        return [f"unknown command: {cmd} (try help)"]
@@ -0,0 +1,262 @@
+"""
+Piano Pi Brain — Runtime Metrics
+
+Two kinds of data, both in fixed-size memory:
+
+  - SynthSampler: a background thread that samples the FluidSynth
+    process from /proc (CPU %, RSS, context switches) and the synth
+    itself (active voices, polyphony limit) every METRICS_SAMPLE_INTERVAL
+    into a ring of the last METRICS_RING_SIZE samples
+  - control-path latency histograms (button -> command acknowledged, web
+    request -> command acknowledged, hotplug -> MIDI connected): fixed
+    bucket counters plus a ring of recent raw values
+
+render() formats everything in the Prometheus text exposition format
+for GET /api/metrics.
+"""
+
+import bisect
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import NamedTuple
+
+import config
+import procfs
+
+log = logging.getLogger(__name__)
+
+PREFIX = "piano_pi"
+
+# Upper bounds (seconds) of the latency buckets; +Inf is implicit
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+LATENCY_PATHS = {
+    "button": "Button press -> FluidSynth acknowledged the change",
+    "web": "Web request -> FluidSynth acknowledged the change",
+    "hotplug": "Sequencer announcement -> controller connected to FluidSynth",
+}
+
+
+class Histogram:
+    """Cumulative bucket counts plus a ring of the most recent observations."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS, ring_size=None):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.recent: deque[float] = deque(maxlen=ring_size or config.METRICS_RING_SIZE)
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        with self._lock:
+            self.counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.sum += value
+            self.count += 1
+            self.recent.append(value)
+
+    def quantile(self, q: float) -> float | None:
+        """q-quantile of the recent observations (None if there are none)."""
+        with self._lock:
+            values = sorted(self.recent)
+        if not values:
+            return None
+        return values[min(len(values) - 1, int(q * len(values)))]
+
+
+_latency = {path: Histogram() for path in LATENCY_PATHS}
+
+
+def observe(path: str, seconds: float):
+    """Record one control-path latency ("button", "web" or "hotplug")."""
+    _latency[path].observe(seconds)
+
+
+@contextmanager
+def timed(path: str, started: float | None = None):
+    """Time the block (or from `started`, a time.monotonic() value) into `path`."""
+    started = time.monotonic() if started is None else started
+    try:
+        yield
+    finally:
+        observe(path, time.monotonic() - started)
+
+
+# ---------------------------------------------------------------------------
+# FluidSynth process sampling
+# ---------------------------------------------------------------------------
+
+class Sample(NamedTuple):
+    time: float
+    pid: int | None
+    cpu_percent: float | None
+    rss_bytes: int | None
+    voluntary_switches: int | None
+    involuntary_switches: int | None
+    active_voices: int | None
+    polyphony: int | None
+
+
+class SynthSampler:
+    """Periodically samples the active FluidSynth into a ring buffer."""
+
+    def __init__(self, synth, interval: float | None = None, ring_size: int | None = None):
+        """
+        Args:
+            synth: FluidSynthManager to sample
+            interval: Seconds between samples (default METRICS_SAMPLE_INTERVAL)
+            ring_size: Samples kept (default METRICS_RING_SIZE)
+        """
+        self._synth = synth
+        self.interval = interval or config.METRICS_SAMPLE_INTERVAL
+        self.samples: deque[Sample] = deque(maxlen=ring_size or config.METRICS_RING_SIZE)
+        self._last_cpu = None       # (pid, monotonic, cpu seconds)
+        self._polyphony = None      # (pid, value) — only changes on restart
+        self._thread = None
+        self._stop = threading.Event()
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.sample()
+            except Exception as e:
+                log.error("Metrics sample failed: %s", e)
+
+    def sample(self) -> Sample:
+        """Take one sample now and append it to the ring."""
+        synth = self._synth
+        pid = synth.pid if synth.is_running else None
+        now = time.monotonic()
+        cpu_percent = rss = switches = voices = polyphony = None
+
+        if pid is not None:
+            cpu = procfs.process_cpu_seconds(pid)
+            if cpu is not None:
+                if self._last_cpu is not None and self._last_cpu[0] == pid and now > self._last_cpu[1]:
+                    cpu_percent = (cpu - self._last_cpu[2]) / (now - self._last_cpu[1]) * 100
+                self._last_cpu = (pid, now, cpu)
+            rss = procfs.process_rss(pid)
+            switches = procfs.context_switches(pid)
+            voices = synth.active_voices()
+            if self._polyphony is None or self._polyphony[0] != pid:
+                value = synth.get_setting("synth.polyphony")
+                self._polyphony = (pid, int(float(value))) if value else None
+            polyphony = self._polyphony[1] if self._polyphony else None
+
+        sample = Sample(now, pid, cpu_percent, rss,
+                        *(switches or (None, None)), voices, polyphony)
+        self.samples.append(sample)
+        return sample
+
+    def window_max(self, field: str):
+        """Highest value of `field` over the samples in the ring."""
+        values = [getattr(s, field) for s in self.samples if getattr(s, field) is not None]
+        return max(values) if values else None
+
+
+_sampler: SynthSampler | None = None
+
+
+def start_sampler(synth) -> SynthSampler:
+    """Start the process sampler whose data render() reports."""
+    global _sampler
+    if _sampler is not None:
+        _sampler.stop()
+    _sampler = SynthSampler(synth)
+    _sampler.start()
+    return _sampler
+
+
+def stop_sampler():
+    global _sampler
+    if _sampler is not None:
+        _sampler.stop()
+        _sampler = None
+
+
+# ---------------------------------------------------------------------------
+# Prometheus text format
+# ---------------------------------------------------------------------------
+
+def _fmt(value) -> str:
+    if isinstance(value, float):
+        return repr(round(value, 6))
+    return str(value)
+
+
+def _metric(lines: list, name: str, kind: str, help_text: str, samples: list[tuple[str, object]]):
+    samples = [(labels, value) for labels, value in samples if value is not None]
+    if not samples:
+        return
+    lines.append(f"# HELP {PREFIX}_{name} {help_text}")
+    lines.append(f"# TYPE {PREFIX}_{name} {kind}")
+    for labels, value in samples:
+        lines.append(f"{PREFIX}_{name}{labels} {_fmt(value)}")
+
+
+def render() -> str:
+    """All metrics in Prometheus text exposition format (version 0.0.4)."""
+    lines = []
+    sampler = _sampler
+    last = sampler.samples[-1] if sampler and sampler.samples else None
+
+    if last is not None:
+        _metric(lines, "fluidsynth_up", "gauge", "1 if FluidSynth was running at the last sample",
+                [("", int(last.pid is not None))])
+        _metric(lines, "fluidsynth_cpu_percent", "gauge", "FluidSynth CPU use (100 = one core)",
+                [("", last.cpu_percent)])
+        _metric(lines, "fluidsynth_cpu_percent_max", "gauge",
+                "Highest FluidSynth CPU use in the sample window",
+                [("", sampler.window_max("cpu_percent"))])
+        _metric(lines, "fluidsynth_rss_bytes", "gauge", "FluidSynth resident memory",
+                [("", last.rss_bytes)])
+        _metric(lines, "fluidsynth_rss_bytes_max", "gauge",
+                "Highest FluidSynth resident memory in the sample window",
+                [("", sampler.window_max("rss_bytes"))])
+        _metric(lines, "fluidsynth_context_switches_total", "counter",
+                "FluidSynth context switches since it started",
+                [('{kind="voluntary"}', last.voluntary_switches),
+                 ('{kind="involuntary"}', last.involuntary_switches)])
+        _metric(lines, "fluidsynth_active_voices", "gauge", "Voices currently playing",
+                [("", last.active_voices)])
+        _metric(lines, "fluidsynth_active_voices_max", "gauge",
+                "Most voices playing in the sample window",
+                [("", sampler.window_max("active_voices"))])
+        _metric(lines, "fluidsynth_polyphony", "gauge", "Voice limit (synth.polyphony)",
+                [("", last.polyphony)])
+        _metric(lines, "metrics_window_seconds", "gauge", "Time span of the sample window",
+                [("", last.time - sampler.samples[0].time)])
+
+    name = f"{PREFIX}_control_latency_seconds"
+    lines.append(f"# HELP {name} Control-path latency by path")
+    lines.append(f"# TYPE {name} histogram")
+    for path, hist in _latency.items():
+        with hist._lock:
+            counts, total, count = list(hist.counts), hist.sum, hist.count
+        cumulative = 0
+        for bound, n in zip(hist.buckets, counts):
+            cumulative += n
+            lines.append(f'{name}_bucket{{path="{path}",le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{path="{path}",le="+Inf"}} {count}')
+        lines.append(f'{name}_sum{{path="{path}"}} {_fmt(total)}')
+        lines.append(f'{name}_count{{path="{path}"}} {count}')
+
+    _metric(lines, "control_latency_recent_p95_seconds", "gauge",
+            "95th percentile of the most recent control-path latencies",
+            [(f'{{path="{path}"}}', hist.quantile(0.95)) for path, hist in _latency.items()])
+
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,180 @@
+"""
+Piano Pi Brain — Metronome
+
+Clicks on the GM percussion channel, played through the scheduler (see
+scheduler.py), so they are queued ahead on the sequencer instead of
+depending on when a Python thread wakes up.
+
+Every beat's time is computed from an anchor (a beat number and its
+time), never by adding up intervals, so the clicks can't drift. A tempo
+change re-anchors at the first beat not yet queued; beats already
+queued (up to SCHEDULE_LOOKAHEAD) keep the old tempo. A time signature
+change starts a new bar on that beat.
+
+Accents are one level per beat of the bar: 2 = accented click,
+1 = normal click, 0 = silent.
+"""
+
+import logging
+import threading
+import time
+
+import config
+import smf
+
+log = logging.getLogger(__name__)
+
+# Note-off this long after each click
+CLICK_NS = 50_000_000
+
+_VELOCITY = {1: 90, 2: 127}
+
+
+class Metronome:
+    """Drift-free click track; a scheduler source."""
+
+    def __init__(self, scheduler, on_change=None):
+        """
+        Args:
+            scheduler: Scheduler that queues the clicks
+            on_change: Callback(state: dict) after every change
+        """
+        self._scheduler = scheduler
+        self._on_change = on_change
+        self._lock = threading.Lock()
+        self.active = False
+        self.bpm = float(config.METRONOME_BPM)
+        self._preset = 0
+        preset = config.METRONOME_PRESETS[0]
+        self.beats = preset["beats"]
+        self.unit = preset["unit"]
+        self.accents = list(preset["accents"])
+        # Beat `_anchor_beat` is due at `_anchor_ns`; the next beat to queue is `_beat`
+        self._anchor_ns = 0
+        self._anchor_beat = 0
+        self._beat = 0
+        self._bar_start = 0
+        scheduler.add(self)
+
+    # --- Control -----------------------------------------------------------------
+
+    def start(self):
+        self._switch(True)
+
+    def stop(self):
+        self._switch(False)
+
+    def toggle(self):
+        self._switch(None)
+
+    def _switch(self, on: bool | None):
+        """On, off, or (None) the other way round, checked and changed under the lock."""
+        with self._lock:
+            if on is None:
+                on = not self.active
+            if on == self.active:
+                return
+            if on:
+                # First click one lookahead from now, so it can be queued on time
+                self._anchor_ns = time.monotonic_ns() + int(config.SCHEDULE_LOOKAHEAD * 1e9)
+                self._anchor_beat = self._beat = self._bar_start = 0
+            self.active = on
+        if on:
+            log.info("Metronome on (%s, %g bpm)", self.time_signature, self.bpm)
+        else:
+            log.info("Metronome off")
+        self._changed()
+
+    def set(self, bpm=None, beats=None, unit=None, accents=None):
+        """
+        Change tempo and/or time signature. Raises ValueError (nothing is
+        changed) for an out-of-range value.
+        """
+        if bpm is not None:
+            bpm = float(bpm)
+            if not config.METRONOME_MIN_BPM <= bpm <= config.METRONOME_MAX_BPM:
+                raise ValueError(f"bpm must be {config.METRONOME_MIN_BPM}"
+                                 f"–{config.METRONOME_MAX_BPM}")
+        new_beats = int(beats) if beats is not None else self.beats
+        new_unit = int(unit) if unit is not None else self.unit
+        if not 1 <= new_beats <= 16 or new_unit not in (2, 4, 8, 16):
+            raise ValueError(f"unsupported time signature {new_beats}/{new_unit}")
+        if accents is not None:
+            accents = [int(a) for a in accents]
+            if len(accents) != new_beats or any(a not in (0, 1, 2) for a in accents):
+                raise ValueError(f"accents must be {new_beats} levels of 0, 1 or 2")
+        elif new_beats != self.beats:
+            accents = [2] + [1] * (new_beats - 1)
+
+        with self._lock:
+            if bpm is not None and bpm != self.bpm:
+                self._reanchor()
+                self.bpm = bpm
+            if new_beats != self.beats or new_unit != self.unit:
+                self._bar_start = self._beat
+            self.beats, self.unit = new_beats, new_unit
+            if accents is not None:
+                self.accents = accents
+        self._changed()
+
+    def nudge(self, delta: float):
+        """Tempo up/down by `delta` bpm, clamped to the allowed range."""
+        bpm = min(config.METRONOME_MAX_BPM, max(config.METRONOME_MIN_BPM, self.bpm + delta))
+        self.set(bpm=bpm)
+
+    def next_preset(self):
+        """Cycle through METRONOME_PRESETS (time signature + accents)."""
+        self._preset = (self._preset + 1) % len(config.METRONOME_PRESETS)
+        preset = config.METRONOME_PRESETS[self._preset]
+        self.set(beats=preset["beats"], unit=preset["unit"], accents=preset["accents"])
+
+    @property
+    def time_signature(self) -> str:
+        return f"{self.beats}/{self.unit}"
+
+    def state(self) -> dict:
+        return {
+            "running": self.active,
+            "bpm": self.bpm,
+            "beats": self.beats,
+            "unit": self.unit,
+            "time_signature": self.time_signature,
+            "accents": list(self.accents),
+            "available": self._scheduler.available,
+        }
+
+    def _changed(self):
+        self._scheduler.wake()
+        if self._on_change:
+            try:
+                self._on_change(self.state())
+            except Exception as e:
+                log.error("Metronome callback failed: %s", e)
+
+    # --- Scheduler source ----------------------------------------------------------
+
+    def _period_ns(self) -> float:
+        return 60e9 / self.bpm
+
+    def _due(self, beat: int) -> int:
+        return self._anchor_ns + round((beat - self._anchor_beat) * self._period_ns())
+
+    def _reanchor(self):
+        """Keep the next unqueued beat where the current tempo puts it (lock held)."""
+        self._anchor_ns = self._due(self._beat)
+        self._anchor_beat = self._beat
+
+    def events_until(self, horizon_ns: int) -> list[tuple[int, bytes]]:
+        ch = config.METRONOME_CHANNEL
+        events = []
+        with self._lock:
+            if not self.active:
+                return events
+            while (due := self._due(self._beat)) < horizon_ns:
+                level = self.accents[(self._beat - self._bar_start) % self.beats]
+                if level:
+                    note = config.METRONOME_NOTES[level]
+                    events.append((due, smf.note_on(ch, note, _VELOCITY[level])))
+                    events.append((due + CLICK_NS, smf.note_off(ch, note)))
+                self._beat += 1
+        return events
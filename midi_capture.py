@@ -0,0 +1,281 @@
+"""
+Piano Pi Brain — MIDI Capture
+
+Records everything played on the connected controllers to Standard MIDI
+Files without touching the live path: the capture port is a second
+subscriber on each controller port (the MIDI monitor links it after the
+FluidSynth link), so the kernel hands every event to FluidSynth and to
+us independently.
+
+A reader thread stamps each event (monotonic ns) into a ring of
+CAPTURE_RING_SIZE slots allocated up front. It never blocks or
+allocates; if the writer falls behind, new events are dropped and
+counted. A writer thread drains the ring every CAPTURE_FLUSH_INTERVAL
+(sooner when the ring is half full) into the current take, a file in
+CAPTURE_DIR streamed with smf.StreamWriter, so a long session never sits
+in memory. A take ends after CAPTURE_IDLE_GAP seconds of silence.
+
+SyntheticSource stands in for the sequencer at a fixed event rate, for
+measuring throughput and drop rate (bench/run.py).
+"""
+
+import datetime
+import logging
+import os
+import threading
+import time
+from array import array
+
+import alsa_seq
+import config
+import smf
+
+log = logging.getLogger(__name__)
+
+# At the SMF default tempo one tick is 1/1920 s, finer than USB MIDI timing
+CAPTURE_DIVISION = 960
+_TICKS_PER_SECOND = CAPTURE_DIVISION * 1_000_000 // smf.DEFAULT_TEMPO
+
+
+class EventRing:
+    """
+    Single-producer, single-consumer ring of short MIDI messages.
+
+    push() never blocks: when the ring is full the event is dropped and
+    counted. Only the producer moves the head and only the consumer moves
+    the tail, so no lock is needed.
+    """
+
+    MAX_MESSAGE = 3     # channel messages; SysEx is not recorded
+
+    def __init__(self, size: int):
+        self.size = size
+        self._times = array("q", bytes(8 * size))
+        self._data = bytearray(self.MAX_MESSAGE * size)
+        self._lengths = bytearray(size)
+        self._head = 0      # events pushed so far
+        self._tail = 0      # events drained so far
+        self.dropped = 0
+        self.skipped = 0
+
+    def __len__(self) -> int:
+        return self._head - self._tail
+
+    @property
+    def pushed(self) -> int:
+        return self._head
+
+    def push(self, time_ns: int, message: bytes) -> bool:
+        n = len(message)
+        if not 0 < n <= self.MAX_MESSAGE:
+            self.skipped += 1
+            return False
+        head = self._head
+        if head - self._tail >= self.size:
+            self.dropped += 1
+            return False
+        i = head % self.size
+        j = i * self.MAX_MESSAGE
+        self._times[i] = time_ns
+        self._data[j:j + n] = message
+        self._lengths[i] = n
+        self._head = head + 1       # publish only once the slot is written
+        return True
+
+    def drain(self) -> list[tuple[int, bytes]]:
+        """Take every buffered (time_ns, message), oldest first."""
+        head = self._head
+        events = []
+        for k in range(self._tail, head):
+            i = k % self.size
+            j = i * self.MAX_MESSAGE
+            events.append((self._times[i], bytes(self._data[j:j + self._lengths[i]])))
+        self._tail = head
+        return events
+
+
+class SyntheticSource:
+    """
+    Event source for benchmarks: note on/off pairs at `rate` events per
+    second (0 = as fast as possible), `count` events in total.
+    """
+
+    def __init__(self, rate: float = 1000.0, count: int | None = None, channel: int = 0):
+        self.rate = rate
+        self.count = count
+        self.channel = channel
+        self.sent = 0
+        self.done = threading.Event()
+        self._start: int | None = None
+
+    def read(self, timeout: float | None = None) -> tuple[int, bytes] | None:
+        if self.count is not None and self.sent >= self.count:
+            self.done.set()
+            time.sleep(timeout or 0)
+            return None
+        if self._start is None:
+            self._start = time.monotonic_ns()
+        if self.rate:
+            # Paced against the start, so sleep overshoot doesn't add up
+            due = self._start + int(self.sent * 1e9 / self.rate)
+            wait = due - time.monotonic_ns()
+            if wait > 0:
+                time.sleep(wait / 1e9)
+        note = 36 + self.sent // 2 % 61
+        if self.sent % 2:
+            message = smf.note_off(self.channel, note)
+        else:
+            message = smf.note_on(self.channel, note, 64 + self.sent % 64)
+        self.sent += 1
+        return time.monotonic_ns(), message
+
+    def close(self):
+        self.done.set()
+
+
+class MidiCapture:
+    """Streams controller input into SMF takes."""
+
+    def __init__(self, source=None, directory: str | None = None, ring_size: int | None = None):
+        """
+        Args:
+            source: Event source with read(timeout) -> (time_ns, bytes) | None
+                (alsa_seq.CaptureSequencer or SyntheticSource). None = open
+                the ALSA sequencer on start().
+            directory: Where takes are written (default CAPTURE_DIR)
+            ring_size: Events buffered between reader and writer
+                (default CAPTURE_RING_SIZE)
+        """
+        self._source = source
+        self.directory = directory or config.CAPTURE_DIR
+        self.ring = EventRing(ring_size or config.CAPTURE_RING_SIZE)
+        self._wake = threading.Event()
+        self._running = False
+        self._reader = None
+        self._writer = None
+        self._take: smf.StreamWriter | None = None
+        self._take_start = 0
+        self._last_event = 0
+        self.takes = 0
+        self.written = 0
+
+    @property
+    def address(self) -> tuple[int, int] | None:
+        """Sequencer port to subscribe controllers to (None for synthetic sources)."""
+        return getattr(self._source, "address", None)
+
+    @property
+    def recording(self) -> str | None:
+        """Path of the take being written, if any."""
+        take = self._take
+        return take.path if take is not None else None
+
+    def start(self) -> bool:
+        if self._source is None:
+            self._source = alsa_seq.open_capture_sequencer()
+            if self._source is None:
+                return False
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+        except OSError as e:
+            log.error("MIDI capture disabled, can't create %s: %s", self.directory, e)
+            return False
+
+        self._running = True
+        self._reader = threading.Thread(target=self._read_loop, name="capture-read", daemon=True)
+        self._writer = threading.Thread(target=self._write_loop, name="capture-write", daemon=True)
+        self._reader.start()
+        self._writer.start()
+        log.info("MIDI capture started (recording to %s)", self.directory)
+        return True
+
+    def stop(self):
+        """Stop reading, write out what is buffered and close the take."""
+        self._running = False
+        self._wake.set()
+        for thread in (self._reader, self._writer):
+            if thread:
+                thread.join(timeout=5)
+        self._reader = self._writer = None
+        if self._source is not None:
+            self._source.close()
+
+    def stats(self) -> dict:
+        return {
+            "recording": self.recording,
+            "takes": self.takes,
+            "events": self.written,
+            "buffered": len(self.ring),
+            "dropped": self.ring.dropped,
+            "skipped": self.ring.skipped,
+            "ring_size": self.ring.size,
+        }
+
+    # --- Reader ----------------------------------------------------------------
+
+    def _read_loop(self):
+        source, ring, wake = self._source, self.ring, self._wake
+        half = ring.size // 2
+        while self._running:
+            try:
+                event = source.read(timeout=0.5)
+            except Exception as e:
+                log.error("MIDI capture stopped: %s", e)
+                return
+            if event is not None and ring.push(*event) and len(ring) == half:
+                wake.set()
+
+    # --- Writer ----------------------------------------------------------------
+
+    def _write_loop(self):
+        while self._running:
+            self._wake.wait(config.CAPTURE_FLUSH_INTERVAL)
+            self._wake.clear()
+            self._flush()
+        self._flush()
+        self._end_take()
+
+    def _flush(self):
+        events = self.ring.drain()
+        gap = int(config.CAPTURE_IDLE_GAP * 1e9)
+        if not events:
+            if self._take is not None and time.monotonic_ns() - self._last_event > gap:
+                self._end_take()
+            return
+
+        try:
+            for time_ns, message in events:
+                if self._take is not None and time_ns - self._last_event > gap:
+                    self._end_take()
+                if self._take is None:
+                    self._begin_take(time_ns)
+                ticks = (time_ns - self._take_start) * _TICKS_PER_SECOND // 1_000_000_000
+                self._take.add(ticks, message)
+                self._last_event = time_ns
+            self._take.flush()
+            self.written += len(events)
+        except OSError as e:
+            log.error("Could not write MIDI take %s: %s", self.recording, e)
+            self._end_take()
+
+    def _begin_take(self, time_ns: int):
+        stamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+        path = os.path.join(self.directory, f"take-{stamp}.mid")
+        n = 1
+        while os.path.exists(path):
+            n += 1
+            path = os.path.join(self.directory, f"take-{stamp}-{n}.mid")
+        self._take = smf.StreamWriter(path, division=CAPTURE_DIVISION)
+        self._take_start = time_ns
+        self.takes += 1
+        log.info("Recording MIDI take %s", path)
+
+    def _end_take(self):
+        take, self._take = self._take, None
+        if take is None:
+            return
+        try:
+            take.close()
+            log.info("MIDI take %s done (%d events)", take.path, take.events - 1)
+        except OSError as e:
+            log.error("Could not finish MIDI take %s: %s", take.path, e)
@@ -3,86 +3,81 @@ Piano Pi Brain — MIDI Monitor
 
 Watches for USB MIDI controllers connecting/disconnecting.
 Auto-connects new MIDI devices to FluidSynth via aconnect.
+
+Hotplug is event-driven when the ALSA sequencer API is available (see
+alsa_seq.py); otherwise `aconnect -l` is polled every MIDI_POLL_INTERVAL.
+Taps (the recording port, see midi_capture.py) get every controller too.
+While diverted (the arpeggiator), controllers go to the divert port
+instead of FluidSynth.
 """
 
 import logging
-import re
 import subprocess
 import threading
 import time
 
+import alsa_seq
 import config
+import metrics
+import topology
+import tracing
 
 log = logging.getLogger(__name__)
 
 # FluidSynth's ALSA sequencer client name
-FLUIDSYNTH_CLIENT = "FLUID Synth"
+FLUIDSYNTH_CLIENT = topology.FLUIDSYNTH_CLIENT
 
 
 def list_midi_clients() -> list[dict]:
     """
-    Parse `aconnect -l` output to find MIDI input clients.
+    Find MIDI input clients in the current sequencer topology.
     Returns list of {"id": "20", "name": "MPK mini 3"} dicts.
 
     We skip system clients (id 0 = System, id 14 = Midi Through)
     and FluidSynth itself.
     """
-    try:
-        result = subprocess.run(
-            ["aconnect", "-l"],
-            capture_output=True, text=True, timeout=5
-        )
-    except (FileNotFoundError, subprocess.TimeoutExpired):
-        return []
-
-    clients = []
-    for line in result.stdout.splitlines():
-        # Lines look like: "client 20: 'MPK mini 3' [type=kernel,card=1]"
-        match = re.match(r"^client\s+(\d+):\s+'(.+?)'\s+\[(.+?)\]", line)
-        if not match:
-            continue
+    return [
+        {"id": str(c.id), "name": c.name}
+        for c in topology.take_snapshot().controllers()
+    ]
 
-        client_id = match.group(1)
-        client_name = match.group(2)
-        client_info = match.group(3)
 
-        # Skip system ports and FluidSynth itself
-        if int(client_id) in (0, 14):
-            continue
-        if FLUIDSYNTH_CLIENT in client_name:
-            continue
+def find_fluidsynth_port() -> str | None:
+    """Find FluidSynth's ALSA sequencer client ID."""
+    client = topology.take_snapshot().find_fluidsynth()
+    return str(client.id) if client else None
 
-        clients.append({"id": client_id, "name": client_name})
 
-    return clients
+def disconnect_midi(source_id, dest_id, source_port=0, dest_port=0) -> bool:
+    """Remove a subscription via aconnect -d."""
+    src, dst = f"{source_id}:{source_port}", f"{dest_id}:{dest_port}"
+    try:
+        with tracing.span("aconnect -d", "midi", src=src, dst=dst):
+            result = subprocess.run(
+                ["aconnect", "-d", src, dst],
+                capture_output=True, text=True, timeout=5
+            )
+        if result.returncode == 0:
+            log.info("Disconnected MIDI %s -> %s", src, dst)
+            return True
+        log.warning("aconnect -d failed: %s", result.stderr.strip())
+        return False
+    except Exception as e:
+        log.error("aconnect error: %s", e)
+        return False
 
 
-def find_fluidsynth_port() -> str | None:
-    """Find FluidSynth's ALSA sequencer client ID."""
-    try:
-        result = subprocess.run(
-            ["aconnect", "-l"],
-            capture_output=True, text=True, timeout=5
-        )
-    except (FileNotFoundError, subprocess.TimeoutExpired):
-        return None
-
-    for line in result.stdout.splitlines():
-        match = re.match(r"^client\s+(\d+):\s+'(.+?)'", line)
-        if match and FLUIDSYNTH_CLIENT in match.group(2):
-            return match.group(1)
-    return None
-
-
-def connect_midi(source_id: str, dest_id: str) -> bool:
-    """Connect a MIDI source to a destination via aconnect."""
+def connect_midi(source_id, dest_id, source_port=0, dest_port=0) -> bool:
+    """Connect a MIDI source port to a destination port via aconnect."""
+    src, dst = f"{source_id}:{source_port}", f"{dest_id}:{dest_port}"
     try:
-        result = subprocess.run(
-            ["aconnect", f"{source_id}:0", f"{dest_id}:0"],
-            capture_output=True, text=True, timeout=5
-        )
+        with tracing.span("aconnect", "midi", src=src, dst=dst):
+            result = subprocess.run(
+                ["aconnect", src, dst],
+                capture_output=True, text=True, timeout=5
+            )
         if result.returncode == 0:
-            log.info("Connected MIDI %s:0 -> %s:0", source_id, dest_id)
+            log.info("Connected MIDI %s -> %s", src, dst)
             return True
         else:
             log.warning("aconnect failed: %s", result.stderr.strip())
@@ -93,17 +88,32 @@ def connect_midi(source_id: str, dest_id: str) -> bool:
 
 
 class MidiMonitor:
-    """Polls for MIDI devices and auto-connects them to FluidSynth."""
+    """Watches for MIDI devices and auto-connects them to FluidSynth."""
 
-    def __init__(self, on_midi_connected=None, on_midi_disconnected=None):
+    def __init__(self, on_midi_connected=None, on_midi_disconnected=None,
+                 sequencer=None, synth_ident=None):
         """
         Args:
             on_midi_connected: Callback(name: str) when a MIDI device is connected
             on_midi_disconnected: Callback() when all MIDI devices disconnect
+            sequencer: Announce event source (alsa_seq.AnnounceSequencer or
+                FakeSequencer). None = open the ALSA sequencer on start()
+                unless MIDI_HOTPLUG_BACKEND is "poll".
+            synth_ident: Callable returning the sequencer id of the FluidSynth
+                instance to route to (None while it is down). Without it,
+                the first FluidSynth client found is used.
         """
         self._on_connected = on_midi_connected
         self._on_disconnected = on_midi_disconnected
         self._connected_ids: set[str] = set()
+        self._sequencer = sequencer
+        self._synth_ident = synth_ident
+        self._snapshot: topology.Snapshot | None = None
+        self._failed: set = set()
+        self._taps: set = set()
+        self._divert = None
+        self._undiverted: set = set()   # former divert ports, to unlink
+        self._lock = threading.Lock()
         self._thread = None
         self._running = False
 
@@ -112,35 +122,53 @@ class MidiMonitor:
         """True if at least one MIDI controller is connected."""
         return len(self._connected_ids) > 0
 
+    @property
+    def event_driven(self) -> bool:
+        """True if hotplug is driven by sequencer announcements."""
+        return self._sequencer is not None
+
     def start(self):
-        """Start background polling thread."""
+        """Start the background hotplug thread."""
+        if self._sequencer is None and config.MIDI_HOTPLUG_BACKEND != "poll":
+            self._sequencer = alsa_seq.open_announce_sequencer()
+
         self._running = True
-        self._thread = threading.Thread(target=self._poll_loop, daemon=True)
+        if self._sequencer is not None:
+            self._thread = threading.Thread(target=self._event_loop, daemon=True)
+            log.info("MIDI monitor started (ALSA announce events)")
+        else:
+            self._thread = threading.Thread(target=self._poll_loop, daemon=True)
+            log.info("MIDI monitor started (polling every %.1fs)", config.MIDI_POLL_INTERVAL)
         self._thread.start()
-        log.info("MIDI monitor started (polling every %.1fs)", config.MIDI_POLL_INTERVAL)
 
     def stop(self):
-        """Stop the polling thread."""
+        """Stop the hotplug thread."""
         self._running = False
         if self._thread:
             self._thread.join(timeout=5)
             self._thread = None
+        self._close_sequencer()
 
-    def connect_all(self):
-        """Try to connect all detected MIDI devices to FluidSynth now."""
-        fs_port = find_fluidsynth_port()
-        if not fs_port:
-            log.warning("FluidSynth not found in aconnect — can't connect MIDI")
-            return
+    def add_tap(self, addr: tuple[int, int]):
+        """Also route every controller to `addr` (e.g. the capture port) from the next rescan on."""
+        with self._lock:
+            self._taps.add(addr)
+
+    def divert(self, addr: tuple[int, int] | None):
+        """
+        Route controllers to `addr` instead of FluidSynth (None = back to
+        FluidSynth) from the next rescan on.
+        """
+        with self._lock:
+            if self._divert is not None and self._divert != addr:
+                self._undiverted.add(self._divert)
+            self._undiverted.discard(addr)
+            self._divert = addr
 
-        clients = list_midi_clients()
-        for client in clients:
-            if client["id"] not in self._connected_ids:
-                if connect_midi(client["id"], fs_port):
-                    self._connected_ids.add(client["id"])
-                    log.info("MIDI controller connected: %s", client["name"])
-                    if self._on_connected:
-                        self._on_connected(client["name"])
+    def connect_all(self):
+        """Route every detected MIDI device to FluidSynth now (missing links only)."""
+        with self._lock:
+            self._reconcile(force=True)
 
     def _poll_loop(self):
         """Background loop: detect plug/unplug events."""
@@ -151,26 +179,129 @@ class MidiMonitor:
                 log.error("MIDI poll error: %s", e)
             time.sleep(config.MIDI_POLL_INTERVAL)
 
-    def _poll_once(self):
+    def _event_loop(self):
+        """Background loop: rescan whenever the sequencer announces a change."""
+        while self._running:
+            try:
+                event = self._sequencer.read(timeout=1.0)
+                if event is None or event.kind not in alsa_seq.HOTPLUG_EVENTS:
+                    continue
+                announced = time.monotonic()
+                log.debug("Sequencer event: %s", event)
+                # A USB controller announces its client and each of its ports
+                # in quick succession; let the burst settle into one rescan.
+                self._drain_events()
+            except Exception as e:
+                log.error("ALSA sequencer error (%s) — falling back to polling", e)
+                self._close_sequencer()
+                self._poll_loop()
+                return
+
+            try:
+                self._poll_once(announced)
+            except Exception as e:
+                log.error("MIDI hotplug error: %s", e)
+
+    def _drain_events(self):
+        """Swallow announcements arriving within MIDI_HOTPLUG_SETTLE seconds."""
+        while self._sequencer.read(timeout=config.MIDI_HOTPLUG_SETTLE) is not None:
+            pass
+
+    def _close_sequencer(self):
+        if self._sequencer is not None:
+            self._sequencer.close()
+            self._sequencer = None
+
+    def _poll_once(self, announced: float | None = None):
         """Check for new or removed MIDI devices."""
-        current_clients = list_midi_clients()
-        current_ids = {c["id"] for c in current_clients}
-
-        # Detect new devices
-        new_ids = current_ids - self._connected_ids
-        if new_ids:
-            fs_port = find_fluidsynth_port()
-            if fs_port:
-                for client in current_clients:
-                    if client["id"] in new_ids:
-                        if connect_midi(client["id"], fs_port):
-                            self._connected_ids.add(client["id"])
-                            log.info("MIDI hotplug: %s", client["name"])
-                            if self._on_connected:
-                                self._on_connected(client["name"])
+        with self._lock:
+            self._reconcile(announced=announced)
+
+    def _reconcile(self, force=False, announced: float | None = None):
+        """
+        Take one topology snapshot and bring the routing up to date.
+
+        Unless `force`d, nothing happens when the snapshot is identical to
+        the previous one. Only subscriptions that don't already exist are
+        requested from aconnect. `announced` is when the hotplug event
+        that triggered this arrived; the time until the first new link is
+        recorded as hotplug latency.
+        """
+        snap = topology.take_snapshot()
+        diff = snap.diff(self._snapshot)
+        self._snapshot = snap
+        if not diff and not force:
+            return
+
+        # Forget failed links for ports that went away or came back
+        self._failed = {
+            link for link in self._failed
+            if link[0] in snap.clients and link[0] not in diff.added_clients
+        }
+
+        if self._synth_ident is None:
+            fs = snap.find_fluidsynth()
+        else:
+            ident = self._synth_ident()
+            fs = snap.find_fluidsynth(ident) if ident else None
+        fs_addr = snap.input_port(fs) if fs else None
+        # Any other FluidSynth (e.g. the hot standby) must not get our MIDI
+        others = {snap.input_port(c) for c in snap.fluidsynth_clients() if c is not fs}
+        if fs is None and force:
+            log.warning("FluidSynth not found in sequencer — can't connect MIDI")
+        if self._divert is not None:
+            # The divert port (arpeggiator) plays to FluidSynth itself
+            if fs_addr is not None:
+                others.add(fs_addr)
+            fs_addr = self._divert
+        others |= self._undiverted
+
+        # Our own clients look like controllers when caps are unknown
+        own = {tap[0] for tap in self._taps} | {addr[0] for addr in self._undiverted}
+        if self._divert is not None:
+            own.add(self._divert[0])
+        current = {str(c.id): c for c in snap.controllers() if c.id not in own}
+
+        # Detect new devices and missing links
+        for cid, client in current.items():
+            routed = False
+            for port in snap.source_ports(client):
+                src = (client.id, port.port)
+                for dst in port.connects_to & others:
+                    disconnect_midi(client.id, dst[0], port.port, dst[1])
+                if fs_addr is None:
+                    break
+                if snap.is_connected(src, fs_addr):
+                    routed = True
+                    continue
+                if (client.id, port.port, fs_addr) in self._failed:
+                    continue
+                if connect_midi(client.id, fs_addr[0], port.port, fs_addr[1]):
+                    routed = True
+                    if announced is not None:
+                        metrics.observe("hotplug", time.monotonic() - announced)
+                        announced = None
+                else:
+                    self._failed.add((client.id, port.port, fs_addr))
+
+            if routed and cid not in self._connected_ids:
+                self._connected_ids.add(cid)
+                log.info("MIDI controller connected: %s", client.name)
+                if self._on_connected:
+                    self._on_connected(client.name)
+
+        # Taps only after every FluidSynth link, so they never delay one
+        for client in current.values():
+            for port in snap.source_ports(client):
+                for tap in self._taps:
+                    link = (client.id, port.port, tap)
+                    if snap.is_connected((client.id, port.port), tap) or link in self._failed:
+                        continue
+                    if not connect_midi(client.id, tap[0], port.port, tap[1]):
+                        self._failed.add(link)
 
         # Detect removed devices
-        removed_ids = self._connected_ids - current_ids
+        removed_ids = self._connected_ids - current.keys()
         if removed_ids:
             self._connected_ids -= removed_ids
             log.info("MIDI device(s) removed: %s", removed_ids)
@@ -4,10 +4,10 @@ Piano Pi Brain — Main Orchestrator
 
 Entry point that ties everything together:
   1. Initialize LED (blink = starting)
-  2. Start FluidSynth
-  3. Start MIDI monitor (auto-connect controllers)
-  4. Initialize buttons
-  5. LED solid = ready, sit in main loop
+  2. In parallel (see boot.py): load FluidSynth, start the web portal,
+     set up the buttons, start the MIDI monitor
+  3. Once FluidSynth is ready: route MIDI controllers, then watch for crashes
+  4. LED solid = ready, sit in main loop
 
 Usage:
     python3 piano_pi.py
@@ -20,11 +20,24 @@ import subprocess
 import sys
 import time
 
+import boot
+import config
+import config_reload
+import metrics
+from config_reload import ConfigReloader
+from controller import Controller
 from leds import StatusLEDs, State
 from synth import FluidSynthManager
 from midi_monitor import MidiMonitor
+from midi_capture import MidiCapture
+from metronome import Metronome
+from arpeggiator import Arpeggiator
+from player import Player
+from scheduler import Scheduler
+from restart import RestartSequence
+from supervisor import Supervisor
 from buttons import ButtonHandler
-from web_server import create_app, start_server, broadcast_event
+from web_server import create_app, start_server, broadcast_event, publish_state
 
 # ---------------------------------------------------------------------------
 # Logging
@@ -32,7 +45,7 @@ from web_server import create_app, start_server, broadcast_event
 
 logging.basicConfig(
     level=logging.INFO,
-    format="%(asctime)s [%(name)s] %(levelname)s: %(message)s",
+    format="%(asctime)s.%(msecs)03d [%(name)s] %(levelname)s: %(message)s",
     datefmt="%H:%M:%S",
 )
 log = logging.getLogger("piano-pi")
@@ -45,82 +58,168 @@ leds: StatusLEDs = None
 synth: FluidSynthManager = None
 midi: MidiMonitor = None
 buttons: ButtonHandler = None
+controller: Controller = None
+restarter: RestartSequence = None
+supervisor: Supervisor = None
+capture: MidiCapture = None
+scheduler: Scheduler = None
+metronome: Metronome = None
+arp: Arpeggiator = None
+player: Player = None
+reloader: ConfigReloader = None
 
 
 def main():
-    global leds, synth, midi, buttons
+    startup()
+
+    log.info("Ready! Waiting for input...")
+
+    # --- Main loop: just keep alive, everything is event-driven ---
+    try:
+        while True:
+            # Crashes are handled by the supervisor the moment they happen;
+            # this just replaces a standby that died or was promoted
+            synth.ensure_standby()
+            publish_state(synth, midi)
+
+            time.sleep(5)
+
+    except KeyboardInterrupt:
+        log.info("Keyboard interrupt — shutting down")
+        cleanup()
+
+
+def startup(web_port=8080, install_signals=True):
+    """
+    Bring up every component (LEDs, FluidSynth, MIDI, buttons, web).
+
+    Args:
+        web_port: Port for the web portal; None = build the app but don't listen
+        install_signals: Install SIGTERM/SIGINT handlers (main thread only)
+
+    Returns the Flask app.
+    """
+    global leds, synth, midi, controller, restarter, supervisor, capture
+    global scheduler, metronome, arp, player, reloader
 
     log.info("=" * 50)
     log.info("  Piano Pi Brain — Starting up")
     log.info("=" * 50)
 
-    # --- LEDs ---
+    # --- LEDs (first, so there is feedback while everything else loads) ---
     leds = StatusLEDs()
     leds.set_state(State.STARTING)
 
-    # --- FluidSynth ---
-    synth = FluidSynthManager()
-
-    if not synth.start():
-        log.error("Failed to start FluidSynth!")
-        leds.set_state(State.ERROR)
-        # Keep running so buttons still work for restart
-    else:
-        log.info("FluidSynth started — instrument: %s", synth.get_current_instrument())
-
-    # --- MIDI Monitor ---
+    # --- Components (cheap to create; the work happens in the phases) ---
+    synth = FluidSynthManager(on_state_change=on_synth_state)
+    # Control actor: every synth action runs on its thread
+    controller = Controller(synth, restart_fn=restart, on_instrument=on_instrument_changed)
+    controller.start()
     midi = MidiMonitor(
         on_midi_connected=on_midi_connected,
         on_midi_disconnected=on_midi_disconnected,
+        synth_ident=lambda: synth.seq_ident,
     )
-    # Try to connect any already-plugged-in controllers
-    midi.connect_all()
-    midi.start()
-
-    # Update LED based on MIDI state
-    if synth.is_running:
-        if midi.has_midi:
-            leds.set_state(State.READY)
-        else:
-            leds.set_state(State.READY_NO_MIDI)
-
-    # --- Buttons ---
-    buttons = ButtonHandler(
-        on_restart=on_restart,
-        on_shutdown=on_shutdown,
-        on_next_instrument=on_next_instrument,
-        on_prev_instrument=on_prev_instrument,
-        on_reset_instrument=on_reset_instrument,
+    # Its phases that change the synth run on the control actor
+    restarter = RestartSequence(synth, midi, on_progress=on_restart_progress,
+                                actor=lambda fn, *args: controller.call(fn, *args).result())
+    # Crash supervision (instant exit notification, backoff, breaker)
+    supervisor = Supervisor(
+        synth,
+        restart_fn=controller.restart,
+        busy_fn=lambda: controller.restart_pending,
+        on_crash=on_synth_crash,
     )
+    if config.CAPTURE_ENABLED:
+        capture = MidiCapture()
+    # Timed output (metronome, arpeggiator, backing tracks) queued ahead on
+    # the ALSA sequencer
+    scheduler = Scheduler(synth_ident=lambda: synth.seq_ident)
+    metronome = Metronome(scheduler, on_change=on_metronome_changed)
+    arp = Arpeggiator(scheduler, on_route=route_arp, on_change=on_arp_changed)
+    player = Player(scheduler, on_change=on_player_changed)
+    # config.py edits applied live (see config_reload.py)
+    reloader = ConfigReloader(on_apply=apply_config)
 
     # --- Signal handlers for clean exit ---
-    signal.signal(signal.SIGTERM, shutdown_signal)
-    signal.signal(signal.SIGINT, shutdown_signal)
+    if install_signals:
+        signal.signal(signal.SIGTERM, shutdown_signal)
+        signal.signal(signal.SIGINT, shutdown_signal)
 
-    # --- Web Portal ---
-    app = create_app(synth, midi, leds, on_restart, on_shutdown)
-    start_server(app, port=8080)
+    app = None
 
-    log.info("Ready! Waiting for input...")
+    def start_synth():
+        if not synth.start():
+            log.error("Failed to start FluidSynth!")
+            # Keep running so buttons still work for restart
+            return False
+        log.info("FluidSynth started — instrument: %s", synth.get_current_instrument())
+        return True
+
+    def start_web():
+        nonlocal app
+        app = create_app(synth, midi, leds, controller, on_shutdown, supervisor, capture,
+                         metronome, arp, player, reloader)
+        publish_state(synth, midi)
+        if web_port is not None:
+            start_server(app, port=web_port)
+
+    def start_buttons():
+        global buttons
+        buttons = ButtonHandler(
+            on_restart=on_restart,
+            on_shutdown=on_shutdown,
+            on_next_instrument=on_next_instrument,
+            on_prev_instrument=on_prev_instrument,
+            on_reset_instrument=on_reset_instrument,
+            on_metronome=on_metronome,
+            on_arp=on_arp,
+        )
+
+    def start_scheduler():
+        if not scheduler.start():
+            log.info("Metronome unavailable (no ALSA sequencer)")
+        publish_state(synth, midi, metronome=metronome.state(), arp=arp.state(),
+                      player=player.state())
+
+    def start_capture():
+        if capture is None:
+            return True
+        if not capture.start():
+            return False
+        # Subscribes the capture port next to FluidSynth (after its links)
+        midi.add_tap(capture.address)
+        midi.connect_all()
+        return True
+
+    def on_boot_phase(name, trace):
+        publish_state(synth, midi, boot=trace)
+
+    pipeline = boot.BootPipeline(playable_after=("synth", "midi_connect"),
+                                 on_phase=on_boot_phase)
+    pipeline.add("synth", start_synth)
+    pipeline.add("web", start_web)
+    pipeline.add("buttons", start_buttons)
+    # Opens the announce sequencer and takes the first topology snapshot;
+    # nothing gets routed while FluidSynth is still down
+    pipeline.add("midi", midi.start)
+    pipeline.add("metrics", lambda: metrics.start_sampler(synth))
+    pipeline.add("scheduler", start_scheduler)
+    # Try to connect any already-plugged-in controllers
+    pipeline.add("midi_connect", midi.connect_all, after=("synth", "midi"))
+    pipeline.add("capture", start_capture, after=("midi",))
+    if config.CONFIG_WATCH:
+        pipeline.add("config_watch", reloader.start)
+    trace = pipeline.run()
 
-    # --- Main loop: just keep alive, everything is event-driven ---
-    try:
-        while True:
-            # Periodic health check on FluidSynth
-            if not synth.is_running:
-                log.warning("FluidSynth died — auto-restarting...")
-                leds.set_state(State.STARTING)
-                if synth.restart():
-                    midi.connect_all()
-                    update_led_state()
-                else:
-                    leds.set_state(State.ERROR)
+    # Only now: while the soundfont loads, "not running" isn't a crash
+    supervisor.start()
+    # Update LED based on synth + MIDI state
+    update_led_state()
+    publish_state(synth, midi, boot=trace)
+    boot.write_trace(trace, config.BOOT_TRACE_FILE)
 
-            time.sleep(5)
-
-    except KeyboardInterrupt:
-        log.info("Keyboard interrupt — shutting down")
-        cleanup()
+    return app
 
 
 # ---------------------------------------------------------------------------
@@ -130,31 +229,53 @@ def main():
 def on_midi_connected(name: str):
     """Called when a MIDI controller is plugged in."""
     log.info("🎹 MIDI connected: %s", name)
-    if synth.is_running:
-        leds.set_state(State.READY)
+    controller.call(_midi_changed, State.READY)
 
 
 def on_midi_disconnected():
     """Called when all MIDI controllers are unplugged."""
     log.info("🎹 MIDI disconnected")
+    controller.call(_midi_changed, State.READY_NO_MIDI)
+
+
+def _midi_changed(state: State):
     if synth.is_running:
-        leds.set_state(State.READY_NO_MIDI)
+        leds.set_state(state)
+    publish_state(synth, midi)
 
 
 def on_restart():
     """Button 1 short press — restart FluidSynth."""
-    log.info("🔄 Restarting FluidSynth...")
-    leds.set_state(State.STARTING)
+    supervisor.reset()
+    controller.restart()
 
-    if synth.restart():
-        # Re-connect MIDI devices after restart
-        time.sleep(1)
-        midi.connect_all()
+
+def restart():
+    """Start the restart sequence (runs on its own thread, see restart.py)."""
+    return restarter.start()
+
+
+def on_restart_progress(report: dict):
+    """Restart phase started/done/failed — LEDs and a "restart" event for the UI."""
+    if report["status"] == "started" and report["phase"] in ("stopping", "switching"):
+        leds.set_state(State.STARTING)
+    if report.get("final"):
         update_led_state()
-        log.info("✅ Restart complete — instrument: %s", synth.get_current_instrument())
-    else:
+        publish_state(synth, midi)
+    broadcast_event("restart", report)
+
+
+def on_synth_state(state: str):
+    """FluidSynth started or stopped — point the supervisor at the new instance."""
+    if supervisor:
+        supervisor.rearm()
+
+
+def on_synth_crash(crash, tripped: bool):
+    """FluidSynth exited unexpectedly (see supervisor.py)."""
+    if tripped:
         leds.set_state(State.ERROR)
-        log.error("❌ Restart failed!")
+    broadcast_event("crash", {**crash._asdict(), "tripped": tripped})
 
 
 def on_shutdown():
@@ -167,24 +288,98 @@ def on_shutdown():
 
 
 def on_next_instrument():
-    """Button 2 short press — next instrument."""
-    name = synth.next_instrument()
-    log.info("🎵 Next instrument: %s", name)
-    broadcast_event("instrument", {"name": name, "index": synth._current_instrument_index})
+    """
+    Button 2 short press — next instrument (faster while the metronome
+    runs, next pattern while the arpeggiator is on).
+    """
+    if metronome.active:
+        metronome.nudge(config.METRONOME_BPM_STEP)
+    elif arp.enabled:
+        arp.next_pattern(1)
+    else:
+        controller.next_instrument(source="button")
 
 
 def on_prev_instrument():
-    """Button 3 — previous instrument."""
-    name = synth.prev_instrument()
-    log.info("🎵 Previous instrument: %s", name)
-    broadcast_event("instrument", {"name": name, "index": synth._current_instrument_index})
+    """
+    Button 3 short press — previous instrument (slower while the metronome
+    runs, previous pattern while the arpeggiator is on).
+    """
+    if metronome.active:
+        metronome.nudge(-config.METRONOME_BPM_STEP)
+    elif arp.enabled:
+        arp.next_pattern(-1)
+    else:
+        controller.prev_instrument(source="button")
 
 
 def on_reset_instrument():
-    """Button 2 hold — reset to core piano (instrument 0)."""
-    name = synth.reset_instrument()
-    log.info("🎹 Reset to core: %s", name)
-    broadcast_event("instrument", {"name": name, "index": 0})
+    """Button 2 hold — reset to core piano (next time signature, while the metronome runs)."""
+    if metronome.active:
+        metronome.next_preset()
+        return
+    controller.reset_instrument(source="button")
+
+
+def on_metronome():
+    """Button 3 hold — metronome on/off."""
+    metronome.toggle()
+
+
+def on_metronome_changed(state: dict):
+    publish_state(synth, midi, metronome=state)
+
+
+def on_arp():
+    """Button 3 long hold — arpeggiator on/off."""
+    if not arp.toggle():
+        log.warning("Arpeggiator unavailable (no ALSA sequencer)")
+
+
+def route_arp(address):
+    """Send the controllers to the arpeggiator (or, for None, back to FluidSynth)."""
+    midi.divert(address)
+    midi.connect_all()
+
+
+def on_arp_changed(state: dict):
+    publish_state(synth, midi, arp=state)
+
+
+def on_player_changed(state: dict):
+    publish_state(synth, midi, player=state)
+
+
+def apply_config(changed: set) -> dict:
+    """
+    Apply reloaded settings that aren't simply read where they're used
+    (see config_reload.py). FluidSynth restarts only for a new command,
+    backend, bank offsets or sample loading mode, or a soundfont that
+    doesn't fit in memory next to the loaded ones (a restart frees those
+    first).
+    """
+    restart = bool(changed & config_reload.SYNTH_KEYS)
+    if not restart and changed & config_reload.INSTRUMENT_KEYS:
+        future = controller.call(synth.reload_instruments)
+        restart = not future.result(timeout=config.CONTROL_ACTION_TIMEOUT)
+    if "DEBOUNCE_SECONDS" in changed and buttons:
+        buttons.set_debounce(config.DEBOUNCE_SECONDS)
+    if restart:
+        # The standby was launched with the old settings
+        synth.discard_standby()
+        supervisor.reset()
+        controller.restart()
+    publish_state(synth, midi)
+    report = {"synth_restart": restart}
+    broadcast_event("config", {"changed": sorted(changed), **report})
+    return report
+
+
+def on_instrument_changed(name: str, index: int):
+    """Called by the controller once an instrument change is applied."""
+    log.info("🎵 Instrument: %s", name)
+    publish_state(synth, midi)
+    broadcast_event("instrument", {"name": name, "index": index})
 
 
 def update_led_state():
@@ -211,8 +406,23 @@ def shutdown_signal(signum, frame):
 def cleanup():
     """Stop everything gracefully."""
     log.info("Cleaning up...")
+    metrics.stop_sampler()
+    if reloader:
+        reloader.stop()
+    if supervisor:
+        supervisor.stop()
     if midi:
         midi.stop()
+    if capture:
+        capture.stop()
+    if arp:
+        arp.close()
+    if player:
+        player.stop()
+    if scheduler:
+        scheduler.stop()
+    if controller:
+        controller.stop()
     if synth:
         synth.stop()
     if buttons:
@@ -0,0 +1,330 @@
+"""
+Piano Pi Brain — Backing-Track Player
+
+Plays .mid files from PLAYER_DIR to practise along with. The file is
+streamed (smf.Reader): nothing but the header and the chunk table is
+read before the first notes go out, and memory stays flat however long
+the file is. Events are handed to the scheduler (see scheduler.py) one
+lookahead window at a time with absolute timestamps.
+
+File channels are moved off the ones the keyboard plays on
+(MIDI_CHANNELS), in order of first use, so a backing track never changes
+the live instrument; the drum channel (10, 0-based 9) stays where it is.
+
+Song time maps linearly to the clock from an anchor (song seconds ->
+monotonic ns) scaled by the tempo factor, so tempo changes and loops
+don't drift. Seeking re-reads the file up to the new position, keeping
+the last program, controllers and pitch bend per channel so the sound is
+right from the first note.
+"""
+
+import logging
+import os
+import threading
+import time
+
+import config
+import smf
+
+log = logging.getLogger(__name__)
+
+DRUM_CHANNEL = 9
+
+_CC_SUSTAIN = 64
+_CC_ALL_NOTES_OFF = 123
+
+
+class Player:
+    """Streams a MIDI file to FluidSynth; a scheduler source."""
+
+    def __init__(self, scheduler, directory: str | None = None, on_change=None):
+        """
+        Args:
+            scheduler: Scheduler that queues the events
+            directory: Where playable files live (default PLAYER_DIR)
+            on_change: Callback(state: dict) after every change
+        """
+        self._scheduler = scheduler
+        self.directory = directory or config.PLAYER_DIR
+        self._on_change = on_change
+        self._lock = threading.Lock()
+        # load/play/stop/seek come from web requests and the controller at
+        # once; each runs start to finish before the next
+        self._control_lock = threading.RLock()
+        self.file: str | None = None
+        self.playing = False
+        self.loop = False
+        self.tempo = 1.0                # speed factor
+        self.duration: float | None = None
+        self._reader: smf.Reader | None = None
+        self._events = None
+        self._next = None               # the first event not yet queued
+        self._clock = smf.Clock()
+        self._last_tick = 0
+        self._position = 0.0            # song seconds while stopped
+        self._anchor_ns = 0             # song second `_anchor_s` plays at `_anchor_ns`
+        self._anchor_s = 0.0
+        self._queued_ns = 0             # everything before this has been queued
+        self._channels: dict[int, int] = {}     # file channel -> FluidSynth channel
+        self._used: set[int] = set()            # FluidSynth channels played on
+        self._free: list[int] = []              # channels to move the file's to
+        scheduler.add(self)
+
+    @property
+    def active(self) -> bool:
+        return self.playing
+
+    # --- Control -----------------------------------------------------------------
+
+    def files(self) -> list[str]:
+        try:
+            return sorted(name for name in os.listdir(self.directory)
+                          if name.lower().endswith((".mid", ".midi")))
+        except OSError:
+            return []
+
+    def load(self, name: str):
+        """Open `name` from the player directory. Raises ValueError / OSError."""
+        with self._control_lock:
+            if name != os.path.basename(name) or name not in self.files():
+                raise ValueError(f"no such file: {name}")
+            # Per file, so a reloaded MIDI_CHANNELS applies from the next one
+            free = [c for c in range(16) if c not in config.MIDI_CHANNELS and c != DRUM_CHANNEL]
+            if not free:
+                raise ValueError("MIDI_CHANNELS leaves no channel for a backing track")
+            reader = smf.Reader(os.path.join(self.directory, name))
+            self.stop()
+            with self._lock:
+                self._reader = reader
+                self.file = name
+                self.duration = None
+                self._position = 0.0
+                self._channels.clear()
+                self._free = free
+                self._rewind()
+            threading.Thread(target=self._measure, args=(reader,), daemon=True).start()
+            log.info("Backing track loaded: %s (format %d, %d tracks)",
+                     name, reader.format, len(reader.tracks))
+            self._changed()
+
+    def play(self):
+        """Start (or resume) from the current position."""
+        with self._control_lock:
+            if self._reader is None:
+                raise ValueError("no file loaded")
+            if self.playing:
+                return
+            chase = self._prepare(self._position)
+            self._start(chase)
+            log.info("Backing track playing: %s from %.1fs", self.file, self._position)
+            self._changed()
+
+    def stop(self):
+        """Stop, remembering the position (play() resumes there)."""
+        with self._control_lock:
+            with self._lock:
+                if not self.playing:
+                    return
+                self._position = self._song_seconds(time.monotonic_ns())
+                self.playing = False
+            self._silence()
+            self._changed()
+
+    def seek(self, seconds: float):
+        with self._control_lock:
+            seconds = float(seconds)
+            if seconds < 0 or (self.duration is not None and seconds > self.duration):
+                raise ValueError("position out of range")
+            if self._reader is None:
+                raise ValueError("no file loaded")
+            if not self.playing:
+                self._position = seconds
+                self._changed()
+                return
+            with self._lock:
+                self.playing = False
+            self._silence()
+            self._start(self._prepare(seconds))
+            self._changed()
+
+    def set(self, loop=None, tempo=None):
+        """Raises ValueError (nothing is changed) for an invalid tempo factor."""
+        if tempo is not None:
+            tempo = float(tempo)
+            if not 0.25 <= tempo <= 4.0:
+                raise ValueError("tempo must be 0.25–4.0")
+        with self._lock:
+            if loop is not None:
+                self.loop = bool(loop)
+            if tempo is not None and tempo != self.tempo:
+                # Re-anchor where queuing stopped; what's queued keeps the old tempo
+                pivot = max(self._queued_ns, self._anchor_ns)
+                self._anchor_s = self._song_seconds(pivot)
+                self._anchor_ns = pivot
+                self.tempo = tempo
+        self._changed()
+
+    def state(self) -> dict:
+        with self._lock:
+            position = self._song_seconds(time.monotonic_ns()) if self.playing else self._position
+        return {
+            "file": self.file,
+            "playing": self.playing,
+            "position": round(position, 2),
+            "duration": round(self.duration, 2) if self.duration is not None else None,
+            "loop": self.loop,
+            "tempo": self.tempo,
+            "files": self.files(),
+            "available": self._scheduler.available,
+        }
+
+    def _changed(self):
+        self._scheduler.wake()
+        if self._on_change:
+            try:
+                self._on_change(self.state())
+            except Exception as e:
+                log.error("Player callback failed: %s", e)
+
+    def _measure(self, reader: smf.Reader):
+        try:
+            duration = reader.duration()
+        except (OSError, ValueError) as e:
+            log.warning("Could not read %s to the end: %s", reader.path, e)
+            return
+        if self._reader is reader:
+            self.duration = duration
+            self._changed()
+
+    # --- Song position -------------------------------------------------------------
+
+    def _rewind(self):
+        """Back to the start of the file (lock held)."""
+        self._events = self._reader.events()
+        self._next = None
+        self._clock = smf.Clock(self._reader.division)
+        self._last_tick = 0
+
+    def _song_seconds(self, now_ns: int) -> float:
+        return max(0.0, self._anchor_s + (now_ns - self._anchor_ns) * self.tempo / 1e9)
+
+    def _due(self, seconds: float) -> int:
+        return self._anchor_ns + round((seconds - self._anchor_s) / self.tempo * 1e9)
+
+    def _prepare(self, seconds: float) -> list[bytes]:
+        """
+        Rewind and skip to `seconds`. Returns the program, controller and
+        pitch bend messages in effect there (already remapped).
+        """
+        chase: dict[tuple, bytes] = {}
+        with self._lock:
+            self._rewind()
+            while True:
+                event = self._fetch()
+                if event is None:
+                    break
+                tick, message = event
+                if self._clock.seconds(tick) >= seconds:
+                    break
+                self._next = None
+                message = self._apply(tick, message)
+                if message is None:
+                    continue
+                kind = message[0] & 0xF0
+                if kind == 0xB0:
+                    chase[(message[0], message[1])] = message
+                elif kind in (0xC0, 0xE0):
+                    chase[(message[0],)] = message
+            self._anchor_s = seconds
+        return list(chase.values())
+
+    def _start(self, chase: list[bytes]):
+        now = time.monotonic_ns()
+        with self._lock:
+            # After anything still queued from before (a seek while playing)
+            self._anchor_ns = max(now, self._queued_ns)
+            self._queued_ns = self._anchor_ns
+            self.playing = True
+            start = self._anchor_ns
+        if chase:
+            self._scheduler.send_at(start, *chase)
+
+    def _silence(self):
+        """Release everything the file is playing, after the events already queued."""
+        with self._lock:
+            channels = sorted(self._used)
+            self._used.clear()
+            due = max(time.monotonic_ns(), self._queued_ns)
+        messages = []
+        for ch in channels:
+            messages.append(smf.control_change(ch, _CC_SUSTAIN, 0))
+            messages.append(smf.control_change(ch, _CC_ALL_NOTES_OFF, 0))
+        if messages:
+            self._scheduler.send_at(due, *messages)
+
+    # --- Events --------------------------------------------------------------------
+
+    def _fetch(self):
+        """The next event of the file, or None at its end (lock held)."""
+        if self._next is None:
+            try:
+                self._next = next(self._events, None)
+            except (OSError, ValueError) as e:
+                log.error("Backing track %s: %s", self.file, e)
+                self._next = None
+        return self._next
+
+    def _apply(self, tick: int, message: bytes) -> bytes | None:
+        """Tempo changes update the clock; channel messages come back remapped (lock held)."""
+        self._last_tick = tick
+        status = message[0]
+        if status >= 0xF0:
+            tempo = smf.tempo_of(message)
+            if tempo:
+                self._clock.set_tempo(tick, tempo)
+            return None
+        return bytes([(status & 0xF0) | self._map(status & 0x0F)]) + message[1:]
+
+    def _map(self, channel: int) -> int:
+        if channel == DRUM_CHANNEL:
+            mapped = DRUM_CHANNEL
+        else:
+            mapped = self._channels.get(channel)
+            if mapped is None:
+                mapped = self._free[len(self._channels) % len(self._free)]
+                self._channels[channel] = mapped
+        self._used.add(mapped)
+        return mapped
+
+    def events_until(self, horizon_ns: int) -> list[tuple[int, bytes]]:
+        events = []
+        finished = False
+        with self._lock:
+            if not self.playing:
+                return events
+            while True:
+                event = self._fetch()
+                if event is None:
+                    end = self._clock.seconds(self._last_tick)
+                    if self.loop and end > 0:
+                        self._anchor_ns = self._due(end)
+                        self._anchor_s = 0.0
+                        self._rewind()
+                        continue
+                    self.playing = False
+                    self._position = 0.0
+                    finished = True
+                    break
+                tick, message = event
+                due = self._due(self._clock.seconds(tick))
+                if due >= horizon_ns:
+                    break
+                self._next = None
+                message = self._apply(tick, message)
+                if message is not None:
+                    events.append((due, message))
+            self._queued_ns = max(self._queued_ns, horizon_ns)
+        if finished:
+            log.info("Backing track finished: %s", self.file)
+            self._changed()
+        return events
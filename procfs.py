@@ -0,0 +1,118 @@
+"""
+Piano Pi Brain — /proc Helpers
+
+Cheap reads of system and per-process memory and CPU figures (no forks).
+"""
+
+import os
+import platform
+
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+
+
+def read_meminfo(path="/proc/meminfo") -> dict[str, int]:
+    """/proc/meminfo as {"MemAvailable": bytes, ...}."""
+    info = {}
+    try:
+        with open(path) as f:
+            for line in f:
+                key, _, rest = line.partition(":")
+                parts = rest.split()
+                if parts:
+                    value = int(parts[0])
+                    info[key] = value * 1024 if parts[1:] == ["kB"] else value
+    except (OSError, ValueError):
+        pass
+    return info
+
+
+def mem_available() -> int | None:
+    """Bytes the kernel can hand out without swapping (None if unknown)."""
+    return read_meminfo().get("MemAvailable")
+
+
+def process_status(pid: int) -> dict[str, str]:
+    """/proc/<pid>/status as raw strings ({} if the process is gone)."""
+    status = {}
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                status[key] = value.strip()
+    except OSError:
+        pass
+    return status
+
+
+def process_rss(pid: int) -> int | None:
+    """Resident set size of `pid` in bytes."""
+    value = process_status(pid).get("VmRSS")
+    if not value:
+        return None
+    return int(value.split()[0]) * 1024
+
+
+def process_cpu_seconds(pid: int) -> float | None:
+    """User + system CPU time `pid` has used so far."""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            # The command name may contain spaces; fields resume after ")"
+            fields = f.read().rpartition(")")[2].split()
+        return (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def process_start_seconds(pid: int) -> float | None:
+    """When `pid` started, in seconds since kernel boot (CLOCK_BOOTTIME)."""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rpartition(")")[2].split()
+        return int(fields[19]) / CLOCK_TICKS
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def context_switches(pid: int) -> tuple[int, int] | None:
+    """(voluntary, involuntary) context switches of `pid`."""
+    status = process_status(pid)
+    try:
+        return (int(status["voluntary_ctxt_switches"]),
+                int(status["nonvoluntary_ctxt_switches"]))
+    except (KeyError, ValueError):
+        return None
+
+
+def cpu_times(path="/proc/stat") -> list[tuple[int, int]]:
+    """(busy, total) jiffies for each CPU core, in core order."""
+    cores = []
+    try:
+        with open(path) as f:
+            for line in f:
+                name, *fields = line.split()
+                if not name.startswith("cpu") or name == "cpu":
+                    continue
+                values = [int(v) for v in fields]
+                # idle + iowait are the not-busy columns
+                idle = values[3] + (values[4] if len(values) > 4 else 0)
+                cores.append((sum(values[:8]) - idle, sum(values[:8])))
+    except (OSError, ValueError, IndexError):
+        pass
+    return cores
+
+
+def core_utilisation(before: list[tuple[int, int]], after: list[tuple[int, int]]) -> list[float]:
+    """Busy fraction (0..1) of each core between two cpu_times() readings."""
+    return [
+        (b1 - b0) / (t1 - t0) if t1 > t0 else 0.0
+        for (b0, t0), (b1, t1) in zip(before, after)
+    ]
+
+
+def device_model() -> str:
+    """Board name from the device tree ("Raspberry Pi 3 Model B Rev 1.2"), else the CPU arch."""
+    try:
+        with open("/proc/device-tree/model") as f:
+            return f.read().rstrip("\0\n")
+    except OSError:
+        return platform.machine()
@@ -0,0 +1,197 @@
+"""
+Piano Pi Brain — Restart Sequence
+
+A FluidSynth restart as a sequence of phases run on its own thread, so
+the thread that asked for it (a button, a web request, the control
+actor) returns at once:
+
+  stopping      stop the active instance
+  loading       spawn a new one (the soundfont loads in the background)
+  ready_check   wait until it answers commands
+  restoring     replay instrument, gain, effects and CCs
+  reconnecting  reconnect the MIDI controllers
+
+State is restored before MIDI comes back, so the first notes already
+play the right instrument. With a warm hot standby the first three
+phases are a single "switching" phase.
+
+Every phase reports its progress ("started", "done", "failed") and
+duration to a callback; the final report carries all phase timings. A
+failed phase is retried with exponential backoff (a failed ready check
+retries from loading, a failed restore from stopping); a restart requested while one runs joins it.
+
+Whatever changes the manager (the active instance, the instrument list,
+the desired state) runs on the control actor, in order with instrument
+changes and reloads; this thread only waits: for the old instance to
+exit, the new one to spawn and to answer.
+"""
+
+import logging
+import threading
+import time
+from concurrent.futures import Future
+
+import config
+import tracing
+
+log = logging.getLogger(__name__)
+
+# Phase to go back to when a phase fails (default: the phase itself)
+_RETRY_FROM = {"ready_check": "loading", "restoring": "stopping"}
+
+
+class RestartSequence:
+    """Runs restarts of a FluidSynthManager; see module docstring."""
+
+    def __init__(self, synth, midi, on_progress=None, actor=None):
+        """
+        Args:
+            synth: FluidSynthManager
+            midi: MidiMonitor (controllers are reconnected at the end)
+            on_progress: Callback(dict) with each phase report
+            actor: Callable(fn, *args) -> fn's result, run on the control
+                actor (Controller.call(...).result()). None = run here.
+        """
+        self._synth = synth
+        self._midi = midi
+        self._on_progress = on_progress
+        self._actor = actor
+        self._future: Future | None = None
+        self._lock = threading.Lock()
+        self._loaded = None         # instance between loading and ready_check
+        self.phase: str | None = None
+
+    @property
+    def running(self) -> bool:
+        future = self._future
+        return future is not None and not future.done()
+
+    def start(self) -> Future:
+        """Begin a restart (or join the running one); resolves to success."""
+        with self._lock:
+            if self.running:
+                log.info("Restart already in progress (%s) — joining it", self.phase)
+                return self._future
+            self._future = Future()
+            threading.Thread(target=self._run, args=(self._future,),
+                             name="restart", daemon=True).start()
+            return self._future
+
+    # --- Phases ----------------------------------------------------------------
+
+    def _steps(self) -> list[tuple]:
+        synth = self._synth
+        if synth.standby_ready:
+            steps = [("switching", lambda: self._call(synth.switch_to_standby))]
+        else:
+            steps = [
+                ("stopping", self._stop),
+                ("loading", self._load),
+                ("ready_check", self._ready_check),
+                ("restoring", lambda: self._call(synth.restore)),
+            ]
+        return steps + [("reconnecting", self._reconnect)]
+
+    def _call(self, fn, *args):
+        """Run a step that changes the manager where its other actions run."""
+        if self._actor is None:
+            return fn(*args)
+        return self._actor(fn, *args)
+
+    def _stop(self) -> bool:
+        old = self._call(self._synth.detach_active)
+        if old is not None:
+            old.stop()
+        return True
+
+    def _load(self) -> bool:
+        instance = self._call(self._synth.prepare)
+        if instance is None or not instance.spawn():
+            return False
+        self._loaded = instance
+        return True
+
+    def _ready_check(self) -> bool:
+        instance, self._loaded = self._loaded, None
+        if not instance.wait_ready():
+            instance.stop()
+            return False
+        return self._call(self._synth.make_active, instance)
+
+    def _reconnect(self) -> bool:
+        self._midi.connect_all()
+        return True
+
+    # --- Runner ----------------------------------------------------------------
+
+    def _report(self, phase: str, status: str, **extra):
+        if self._on_progress:
+            try:
+                self._on_progress({"phase": phase, "status": status, **extra})
+            except Exception as e:
+                log.error("Restart progress callback failed: %s", e)
+
+    def _run(self, future: Future):
+        log.info("🔄 Restarting FluidSynth...")
+        started = time.monotonic()
+        timings: dict[str, float] = {}
+        steps = self._steps()
+        names = [step for step, _ in steps]
+        attempts: dict[str, int] = {}
+        failures = 0
+        i = 0
+
+        while i < len(steps):
+            name, fn = steps[i]
+            self.phase = name
+            attempts[name] = attempts.get(name, 0) + 1
+            self._report(name, "started", attempt=attempts[name])
+            t0 = time.monotonic()
+            try:
+                with tracing.span(f"restart.{name}", "restart", attempt=attempts[name]):
+                    ok = fn()
+            except Exception as e:
+                log.error("Restart phase %s raised: %s", name, e)
+                ok = False
+            elapsed = round(time.monotonic() - t0, 4)
+            timings[name] = round(timings.get(name, 0.0) + elapsed, 4)
+
+            if ok:
+                self._report(name, "done", seconds=elapsed)
+                i += 1
+                continue
+
+            if name == "switching":
+                # The standby died under us: do a full restart instead
+                self._report(name, "failed", seconds=elapsed)
+                steps = self._steps()
+                names = [step for step, _ in steps]
+                i = 0
+                continue
+
+            failures += 1
+            if failures > config.RESTART_RETRIES:
+                self._report(name, "failed", seconds=elapsed, final=True,
+                             phases=timings, total=round(time.monotonic() - started, 4))
+                log.error("❌ Restart failed in %s after %d attempts", name, failures)
+                self._finish(future, False)
+                return
+
+            delay = config.RESTART_BACKOFF * 2 ** (failures - 1)
+            self._report(name, "failed", seconds=elapsed, retry_in=delay)
+            log.warning("Restart phase %s failed — retrying in %.1fs", name, delay)
+            time.sleep(delay)
+            i = names.index(_RETRY_FROM.get(name, name))
+
+        total = round(time.monotonic() - started, 4)
+        self._report("ready", "done", final=True, phases=timings, total=total)
+        log.info("✅ Restart complete in %.2fs — instrument: %s",
+                 total, self._synth.get_current_instrument())
+        self._finish(future, True)
+
+    def _finish(self, future: Future, ok: bool):
+        if self._loaded is not None:
+            self._loaded.stop()
+            self._loaded = None
+        self.phase = None
+        future.set_result(ok)
@@ -0,0 +1,150 @@
+"""
+Piano Pi Brain — Event Scheduler
+
+Timed MIDI output for things the Pi plays by itself (metronome, arpeggiator).
+Rather than sleeping until each note is due, which on a Pi 3 with the GIL
+and the web server's threads is audibly uneven, sources hand over batches
+of events with absolute timestamps, and a sequencer queue (see
+alsa_seq.QueueSequencer) sends each one at its time.
+
+One thread keeps every active source SCHEDULE_LOOKAHEAD ahead of now,
+topping up every SCHEDULE_INTERVAL. A stall shorter than the lookahead
+doesn't move a single note; the cost is that a change (tempo, stop)
+takes up to the lookahead to be heard. While no source is active the
+thread sleeps until woken.
+
+A source is any object with:
+    active: bool
+    events_until(horizon_ns) -> list[(due_ns, message)]
+        every not yet scheduled event due before `horizon_ns`, in time
+        order, with monotonic-ns timestamps
+and optionally `lookahead` (seconds) to be kept closer to now than
+SCHEDULE_LOOKAHEAD, e.g. so released keys stop the arpeggiator sooner.
+send_now() plays a message immediately (pass-through), send_at() at a
+given time (e.g. all-notes-off after everything already queued).
+"""
+
+import logging
+import threading
+import time
+
+import alsa_seq
+import config
+import topology
+
+log = logging.getLogger(__name__)
+
+
+class Scheduler:
+    """Keeps the sequencer queue topped up from the registered sources."""
+
+    def __init__(self, sequencer=None, synth_ident=None):
+        """
+        Args:
+            sequencer: Timed output (alsa_seq.QueueSequencer or
+                FakeQueueSequencer). None = open the ALSA sequencer on start().
+            synth_ident: Callable returning the sequencer id of the FluidSynth
+                instance to play on (None while it is down). Without it,
+                events are scheduled with no destination (fake sequencers).
+        """
+        self._sequencer = sequencer
+        self._synth_ident = synth_ident
+        self._sources = []
+        self._dest = (None, None)       # (ident, address) of the last lookup
+        self._wake = threading.Event()
+        self._lock = threading.Lock()   # the sequencer isn't shared across threads
+        self._running = False
+        self._thread = None
+        self.late = 0                   # events that were already due when queued
+
+    @property
+    def available(self) -> bool:
+        return self._sequencer is not None
+
+    def add(self, source):
+        self._sources.append(source)
+
+    def start(self) -> bool:
+        if self._sequencer is None:
+            self._sequencer = alsa_seq.open_queue_sequencer()
+            if self._sequencer is None:
+                return False
+        self._running = True
+        self._thread = threading.Thread(target=self._loop, name="scheduler", daemon=True)
+        self._thread.start()
+        return True
+
+    def stop(self):
+        self._running = False
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
+        if self._sequencer is not None:
+            self._sequencer.close()
+
+    def wake(self):
+        """A source started or changed: schedule now instead of at the next tick."""
+        self._wake.set()
+
+    def send_now(self, message: bytes) -> bool:
+        """Play `message` on FluidSynth right away; False if there's nowhere to send it."""
+        return self.send_at(time.monotonic_ns(), message)
+
+    def send_at(self, due_ns: int, *messages: bytes) -> bool:
+        """Queue `messages` for monotonic time `due_ns`; False if there's nowhere to send them."""
+        if self._sequencer is None:
+            return False
+        with self._lock:
+            dest = self._destination()
+            if dest is False:
+                return False
+            for message in messages:
+                self._sequencer.schedule(due_ns, message, dest)
+            self._sequencer.flush()
+        return True
+
+    def _loop(self):
+        while self._running:
+            active = [s for s in self._sources if s.active]
+            self._wake.wait(config.SCHEDULE_INTERVAL if active else None)
+            self._wake.clear()
+            if not self._running:
+                return
+            try:
+                with self._lock:
+                    self._top_up()
+            except Exception as e:
+                log.error("Scheduler error: %s", e)
+
+    def _top_up(self):
+        now = time.monotonic_ns()
+        dest = self._destination()
+        sent = False
+        for source in self._sources:
+            if not source.active:
+                continue
+            lookahead = getattr(source, "lookahead", config.SCHEDULE_LOOKAHEAD)
+            for due, message in source.events_until(now + int(lookahead * 1e9)):
+                if due < now:
+                    self.late += 1
+                if dest is not False:
+                    self._sequencer.schedule(due, message, dest)
+                    sent = True
+        if sent:
+            self._sequencer.flush()
+
+    def _destination(self):
+        """FluidSynth's input port; None without synth_ident, False while it is down."""
+        if self._synth_ident is None:
+            return None
+        ident = self._synth_ident()
+        if ident is None:
+            return False
+        cached_ident, addr = self._dest
+        if ident != cached_ident or addr is None:
+            snap = topology.take_snapshot()
+            client = snap.find_fluidsynth(ident)
+            addr = snap.input_port(client) if client else None
+            self._dest = (ident, addr)
+        return addr if addr is not None else False
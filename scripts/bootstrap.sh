@@ -27,6 +27,16 @@ apt-get install -y \
     python3-gpiozero \
     python3-pip
 
+# ALSA sequencer bindings for event-driven MIDI hotplug (optional —
+# the MIDI monitor falls back to polling aconnect without them)
+pip3 install --break-system-packages alsa-midi 2>/dev/null \
+    || pip3 install alsa-midi \
+    || echo "  ⚠️  alsa-midi not installed — MIDI hotplug will poll"
+
+# Brotli for the web portal's precompressed assets (optional — gzip otherwise)
+apt-get install -y python3-brotli \
+    || echo "  ⚠️  python3-brotli not installed — web assets will be gzip only"
+
 echo "  ✅ Packages installed"
 
 # ---------------------------------------------------------------------------
@@ -0,0 +1,237 @@
+"""
+Piano Pi Brain — SoundFont Preset Index
+
+Reads the preset headers (pdta/phdr) of an SF2 file without loading it:
+the file is memory-mapped and only the RIFF chunk headers plus the preset
+table are touched, so even a multi-GB soundfont indexes in milliseconds.
+The sample data size (sdta/smpl) is recorded too, as a memory estimate,
+and so is which samples each preset plays (preset -> instrument ->
+sample zones), for what FluidSynth keeps resident when it loads samples
+only for the selected presets (synth.dynamic-sample-loading).
+
+Indexes are cached per path and invalidated when the file's mtime/size
+change.
+"""
+
+import logging
+import mmap
+import os
+import struct
+import threading
+from typing import NamedTuple
+
+log = logging.getLogger(__name__)
+
+# sfPresetHeader: achPresetName[20], wPreset, wBank, wPresetBagNdx,
+#                 dwLibrary, dwGenre, dwMorphology
+_PHDR = struct.Struct("<20sHHHIII")
+# sfPresetBag / sfInstBag: wGenNdx, wModNdx
+_BAG = struct.Struct("<HH")
+# sfGenList / sfInstGenList: sfGenOper, genAmount
+_GEN = struct.Struct("<HH")
+# sfInst: achInstName[20], wInstBagNdx
+_INST = struct.Struct("<20sH")
+# sfSample: achSampleName[20], dwStart, dwEnd, dwStartloop, dwEndloop,
+#           dwSampleRate, byOriginalPitch, chPitchCorrection, wSampleLink, sfSampleType
+_SHDR = struct.Struct("<20sIIIIIBbHH")
+
+_GEN_INSTRUMENT = 41
+_GEN_SAMPLE_ID = 53
+
+
+class SF2Error(Exception):
+    """Not a SoundFont 2 file, or a truncated one."""
+
+
+class SoundfontIndex(NamedTuple):
+    path: str
+    presets: dict          # (bank, program) -> preset name
+    sample_bytes: int      # size of smpl (+ sm24) sample data
+    # (bank, program) -> ids of the samples it plays; sample id -> bytes
+    preset_samples: dict = {}
+    sample_sizes: tuple = ()
+
+    def has(self, bank: int, program: int) -> bool:
+        return (bank, program) in self.presets
+
+    def resident_bytes(self, presets) -> int:
+        """
+        Sample data of the (bank, program) `presets` together, each sample
+        counted once (the compressed size for .sf3).
+        """
+        samples = set()
+        for preset in presets:
+            samples |= self.preset_samples.get(preset, frozenset())
+        return sum(self.sample_sizes[i] for i in samples if i < len(self.sample_sizes))
+
+    def as_list(self) -> list[dict]:
+        return [
+            {"bank": bank, "program": program, "name": name}
+            for (bank, program), name in sorted(self.presets.items())
+        ]
+
+
+_cache: dict[str, tuple[tuple, SoundfontIndex]] = {}
+_cache_lock = threading.Lock()
+
+
+def _chunks(buf, start: int, end: int):
+    """Yield (id, data_offset, size) for RIFF chunks in buf[start:end]."""
+    pos = start
+    while pos + 8 <= end:
+        cid = bytes(buf[pos:pos + 4])
+        size = struct.unpack_from("<I", buf, pos + 4)[0]
+        data = pos + 8
+        if data + size > end:
+            raise SF2Error(f"chunk {cid!r} overruns file")
+        yield cid, data, size
+        pos = data + size + (size & 1)  # chunks are word aligned
+
+
+def _parse(buf, path: str) -> SoundfontIndex:
+    if len(buf) < 12 or buf[0:4] != b"RIFF" or buf[8:12] != b"sfbk":
+        raise SF2Error(f"{path}: not a SoundFont 2 file")
+
+    riff_end = min(len(buf), 8 + struct.unpack_from("<I", buf, 4)[0])
+    presets = {}
+    sample_bytes = 0
+    point_bytes = 2             # 16-bit samples, one more byte with sm24
+    compressed = False          # SF3: sample offsets are bytes of compressed data
+    tables = {}
+
+    for cid, data, size in _chunks(buf, 12, riff_end):
+        if cid != b"LIST" or size < 4:
+            continue
+        list_type = bytes(buf[data:data + 4])
+
+        if list_type == b"INFO":
+            for sub, sub_data, sub_size in _chunks(buf, data + 4, data + size):
+                if sub == b"ifil" and sub_size >= 4:
+                    compressed = struct.unpack_from("<H", buf, sub_data)[0] >= 3
+
+        elif list_type == b"sdta":
+            for sub, _, sub_size in _chunks(buf, data + 4, data + size):
+                if sub in (b"smpl", b"sm24"):
+                    sample_bytes += sub_size
+                if sub == b"sm24":
+                    point_bytes = 3
+
+        elif list_type == b"pdta":
+            for sub, sub_data, sub_size in _chunks(buf, data + 4, data + size):
+                tables[sub] = (sub_data, sub_size)
+
+    if b"phdr" not in tables:
+        raise SF2Error(f"{path}: no preset headers")
+    phdr = _records(buf, tables[b"phdr"], _PHDR)
+    # The last record is the terminal "EOP" sentinel
+    for name, program, bank, *_ in phdr[:-1]:
+        name = name.split(b"\0", 1)[0].decode("latin-1").strip()
+        presets.setdefault((bank, program), name)
+
+    try:
+        preset_samples, sample_sizes = _preset_samples(
+            buf, tables, phdr, 1 if compressed else point_bytes)
+    except (KeyError, IndexError, struct.error):
+        log.debug("%s: no usable sample zones, resident size unknown", path)
+        preset_samples, sample_sizes = {}, ()
+    return SoundfontIndex(path, presets, sample_bytes, preset_samples, sample_sizes)
+
+
+def _records(buf, table: tuple[int, int], record: struct.Struct) -> list[tuple]:
+    data, size = table
+    return list(record.iter_unpack(buf[data:data + size - size % record.size]))
+
+
+def _zones(bags: list[tuple], gens: list[tuple], first: int, last: int, oper: int):
+    """Amounts of generator `oper` in bags first..last-1."""
+    for bag in range(first, last):
+        for gen in range(bags[bag][0], bags[bag + 1][0]):
+            if gens[gen][0] == oper:
+                yield gens[gen][1]
+
+
+def _preset_samples(buf, tables: dict, phdr: list[tuple], point_bytes: int) -> tuple[dict, tuple]:
+    """(bank, program) -> sample ids, and each sample's size in bytes."""
+    pbag, pgen = _records(buf, tables[b"pbag"], _BAG), _records(buf, tables[b"pgen"], _GEN)
+    inst = _records(buf, tables[b"inst"], _INST)
+    ibag, igen = _records(buf, tables[b"ibag"], _BAG), _records(buf, tables[b"igen"], _GEN)
+    shdr = _records(buf, tables[b"shdr"], _SHDR)
+
+    instrument_samples = {}
+    for i in range(len(inst) - 1):
+        instrument_samples[i] = frozenset(
+            _zones(ibag, igen, inst[i][1], inst[i + 1][1], _GEN_SAMPLE_ID))
+
+    preset_samples = {}
+    for i in range(len(phdr) - 1):
+        _, program, bank, first, *_ = phdr[i]
+        samples = set()
+        for instrument in _zones(pbag, pgen, first, phdr[i + 1][3], _GEN_INSTRUMENT):
+            samples |= instrument_samples.get(instrument, frozenset())
+        preset_samples.setdefault((bank, program), frozenset(samples))
+
+    sizes = tuple(max(0, end - start) * point_bytes for _, start, end, *_ in shdr)
+    return preset_samples, sizes
+
+
+def read_index(path: str) -> SoundfontIndex:
+    """Index `path`, reusing the cached result while the file is unchanged."""
+    st = os.stat(path)
+    key = (st.st_mtime_ns, st.st_size)
+
+    with _cache_lock:
+        hit = _cache.get(path)
+        if hit is not None and hit[0] == key:
+            return hit[1]
+
+    with open(path, "rb") as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            index = _parse(buf, path)
+
+    log.info("Indexed %s: %d presets, %d MB samples",
+             os.path.basename(path), len(index.presets), index.sample_bytes // 2**20)
+    with _cache_lock:
+        _cache[path] = (key, index)
+    return index
+
+
+def try_read_index(path: str) -> SoundfontIndex | None:
+    """read_index(), or None (logged) if the file is missing or unreadable."""
+    try:
+        return read_index(path)
+    except (OSError, ValueError, SF2Error, struct.error) as e:
+        log.warning("Can't index soundfont %s: %s", path, e)
+        return None
+
+
+def resolve_instruments(instruments: list[dict], fonts: list[str]) -> tuple[list, list]:
+    """
+    Match each instrument to the first soundfont in `fonts` that contains
+    its (bank, program). An instrument may pin a font with a "soundfont"
+    key. Fonts that can't be indexed are trusted blindly.
+
+    Returns (resolved, dropped). Resolved entries are copies with
+    "soundfont" set to the font's path and "preset" to its preset name.
+    """
+    indexes = {path: try_read_index(path) for path in fonts}
+    resolved, dropped = [], []
+
+    for inst in instruments:
+        bank = inst.get("bank", 0)
+        candidates = [inst["soundfont"]] if inst.get("soundfont") else fonts
+
+        for path in candidates:
+            index = indexes.get(path) if path in indexes else try_read_index(path)
+            if index is None and not os.path.isfile(path):
+                continue
+            if index is None or index.has(bank, inst["program"]):
+                resolved.append({
+                    **inst,
+                    "soundfont": path,
+                    "preset": index.presets[(bank, inst["program"])] if index else None,
+                })
+                break
+        else:
+            dropped.append(inst)
+
+    return resolved, dropped
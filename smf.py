@@ -0,0 +1,279 @@
+"""
+Piano Pi Brain — Standard MIDI Files
+
+Just enough SMF to write the workloads and recordings the Pi produces:
+tracks are lists of (absolute tick, message bytes), written as format 0
+(one track) or format 1. StreamWriter appends to a file as events
+arrive, for recordings too long to keep in memory.
+
+Reader plays files back the same way round: only the header and the
+chunk table are read up front, and events are decoded lazily from each
+track and merged in time order, so memory doesn't grow with the file.
+"""
+
+import heapq
+import os
+import struct
+
+DEFAULT_DIVISION = 480          # ticks per quarter note
+DEFAULT_TEMPO = 500_000         # µs per quarter note (120 bpm)
+
+END_OF_TRACK = b"\xff\x2f\x00"
+
+
+def varlen(value: int) -> bytes:
+    """Encode a variable-length quantity (7 bits per byte, MSB = more)."""
+    out = bytearray([value & 0x7F])
+    value >>= 7
+    while value:
+        out.insert(0, 0x80 | (value & 0x7F))
+        value >>= 7
+    return bytes(out)
+
+
+def tempo_event(us_per_quarter: int = DEFAULT_TEMPO) -> bytes:
+    return b"\xff\x51\x03" + us_per_quarter.to_bytes(3, "big")
+
+
+def note_on(ch: int, note: int, velocity: int) -> bytes:
+    return bytes([0x90 | ch, note, velocity])
+
+
+def note_off(ch: int, note: int) -> bytes:
+    return bytes([0x80 | ch, note, 0])
+
+
+def control_change(ch: int, control: int, value: int) -> bytes:
+    return bytes([0xB0 | ch, control, value])
+
+
+def program_change(ch: int, program: int) -> bytes:
+    return bytes([0xC0 | ch, program])
+
+
+def encode_track(events: list[tuple[int, bytes]]) -> bytes:
+    """MTrk chunk for (tick, message) events; sorted stably and terminated."""
+    body = bytearray()
+    last = 0
+    for tick, message in sorted(events, key=lambda e: e[0]):
+        if message == END_OF_TRACK:
+            continue
+        body += varlen(tick - last) + message
+        last = tick
+    body += varlen(0) + END_OF_TRACK
+    return b"MTrk" + struct.pack(">I", len(body)) + bytes(body)
+
+
+def write(path: str, tracks: list[list[tuple[int, bytes]]], division: int = DEFAULT_DIVISION):
+    """Write `tracks` to `path` (format 0 for one track, else format 1)."""
+    fmt = 0 if len(tracks) == 1 else 1
+    with open(path, "wb") as f:
+        f.write(b"MThd" + struct.pack(">IHHH", 6, fmt, len(tracks), division))
+        for events in tracks:
+            f.write(encode_track(events))
+
+
+class StreamWriter:
+    """
+    Format 0 file written incrementally: add() events in time order and
+    flush() now and then. Every flush leaves a complete file on disk (the
+    end-of-track event and the chunk length are rewritten each time), so
+    a recording survives a power cut up to its last flush.
+    """
+
+    def __init__(self, path: str, division: int = DEFAULT_DIVISION, tempo: int = DEFAULT_TEMPO):
+        self.path = path
+        self.events = 0
+        self._f = open(path, "wb")
+        self._f.write(b"MThd" + struct.pack(">IHHH", 6, 0, 1, division))
+        self._f.write(b"MTrk" + struct.pack(">I", 0))
+        self._body = self._f.tell()     # where the track events start
+        self._length = 0                # event bytes on disk, without end of track
+        self._pending = bytearray()
+        self._last = 0
+        self.add(0, tempo_event(tempo))
+        self.flush()
+
+    def add(self, tick: int, message: bytes):
+        """Queue one event; ticks earlier than the previous event are clamped."""
+        if tick < self._last:
+            tick = self._last
+        self._pending += varlen(tick - self._last)
+        self._pending += message
+        self._last = tick
+        self.events += 1
+
+    def flush(self):
+        f = self._f
+        f.seek(self._body + self._length)
+        f.write(self._pending)
+        f.write(varlen(0) + END_OF_TRACK)
+        self._length += len(self._pending)
+        self._pending.clear()
+        f.seek(self._body - 4)
+        f.write(struct.pack(">I", self._length + 4))
+        f.flush()
+
+    def close(self):
+        if not self._f.closed:
+            try:
+                self.flush()
+            finally:
+                self._f.close()
+
+
+def tempo_of(message: bytes) -> int | None:
+    """µs per quarter note if `message` is a Set Tempo meta event."""
+    if message[0] == 0xFF and message[1] == 0x51 and len(message) == 6:
+        return int.from_bytes(message[3:6], "big")
+    return None
+
+
+class Clock:
+    """Ticks -> seconds for events read in time order, applying tempo changes as they come."""
+
+    def __init__(self, division: int = DEFAULT_DIVISION):
+        self.division = division
+        self.tempo = DEFAULT_TEMPO
+        self._tick = 0          # tick and time of the last tempo change
+        self._seconds = 0.0
+
+    def seconds(self, tick: int) -> float:
+        return self._seconds + (tick - self._tick) * self.tempo / 1e6 / self.division
+
+    def set_tempo(self, tick: int, tempo: int):
+        self._seconds = self.seconds(tick)
+        self._tick = tick
+        self.tempo = tempo
+
+
+class _TrackStream:
+    """Bytes of one track chunk, read from the file in blocks."""
+
+    def __init__(self, f, length: int, block: int = 16384):
+        self._f = f
+        self._left = length
+        self._block = block
+        self._buf = b""
+        self._pos = 0
+
+    @property
+    def done(self) -> bool:
+        return self._pos >= len(self._buf) and self._left <= 0
+
+    def _fill(self):
+        data = self._f.read(min(self._block, self._left)) if self._left > 0 else b""
+        if not data:
+            raise ValueError("truncated track chunk")
+        self._left -= len(data)
+        self._buf = self._buf[self._pos:] + data
+        self._pos = 0
+
+    def byte(self) -> int:
+        if self._pos >= len(self._buf):
+            self._fill()
+        value = self._buf[self._pos]
+        self._pos += 1
+        return value
+
+    def read(self, n: int) -> bytes:
+        while len(self._buf) - self._pos < n:
+            self._fill()
+        data = self._buf[self._pos:self._pos + n]
+        self._pos += n
+        return data
+
+    def varlen(self) -> int:
+        value = 0
+        for _ in range(4):
+            b = self.byte()
+            value = (value << 7) | (b & 0x7F)
+            if not b & 0x80:
+                return value
+        raise ValueError("variable-length quantity too long")
+
+
+def track_events(path: str, offset: int, length: int):
+    """
+    Yield (absolute tick, message) from the track chunk at `offset`.
+    Running status is expanded; meta events come back as FF <type> <len>
+    <data> and SysEx as F0/F7 <data>. Stops at End of Track.
+    """
+    with open(path, "rb") as f:
+        f.seek(offset)
+        stream = _TrackStream(f, length)
+        tick = 0
+        running = 0
+        while not stream.done:
+            tick += stream.varlen()
+            status = stream.byte()
+            if status == 0xFF:
+                kind = stream.byte()
+                n = stream.varlen()
+                data = stream.read(n)
+                if kind == 0x2F:
+                    return
+                yield tick, bytes([0xFF, kind]) + varlen(n) + data
+            elif status in (0xF0, 0xF7):
+                yield tick, bytes([status]) + stream.read(stream.varlen())
+            else:
+                if status < 0x80:
+                    if not running:
+                        raise ValueError("running status without a status byte")
+                    data1, status = status, running
+                else:
+                    running = status
+                    data1 = stream.byte()
+                if status & 0xF0 in (0xC0, 0xD0):
+                    yield tick, bytes([status, data1])
+                else:
+                    yield tick, bytes([status, data1, stream.byte()])
+
+
+class Reader:
+    """A Standard MIDI File opened for streaming (header and chunk table only)."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            head = f.read(14)
+            if len(head) < 14 or head[:4] != b"MThd":
+                raise ValueError("not a Standard MIDI File")
+            length, self.format, count, self.division = struct.unpack(">IHHH", head[4:])
+            if self.division & 0x8000:
+                raise ValueError("SMPTE time division is not supported")
+            f.seek(8 + length)
+            self.tracks: list[tuple[int, int]] = []     # (offset, length) of each MTrk
+            while len(self.tracks) < count:
+                chunk = f.read(8)
+                if len(chunk) < 8:
+                    break
+                kind, size = chunk[:4], struct.unpack(">I", chunk[4:])[0]
+                if kind == b"MTrk":
+                    self.tracks.append((f.tell(), size))
+                f.seek(size, os.SEEK_CUR)
+        if not self.tracks:
+            raise ValueError("no track chunks")
+
+    def events(self):
+        """(tick, message) across all tracks in time order (ties keep track order)."""
+        streams = [track_events(self.path, offset, length) for offset, length in self.tracks]
+        if len(streams) == 1:
+            return streams[0]
+        return heapq.merge(*streams, key=lambda event: event[0])
+
+    def duration(self) -> float:
+        """Length in seconds (reads the whole file, in constant memory)."""
+        clock = Clock(self.division)
+        last = 0
+        for tick, message in self.events():
+            tempo = tempo_of(message)
+            if tempo:
+                clock.set_tempo(tick, tempo)
+            last = tick
+        return clock.seconds(last)
+
+
+def ticks(seconds: float, division: int = DEFAULT_DIVISION, tempo: int = DEFAULT_TEMPO) -> int:
+    """Seconds -> ticks at a constant tempo."""
+    return round(seconds * 1_000_000 / tempo * division)
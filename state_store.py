@@ -0,0 +1,143 @@
+"""
+Piano Pi Brain — Versioned State Store
+
+Single source of truth for what the web UI shows. Every change bumps a
+monotonic version and appends one event to a bounded ring:
+
+  - update(**values): state keys that actually changed, as a "state"
+    event carrying only those keys
+  - publish(type, data): one-off notifications (e.g. "instrument" for
+    the toast when a button is pressed)
+
+Readers never block writers and are never dropped: an SSE client keeps
+its own position (the last version it saw) and catches up from the ring
+at its own pace, with bursts collapsed to the latest values. A client
+that has fallen off the end of the ring, or reconnects after the
+service restarted (different epoch), just gets the full state again.
+"""
+
+import secrets
+import threading
+from collections import deque
+from typing import NamedTuple
+
+import config
+
+
+class Event(NamedTuple):
+    version: int
+    type: str
+    data: dict
+
+
+class StateStore:
+    """Versioned key/value state plus a ring of recent change events."""
+
+    def __init__(self, ring_size: int | None = None):
+        # Distinguishes this process's versions from a previous run's
+        self.epoch = secrets.token_hex(4)
+        self.version = 0
+        self._values: dict[str, tuple[object, int]] = {}   # key -> (value, version)
+        self._ring: deque[Event] = deque(maxlen=ring_size or config.STATE_EVENT_RING)
+        self._cond = threading.Condition()
+
+    # --- Writers -------------------------------------------------------------
+
+    def update(self, **values) -> int:
+        """Set state keys; only keys whose value changed produce an event."""
+        with self._cond:
+            changed = {
+                key: value for key, value in values.items()
+                if key not in self._values or self._values[key][0] != value
+            }
+            if not changed:
+                return self.version
+            self.version += 1
+            for key, value in changed.items():
+                self._values[key] = (value, self.version)
+            self._append(Event(self.version, "state", changed))
+            return self.version
+
+    def publish(self, event_type: str, data: dict) -> int:
+        """Record a one-off notification event."""
+        with self._cond:
+            self.version += 1
+            self._append(Event(self.version, event_type, dict(data)))
+            return self.version
+
+    def _append(self, event: Event):
+        self._ring.append(event)
+        self._cond.notify_all()
+
+    # --- Readers -------------------------------------------------------------
+
+    @property
+    def etag(self) -> str:
+        return f'"{self.epoch}-{self.version}"'
+
+    def event_id(self, version: int) -> str:
+        return f"{self.epoch}-{version}"
+
+    def parse_id(self, text: str | None) -> int | None:
+        """Version from an event id / since value of this epoch (None if foreign)."""
+        if not text:
+            return None
+        epoch, _, version = text.rpartition("-")
+        if epoch and epoch != self.epoch:
+            return None
+        try:
+            version = int(version)
+        except ValueError:
+            return None
+        return version if 0 <= version <= self.version else None
+
+    def snapshot(self) -> tuple[int, dict]:
+        """(version, every state value)."""
+        with self._cond:
+            return self.version, {key: value for key, (value, _) in self._values.items()}
+
+    def delta(self, since: int) -> tuple[int, dict]:
+        """(version, state values changed after version `since`)."""
+        with self._cond:
+            return self.version, {
+                key: value for key, (value, version) in self._values.items()
+                if version > since
+            }
+
+    def events_after(self, version: int) -> list[Event] | None:
+        """Events newer than `version`; None if some were already evicted."""
+        with self._cond:
+            if version >= self.version:
+                return []
+            if not self._ring or self._ring[0].version > version + 1:
+                return None
+            return [e for e in self._ring if e.version > version]
+
+    def wait(self, version: int, timeout: float) -> list[Event] | None:
+        """events_after(), blocking up to `timeout` for something new."""
+        with self._cond:
+            self._cond.wait_for(lambda: self.version > version, timeout)
+        return self.events_after(version)
+
+
+def coalesce(events: list[Event]) -> list[Event]:
+    """
+    Collapse a burst: all "state" events merge into one (later values
+    win), and only the latest event of every other type is kept. The
+    result is in version order, so the last event carries the newest id.
+    """
+    merged: dict[str, object] = {}
+    state_version = None
+    latest: dict[str, Event] = {}
+
+    for event in events:
+        if event.type == "state":
+            merged.update(event.data)
+            state_version = event.version
+        else:
+            latest[event.type] = event
+
+    out = list(latest.values())
+    if state_version is not None:
+        out.append(Event(state_version, "state", merged))
+    return sorted(out, key=lambda e: e.version)
@@ -0,0 +1,239 @@
+"""
+Piano Pi Brain — FluidSynth Supervisor
+
+Notices the moment the FluidSynth child exits instead of polling: a
+thread blocks in poll() on a pidfd for the active process (Linux 5.3+)
+plus a wakeup pipe that re-arms it when the active instance changes.
+Without pidfd support a helper thread waits on the child and writes to
+the same pipe.
+
+On an unexpected exit it records the exit status, the signal and the
+last lines of stderr, then asks for a restart after an exponential
+backoff (SUPERVISOR_BACKOFF_MIN doubling up to SUPERVISOR_BACKOFF_MAX;
+reset once an instance has run SUPERVISOR_STABLE_SECONDS). If
+SUPERVISOR_CRASH_LIMIT crashes happen within SUPERVISOR_CRASH_WINDOW
+(e.g. a soundfont that crashes on load) the breaker trips: no more
+automatic restarts until a manual one resets it.
+
+A slow check every SUPERVISOR_CHECK_INTERVAL also catches a synth that
+isn't running at all (failed start), or an in-process engine that
+stopped rendering (see LibFluidSynthBackend.is_running), and treats it
+the same way.
+"""
+
+import logging
+import os
+import select
+import signal
+import threading
+import time
+from collections import deque
+from typing import NamedTuple
+
+import config
+
+log = logging.getLogger(__name__)
+
+
+class Crash(NamedTuple):
+    time: float                 # wall clock (time.time())
+    exit_code: int | None       # None if killed by a signal, or never started
+    signal: str | None
+    uptime: float | None        # seconds the instance had been active
+    stderr: list[str]
+
+
+def _pidfd_supported() -> bool:
+    if not hasattr(os, "pidfd_open"):
+        return False
+    try:
+        os.close(os.pidfd_open(os.getpid()))
+        return True
+    except OSError:
+        return False    # ENOSYS: kernel older than 5.3
+
+
+class Supervisor:
+    """Watches the active FluidSynth and restarts it after a crash."""
+
+    def __init__(self, synth, restart_fn, busy_fn=None, on_crash=None):
+        """
+        Args:
+            synth: FluidSynthManager
+            restart_fn: Callable() that starts an automatic restart
+            busy_fn: Callable() -> bool, True while a restart is under way
+            on_crash: Callback(crash, tripped) after each recorded crash
+        """
+        self._synth = synth
+        self._restart_fn = restart_fn
+        self._busy_fn = busy_fn or (lambda: False)
+        self._on_crash = on_crash
+        self.crashes: deque[Crash] = deque(maxlen=config.SUPERVISOR_CRASH_HISTORY)
+        self.total_crashes = 0
+        self.consecutive = 0
+        self.tripped = False
+        self.backoff_until: float | None = None     # monotonic
+        self._counted_since = 0.0                   # crashes before a reset don't trip
+        self.pidfd_supported = _pidfd_supported()
+        self._wake_r, self._wake_w = os.pipe()
+        os.set_blocking(self._wake_w, False)
+        self._waiting: set[int] = set()
+        self._watching = (None, 0.0)                # (instance, monotonic first seen)
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="supervisor", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self.rearm()
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def rearm(self):
+        """The active instance changed: watch the new one."""
+        try:
+            os.write(self._wake_w, b"x")
+        except BlockingIOError:
+            pass        # a wakeup is already pending
+
+    def reset(self):
+        """Close the breaker and forget the backoff (a manual restart)."""
+        if self.tripped:
+            log.info("Crash-loop breaker reset")
+        self.tripped = False
+        self.consecutive = 0
+        self.backoff_until = None
+        self._counted_since = time.time()
+
+    def stats(self) -> dict:
+        """Crash statistics for the web API."""
+        now = time.time()
+        if self.tripped:
+            state = "tripped"
+        elif self.backoff_until is not None and time.monotonic() < self.backoff_until:
+            state = "backoff"
+        else:
+            state = "watching"
+        return {
+            "state": state,
+            "pidfd": self.pidfd_supported,
+            "crashes_total": self.total_crashes,
+            "consecutive": self.consecutive,
+            "recent_window": sum(1 for c in self.crashes
+                                 if now - c.time <= config.SUPERVISOR_CRASH_WINDOW),
+            "crashes": [c._asdict() for c in reversed(self.crashes)],
+        }
+
+    # --- Watching --------------------------------------------------------------
+
+    def _loop(self):
+        while not self._stop.is_set():
+            instance = self._synth.active
+            if instance is not self._watching[0]:
+                self._watching = (instance, time.monotonic())
+            pid = instance.child_pid if instance is not None else None
+            alive = pid is not None and instance.returncode is None
+
+            poller = select.poll()
+            poller.register(self._wake_r, select.POLLIN)
+            pidfd = None
+            if alive and self.pidfd_supported:
+                try:
+                    pidfd = os.pidfd_open(pid)
+                    poller.register(pidfd, select.POLLIN)
+                except ProcessLookupError:
+                    pass    # already gone; handled below
+            elif alive and pid not in self._waiting:
+                self._waiting.add(pid)
+                threading.Thread(target=self._wait_child, args=(instance, pid),
+                                 daemon=True).start()
+
+            try:
+                events = poller.poll(config.SUPERVISOR_CHECK_INTERVAL * 1000)
+            finally:
+                if pidfd is not None:
+                    os.close(pidfd)
+            if any(fd == self._wake_r for fd, _ in events):
+                os.read(self._wake_r, 4096)
+            if self._stop.is_set():
+                return
+
+            if instance is not None and instance is self._synth.active:
+                # No child to exit: the in-process engine reports its own health
+                if instance.returncode is not None or (pid is None and not instance.is_running):
+                    self._failed(instance, time.monotonic() - self._watching[1])
+            elif instance is None and not self._synth.is_running:
+                self._failed(None, None)
+
+    def _wait_child(self, instance, pid: int):
+        try:
+            instance.wait_exit()
+        finally:
+            self._waiting.discard(pid)
+            self.rearm()
+
+    # --- Recovery --------------------------------------------------------------
+
+    def _failed(self, instance, uptime: float | None):
+        if (instance is not None and instance.stopping) or self.tripped or self._busy_fn():
+            return
+
+        code = instance.returncode if instance is not None else None
+        sig = None
+        if code is not None and code < 0:
+            try:
+                sig = signal.Signals(-code).name
+            except ValueError:
+                sig = str(-code)
+            code = None
+        crash = Crash(time.time(), code, sig, round(uptime, 3) if uptime is not None else None,
+                      list(instance.stderr_tail) if instance is not None else [])
+        self.crashes.append(crash)
+        self.total_crashes += 1
+
+        if instance is None:
+            log.error("FluidSynth is not running")
+        elif instance.child_pid is None:
+            log.error("In-process FluidSynth stopped rendering after %.1fs", uptime)
+        else:
+            log.error("FluidSynth exited unexpectedly (%s) after %.1fs",
+                      f"signal {sig}" if sig else f"status {code}", uptime)
+            for line in crash.stderr[-5:]:
+                log.error("  fluidsynth: %s", line)
+
+        if uptime is not None and uptime >= config.SUPERVISOR_STABLE_SECONDS:
+            self.consecutive = 1
+        else:
+            self.consecutive += 1
+
+        recent = sum(1 for c in self.crashes
+                     if crash.time - c.time <= config.SUPERVISOR_CRASH_WINDOW
+                     and c.time >= self._counted_since)
+        if recent >= config.SUPERVISOR_CRASH_LIMIT:
+            self.tripped = True
+            log.error("%d crashes in %.0fs — crash-loop breaker tripped, not restarting "
+                      "until a manual restart", recent, config.SUPERVISOR_CRASH_WINDOW)
+        self._notify(crash)
+        if self.tripped:
+            return
+
+        delay = min(config.SUPERVISOR_BACKOFF_MAX,
+                    config.SUPERVISOR_BACKOFF_MIN * 2 ** (self.consecutive - 1))
+        log.warning("Restarting FluidSynth in %.1fs (crash %d in a row)", delay, self.consecutive)
+        self.backoff_until = time.monotonic() + delay
+        if self._stop.wait(delay) or self.tripped:
+            return
+        self.backoff_until = None
+        self._restart_fn()
+
+    def _notify(self, crash: Crash):
+        if self._on_crash:
+            try:
+                self._on_crash(crash, self.tripped)
+            except Exception as e:
+                log.error("Crash callback failed: %s", e)
@@ -1,121 +1,175 @@
 """
 Piano Pi Brain — FluidSynth Manager
 
-Manages FluidSynth as a subprocess:
+Manages FluidSynth (a subprocess or in-process, see synth_backend.py):
   - Start/stop/restart
   - Instrument switching on all configured MIDI channels
+  - Instrument list validated against the soundfonts' preset tables
+  - Soundfonts loaded/unloaded while running (new one in before the old
+    one goes), within a memory budget
+  - Sample loading mode (full preload or dynamic) picked per start from
+    MemAvailable and the fonts' sample data, reported with the footprint
+  - Batched, acknowledged commands and live state queries
+  - Optional hot standby: a second warm instance for near-instant
+    restart and crash failover
 """
 
 import logging
 import os
-import subprocess
+import threading
 import time
 
 import config
+import procfs
+import sf2
+import synth_state
+from synth_backend import DYNAMIC_SAMPLES, SynthBackend, bank_offset, cli_settings, create_backend
 
 log = logging.getLogger(__name__)
 
 
 class FluidSynthManager:
-    """Wraps FluidSynth as a managed subprocess."""
+    """Wraps a FluidSynth engine (plus optional hot standby)."""
 
     def __init__(self, on_state_change=None):
-        self._process = None
+        self._active: SynthBackend | None = None
+        self._standby: SynthBackend | None = None
+        self._standby_lock = threading.Lock()
+        self._standby_spawning = False
+        self._desired = synth_state.SynthState()
+        self._state_lock = threading.Lock()
         self._on_state_change = on_state_change
         self._current_instrument_index = config.DEFAULT_INSTRUMENT_INDEX
+        self.instruments: list[dict] = list(config.INSTRUMENTS)
+        self.soundfonts: list[str] = []
+        self.last_ready_seconds: float | None = None
+        self.last_switchover_seconds: float | None = None
+        # Why the last start preloads or loads samples dynamically
+        self._loading_plan: dict = {}
 
     @property
     def is_running(self) -> bool:
-        return self._process is not None and self._process.poll() is None
+        return self._active is not None and self._active.is_running
 
-    def start(self) -> bool:
-        """Start FluidSynth."""
-        if self.is_running:
-            return True
-
-        # Try primary soundfont, fall back to GM
-        if os.path.isfile(config.SOUNDFONT_PATH):
-            soundfont = config.SOUNDFONT_PATH
-        elif hasattr(config, 'SOUNDFONT_FALLBACK') and os.path.isfile(config.SOUNDFONT_FALLBACK):
-            log.warning("Primary SoundFont not found, using fallback: %s", config.SOUNDFONT_FALLBACK)
-            soundfont = config.SOUNDFONT_FALLBACK
-        else:
-            log.error("No SoundFont found!")
-            return False
-
-        cmd = config.FLUIDSYNTH_CMD + [soundfont]
-        log.info("Starting FluidSynth: %s", " ".join(cmd))
+    @property
+    def seq_ident(self) -> str | None:
+        """ALSA sequencer id of the active instance ("FLUID Synth (<id>)")."""
+        return self._active.seq_ident if self.is_running else None
 
-        try:
-            self._process = subprocess.Popen(
-                cmd,
-                stdin=subprocess.PIPE,
-                stdout=subprocess.DEVNULL,
-                stderr=subprocess.PIPE,
-            )
-            time.sleep(3)
-
-            if self._process.poll() is not None:
-                stderr = self._process.stderr.read().decode(errors="replace")
-                log.error("FluidSynth exited immediately: %s", stderr)
-                self._process = None
-                return False
+    @property
+    def pid(self) -> int | None:
+        """Process of the active instance (ours for the in-process backend)."""
+        return self._active.pid if self.is_running else None
 
-            log.info("FluidSynth started (pid %d)", self._process.pid)
-            self._process.stderr.close()
+    @property
+    def active(self) -> SynthBackend | None:
+        """The instance currently playing (for the supervisor to watch)."""
+        return self._active
 
-            # Set the default instrument on all channels
-            self._apply_instrument()
+    @property
+    def current_index(self) -> int:
+        """Position of the current instrument in `instruments`."""
+        return self._current_instrument_index
 
-            if self._on_state_change:
-                self._on_state_change("running")
+    @property
+    def standby_ready(self) -> bool:
+        return self._standby is not None and self._standby.is_running
 
+    def start(self) -> bool:
+        """Start FluidSynth."""
+        if self.is_running:
             return True
 
-        except Exception as e:
-            log.error("Failed to start FluidSynth: %s", e)
-            self._process = None
+        instance = self.load()
+        if instance is None or not self.activate(instance):
+            return False
+        self.restore()
+        return True
+
+    # The steps of start(), also run one by one by a restart (see restart.py).
+    # A restart runs the ones that change the manager (prepare, make_active,
+    # restore, detach_active) on the control actor and only the slow waits
+    # (spawn, wait_ready, stopping the old instance) on its own thread.
+
+    def load(self) -> SynthBackend | None:
+        """Spawn an instance for the planned soundfonts (not yet ready)."""
+        instance = self.prepare()
+        return instance if instance is not None and instance.spawn() else None
+
+    def prepare(self) -> SynthBackend | None:
+        """Check the instrument list against the soundfonts and create (not spawn) an instance."""
+        soundfonts = self._plan_soundfonts()
+        if soundfonts is None:
+            return None
+        mode = self.plan_sample_loading(soundfonts)
+        return create_backend(soundfonts, self._free_shell_port(), mode)
+
+    def activate(self, instance: SynthBackend) -> bool:
+        """Wait for a loaded instance and make it the active one."""
+        if not instance.wait_ready():
             return False
+        return self.make_active(instance)
 
-    def stop(self):
-        """Stop FluidSynth gracefully."""
-        if self._process is None:
-            return
+    def make_active(self, instance: SynthBackend) -> bool:
+        """Start playing on a ready instance."""
+        self._active = instance
+        self.last_ready_seconds = instance.ready_seconds
+        if self._on_state_change:
+            self._on_state_change("running")
+        return True
+
+    def restore(self) -> bool:
+        """Replay the desired state (instrument, gain, CCs) and warm a standby."""
+        # A fresh instance has nothing applied, so this sends everything
+        self._apply_instrument()
+        self.ensure_standby()
+        return self.is_running
+
+    def stop_active(self):
+        """Stop the active instance only (a warm standby keeps running)."""
+        old = self.detach_active()
+        if old is not None:
+            old.stop()
+
+    def detach_active(self) -> SynthBackend | None:
+        """Stop playing on the active instance and return it, for the caller to stop."""
+        old, self._active = self._active, None
+        return old
 
-        log.info("Stopping FluidSynth (pid %d)", self._process.pid)
+    def stop(self):
+        """Stop FluidSynth (and the standby) gracefully."""
+        with self._standby_lock:
+            standby, self._standby = self._standby, None
+        if standby is not None:
+            standby.stop()
 
-        try:
-            self._send_command("quit")
-            self._process.wait(timeout=5)
-        except Exception:
-            try:
-                self._process.terminate()
-                self._process.wait(timeout=3)
-            except Exception:
-                self._process.kill()
+        if self._active is None:
+            return
 
-        self._process = None
-        log.info("FluidSynth stopped")
+        self._active.stop()
+        self._active = None
 
         if self._on_state_change:
             self._on_state_change("stopped")
 
     def restart(self):
-        """Stop then start FluidSynth."""
+        """Switch to the hot standby if one is warm, else stop then start."""
         log.info("Restarting FluidSynth...")
-        self.stop()
-        time.sleep(0.5)
+        if self.switch_to_standby():
+            return True
+
+        self.stop_active()
         return self.start()
 
     def next_instrument(self) -> str:
         self._current_instrument_index = (
-            (self._current_instrument_index + 1) % len(config.INSTRUMENTS)
+            (self._current_instrument_index + 1) % len(self.instruments)
         )
         return self._apply_instrument()
 
     def prev_instrument(self) -> str:
         self._current_instrument_index = (
-            (self._current_instrument_index - 1) % len(config.INSTRUMENTS)
+            (self._current_instrument_index - 1) % len(self.instruments)
         )
         return self._apply_instrument()
 
@@ -123,29 +177,420 @@ class FluidSynthManager:
         self._current_instrument_index = 0
         return self._apply_instrument()
 
+    def select_instrument(self, index: int) -> str:
+        self._current_instrument_index = index
+        return self._apply_instrument()
+
     def get_current_instrument(self) -> str:
-        return config.INSTRUMENTS[self._current_instrument_index]["name"]
+        return self.instruments[self._current_instrument_index]["name"]
 
     def _apply_instrument(self) -> str:
-        """Send program change on ALL configured MIDI channels."""
-        inst = config.INSTRUMENTS[self._current_instrument_index]
+        """Set the current instrument on ALL configured MIDI channels."""
+        inst = self.instruments[self._current_instrument_index]
         log.info("Instrument -> %s (program %d)", inst["name"], inst["program"])
 
         for ch in config.MIDI_CHANNELS:
-            self._send_command(f"select {ch} 1 0 {inst['program']}")
+            self._desired.set_program(ch, inst.get("soundfont", config.SOUNDFONT_PATH),
+                                      inst.get("bank", 0), inst["program"])
+        self._sync()
 
         return inst["name"]
 
-    def _send_command(self, command: str):
+    def set_cc(self, channel: int, control: int, value: int):
+        self._desired.set_cc(channel, control, value)
+        self._sync()
+
+    def set_gain(self, gain: float):
+        self._desired.set("gain", gain)
+        self._sync()
+
+    def set_effect(self, name: str, on: bool):
+        """Turn "reverb" or "chorus" on/off."""
+        self._desired.set(name, bool(on))
+        self._sync()
+
+    def _sync(self, instance: SynthBackend | None = None):
+        """
+        Bring the active synth (and the standby, so a switchover is
+        seamless) up to the desired state: only the differences, sent as
+        one batch. An instance with nothing applied gets the full state.
+        A batch the instance doesn't confirm (font not loaded yet, rejected,
+        shell timeout) leaves its applied state as it was, so the next sync
+        sends it again.
+        """
+        targets = [instance] if instance else [self._active, self._standby]
+        with self._state_lock:
+            for target in targets:
+                if target is None or not target.is_running:
+                    continue
+                ops = synth_state.diff(self._desired, target.applied)
+                if ops and not target.apply(ops):
+                    continue
+                target.applied = self._desired.copy()
+
+    # ---------------------------------------------------------------
+    # State queries (shell socket only)
+    # ---------------------------------------------------------------
+
+    def get_setting(self, name: str) -> str | None:
+        return self._active.get_setting(name) if self.is_running else None
+
+    def get_channels(self) -> dict[int, str] | None:
+        return self._active.get_channels() if self.is_running else None
+
+    def get_presets(self, font_id: int | None = None) -> list[dict] | None:
+        """Presets of a loaded font (default: the current instrument's)."""
         if not self.is_running:
-            log.warning("Cannot send command — FluidSynth not running")
+            return None
+        if font_id is None:
+            font_id = self._active.font_ids.get(
+                self.instruments[self._current_instrument_index].get("soundfont"), 1)
+        return self._active.get_presets(font_id)
+
+    def active_voices(self) -> int | None:
+        return self._active.active_voices() if self.is_running else None
+
+    def get_state(self) -> dict:
+        """Live synth state read back from FluidSynth."""
+        return {
+            "backend": config.SYNTH_BACKEND,
+            "shell": self._active is not None and self._active.shell_connected,
+            "active_voices": self.active_voices(),
+            "gain": self.get_setting("synth.gain"),
+            "polyphony": self.get_setting("synth.polyphony"),
+            "channels": self.get_channels(),
+            "desired": self._desired.as_dict(),
+        }
+
+    # ---------------------------------------------------------------
+    # Hot standby
+    # ---------------------------------------------------------------
+
+    def ensure_standby(self):
+        """Spawn a standby in the background if enabled and missing."""
+        if not config.FLUIDSYNTH_STANDBY or not self.is_running:
             return
+        with self._standby_lock:
+            if self.standby_ready or self._standby_spawning:
+                return
+            self._standby_spawning = True
+        threading.Thread(target=self._spawn_standby, daemon=True).start()
 
+    def _spawn_standby(self):
         try:
-            self._process.stdin.write(f"{command}\n".encode())
-            self._process.stdin.flush()
-        except (BrokenPipeError, OSError) as e:
-            log.error("Failed to send command to FluidSynth: %s", e)
+            # A stop or failover may swap the active instance meanwhile
+            with self._standby_lock:
+                active = self._active
+            if active is None or not self._standby_fits(active):
+                return
+
+            instance = create_backend(active.soundfonts, self._free_shell_port(),
+                                      active.sample_loading)
+            if not instance.launch():
+                log.warning("Hot standby failed to start")
+                return
+
+            self._sync(instance)
+            with self._standby_lock:
+                if not self.is_running:
+                    # Stopped while we were loading
+                    instance.stop()
+                    return
+                self._standby = instance
+            log.info("Hot standby ready (%s)", instance.seq_ident)
+        finally:
+            with self._standby_lock:
+                self._standby_spawning = False
+
+    def _standby_fits(self, active: SynthBackend) -> bool:
+        """Only run two instances when RAM covers a second copy of `active` plus margin."""
+        needed = active.rss_bytes()
+        if needed is None:
+            needed = sum(os.path.getsize(p) for p in active.soundfonts)
+        needed += config.STANDBY_MIN_FREE_MB * 1024 * 1024
+
+        available = procfs.mem_available()
+        if available is None or available < needed:
+            log.warning("Hot standby disabled — needs %d MB, %s MB available",
+                        needed // 2**20,
+                        available // 2**20 if available is not None else "?")
+            return False
+        return True
+
+    def discard_standby(self):
+        """Stop the standby (e.g. it was launched with settings that changed since)."""
+        with self._standby_lock:
+            standby, self._standby = self._standby, None
+        if standby is not None:
+            log.info("Hot standby discarded")
+            standby.stop()
+
+    def switch_to_standby(self) -> bool:
+        """Make the warm standby the active synth; the old one is retired."""
+        with self._standby_lock:
+            standby, self._standby = self._standby, None
+        if standby is None or not standby.is_running:
+            return False
+
+        started = time.monotonic()
+        old, self._active = self._active, standby
+        self._apply_instrument()
+        self.last_switchover_seconds = time.monotonic() - started
+        log.info("Switched to hot standby (%s) in %.0f ms",
+                 standby.seq_ident, self.last_switchover_seconds * 1000)
+
+        if self._on_state_change:
+            self._on_state_change("running")
+
+        # Retire the old instance before its replacement takes its shell port
+        threading.Thread(target=self._retire, args=(old,), daemon=True).start()
+        return True
+
+    def _retire(self, old: SynthBackend | None):
+        if old is not None:
+            old.stop()
+        self.ensure_standby()
+
+    # ---------------------------------------------------------------
+    # Helpers
+    # ---------------------------------------------------------------
+
+    def _plan_soundfonts(self) -> list[str] | None:
+        """
+        Check every INSTRUMENTS entry against the soundfonts' preset tables,
+        drop the ones no font provides, and return the fonts to load
+        (only those some instrument actually uses).
+        """
+        resolved = self._resolve_instruments()
+        if resolved is None:
+            return None
+        soundfonts = list(dict.fromkeys(inst["soundfont"] for inst in resolved))
+        self._use_instruments(resolved, soundfonts)
+        return soundfonts
+
+    def reload_instruments(self) -> bool:
+        """
+        Take up a reloaded instrument list, MIDI_CHANNELS or soundfont
+        paths without a restart: re-check the list against the soundfonts,
+        load the fonts it now needs, replay the current instrument on every
+        channel, and only then unload the fonts nothing uses any more (no
+        gap in the sound). False if a font can't be loaded (memory budget);
+        nothing is changed then.
+        """
+        resolved = self._resolve_instruments()
+        if resolved is None:
+            return False
+        soundfonts = list(dict.fromkeys(inst["soundfont"] for inst in resolved))
+        instances = [i for i in (self._active, self._standby) if i is not None and i.is_running]
+        for path in soundfonts:
+            missing = [i for i in instances if path not in i.font_ids]
+            if not missing:
+                continue
+            presets = {(inst.get("bank", 0), inst["program"])
+                       for inst in resolved if inst["soundfont"] == path}
+            if not self._soundfont_fits(path, len(missing), presets):
+                return False
+            for instance in missing:
+                if not instance.load_soundfont(path):
+                    return False
+
+        unused = [path for path in self.soundfonts if path not in soundfonts]
+        self._use_instruments(resolved, soundfonts)
+        self._apply_instrument()
+        for path in unused:
+            self._desired.drop_soundfont(path)
+            for instance in instances:
+                instance.unload_soundfont(path)
+                if instance.applied is not None:
+                    instance.applied.drop_soundfont(path)
+        return True
+
+    def switch_soundfont(self, path: str) -> bool:
+        """Make `path` the primary soundfont (SOUNDFONT_PATH) without a restart."""
+        previous = config.SOUNDFONT_PATH
+        config.SOUNDFONT_PATH = path
+        if self.reload_instruments():
+            log.info("Primary soundfont -> %s", path)
+            return True
+        config.SOUNDFONT_PATH = previous
+        return False
+
+    def available_soundfonts(self) -> list[str]:
+        """.sf2/.sf3 files next to the configured soundfonts."""
+        dirs = {os.path.dirname(p) for p in self._configured_soundfonts()}
+        found = []
+        for directory in sorted(dirs):
+            try:
+                names = sorted(os.listdir(directory))
+            except OSError:
+                continue
+            found += [os.path.join(directory, name) for name in names
+                      if name.lower().endswith((".sf2", ".sf3"))]
+        return found
+
+    def _soundfont_fits(self, path: str, copies: int = 1, presets=None) -> bool:
+        """
+        Only load `path` (into `copies` instances) if MemAvailable stays
+        above SOUNDFONT_MIN_FREE_MB afterwards: swapping stalls the audio.
+        With dynamic sample loading only the samples of `presets` count.
+        """
+        index = sf2.try_read_index(path)
+        size = index.sample_bytes if index else os.path.getsize(path)
+        dynamic = self._active is not None and self._active.sample_loading == "dynamic"
+        if dynamic and index and index.preset_samples and presets is not None:
+            size = index.resident_bytes(presets)
+        needed = size * copies + config.SOUNDFONT_MIN_FREE_MB * 2**20
+        available = procfs.mem_available()
+        if available is not None and available < needed:
+            log.warning("Not loading %s — needs %d MB, %d MB available",
+                        os.path.basename(path), needed // 2**20, available // 2**20)
+            return False
+        return True
+
+    def plan_sample_loading(self, soundfonts: list[str]) -> str:
+        """
+        "preload" or "dynamic" for an instance playing `soundfonts`
+        (SOUNDFONT_LOADING). "auto" preloads when the sample data, once per
+        instance that will hold it, fits the budget: MemAvailable less
+        SOUNDFONT_MIN_FREE_MB, capped at SOUNDFONT_PRELOAD_BUDGET_MB.
+        """
+        indexes = [sf2.try_read_index(path) for path in soundfonts]
+        sample_bytes = sum(index.sample_bytes if index else os.path.getsize(path)
+                           for path, index in zip(soundfonts, indexes))
+        copies = 2 if config.FLUIDSYNTH_STANDBY else 1
+        available = procfs.mem_available()
+        budget = None
+        if available is not None:
+            budget = max(0, available - config.SOUNDFONT_MIN_FREE_MB * 2**20)
+        if config.SOUNDFONT_PRELOAD_BUDGET_MB is not None:
+            cap = int(config.SOUNDFONT_PRELOAD_BUDGET_MB * 2**20)
+            budget = cap if budget is None else min(budget, cap)
+
+        forced = cli_settings(config.FLUIDSYNTH_CMD).get(DYNAMIC_SAMPLES)
+        if forced is not None:
+            mode = "dynamic" if forced.strip() not in ("0", "") else "preload"
+            reason = f"{DYNAMIC_SAMPLES}={forced} in FLUIDSYNTH_CMD"
+        elif config.SOUNDFONT_LOADING in ("preload", "dynamic"):
+            mode, reason = config.SOUNDFONT_LOADING, "SOUNDFONT_LOADING"
+        elif budget is None:
+            mode, reason = "preload", "MemAvailable unknown"
+        elif sample_bytes * copies <= budget:
+            mode, reason = "preload", "fits the budget"
+        else:
+            mode, reason = "dynamic", "exceeds the budget"
+
+        self._loading_plan = {
+            "mode": mode,
+            "reason": reason,
+            "sample_bytes": sample_bytes,
+            "copies": copies,
+            "budget_bytes": budget,
+        }
+        log.info("Soundfont samples: %s (%d MB x%d, budget %s MB — %s)",
+                 mode, sample_bytes // 2**20, copies,
+                 budget // 2**20 if budget is not None else "?", reason)
+        return mode
+
+    def sample_loading_info(self) -> dict:
+        """
+        The active instance's sample loading mode, the sample bytes it
+        holds and how long it took to load. With dynamic loading that is
+        the samples of the presets selected on any channel: the ones set
+        here, FluidSynth's reset default (bank 0 / drum bank 128, program
+        0) on the rest.
+        """
+        active = self._active if self.is_running else None
+        info = {**self._loading_plan, "resident_bytes": None, "load_seconds": None}
+        if active is None:
+            return info
+        info["mode"] = active.sample_loading
+        info["load_seconds"] = active.ready_seconds
+        fonts = list(active.soundfonts)
+        indexes = {path: sf2.try_read_index(path) for path in fonts}
+        if active.sample_loading != "dynamic":
+            info["resident_bytes"] = sum(index.sample_bytes for index in indexes.values() if index)
+            return info
+
+        selected = {path: set() for path in fonts}
+        programs = {ch: st["program"] for ch, st in list(self._desired.channels.items())
+                    if st["program"]}
+        count = int(cli_settings(config.FLUIDSYNTH_CMD).get("synth.midi-channels") or 16)
+        for ch in range(count):
+            program = programs.get(ch) or self._default_preset(fonts, indexes, 128 if ch == 9 else 0)
+            if program is not None and program[0] in selected:
+                selected[program[0]].add(tuple(program[1:]))
+        info["resident_bytes"] = sum(
+            index.resident_bytes(selected[path]) if index.preset_samples else index.sample_bytes
+            for path, index in indexes.items() if index and selected[path])
+        return info
+
+    @staticmethod
+    def _default_preset(fonts: list[str], indexes: dict, bank: int) -> tuple | None:
+        """The (font, bank, 0) a program reset selects: latest loaded font first."""
+        for path in reversed(fonts):
+            index, font_bank = indexes.get(path), bank - bank_offset(path)
+            if index and font_bank >= 0 and index.has(font_bank, 0):
+                return path, font_bank, 0
+        return None
+
+    @staticmethod
+    def _configured_soundfonts() -> list[str]:
+        return [path for path in (config.SOUNDFONT_PATH, *config.SOUNDFONT_EXTRAS,
+                                  getattr(config, 'SOUNDFONT_FALLBACK', None)) if path]
+
+    def _resolve_instruments(self) -> list[dict] | None:
+        """INSTRUMENTS entries with the font that provides each (None: no font at all)."""
+        fonts = [path for path in self._configured_soundfonts() if os.path.isfile(path)]
+        if not fonts:
+            log.error("No SoundFont found!")
+            return None
+        if fonts[0] != config.SOUNDFONT_PATH:
+            log.warning("Primary SoundFont not found, using fallback: %s", fonts[0])
+
+        resolved, dropped = sf2.resolve_instruments(config.INSTRUMENTS, fonts)
+        for inst in dropped:
+            log.warning("Instrument '%s' (bank %d, program %d) not in any soundfont — skipped",
+                        inst["name"], inst.get("bank", 0), inst["program"])
+        if not resolved:
+            log.error("No instrument matches a soundfont preset — using the list unchecked")
+            resolved = [{**inst, "soundfont": fonts[0], "preset": None} for inst in config.INSTRUMENTS]
+        return resolved
+
+    def _use_instruments(self, resolved: list[dict], soundfonts: list[str]):
+        """Make `resolved` the instrument list, played from `soundfonts`."""
+        if self.instruments and self._current_instrument_index < len(self.instruments):
+            # Keep the current selection if it survived validation
+            current = self.instruments[self._current_instrument_index]["name"]
+            names = [inst["name"] for inst in resolved]
+            self._current_instrument_index = names.index(current) if current in names else 0
+
+        self.instruments = resolved
+        self.soundfonts = soundfonts
+
+    def soundfont_info(self) -> list[dict]:
+        """Preset index of each soundfont in use (font_id = FluidSynth's id, None if not loaded)."""
+        font_ids = self._active.font_ids if self.is_running else {}
+        info = []
+        for path in self.soundfonts:
+            index = sf2.try_read_index(path)
+            info.append({
+                "font_id": font_ids.get(path),
+                "path": path,
+                "bank_offset": bank_offset(path),
+                "sample_bytes": index.sample_bytes if index else None,
+                "presets": index.as_list() if index else [],
+            })
+        return info
+
+    def _free_shell_port(self) -> int:
+        """Shell port not used by the active or standby instance."""
+        if not config.FLUIDSYNTH_SHELL_PORT:
+            return 0
+        used = {i.shell_port for i in (self._active, self._standby) if i is not None}
+        port = config.FLUIDSYNTH_SHELL_PORT
+        while port in used:
+            port += 1
+        return port
 
     def cleanup(self):
         self.stop()
@@ -0,0 +1,913 @@
+"""
+Piano Pi Brain — Synth Backends
+
+One running FluidSynth engine behind a common interface, so the manager
+doesn't care how it is driven:
+
+  - SubprocessBackend: the `fluidsynth` CLI, controlled over its shell
+    socket (stdin as fallback)
+  - LibFluidSynthBackend: libfluidsynth loaded in-process via ctypes;
+    program changes, CCs and notes are direct C calls, and the ALSA MIDI
+    driver feeds the synth without any Python in the path
+
+Both take their settings from config.FLUIDSYNTH_CMD (plus any calibrated
+profile for the loaded soundfonts, see tuning.py), so switching
+SYNTH_BACKEND (or running either with `-a file` / `-a null` for testing)
+needs no other change.
+
+Soundfonts can be loaded and unloaded while the engine runs. FluidSynth
+numbers fonts in load order and never reuses an id, so each instance
+keeps its own path -> id map; selects name the font by path and are
+translated here, adding the font's bank offset (SOUNDFONT_BANK_OFFSETS).
+
+An instance either preloads all sample data or, with `sample_loading`
+"dynamic", runs with synth.dynamic-sample-loading: only the samples of
+the presets selected on some channel are read into RAM (the manager
+picks the mode, see FluidSynthManager.plan_sample_loading).
+"""
+
+import ctypes
+import ctypes.util
+import itertools
+import logging
+import os
+import re
+import subprocess
+import threading
+import time
+from collections import deque
+
+import config
+import procfs
+import synth_state
+import topology
+import tracing
+import tuning
+from fluid_shell import FluidShell, ShellError, ShellReply
+
+log = logging.getLogger(__name__)
+
+
+class SynthBackend:
+    """Interface for one synth engine instance."""
+
+    def __init__(self, soundfonts: list[str], shell_port: int = 0,
+                 sample_loading: str = "preload"):
+        self.soundfonts = soundfonts
+        self.shell_port = shell_port
+        self.sample_loading = sample_loading    # "preload" or "dynamic"
+        self.ready_seconds: float | None = None
+        # State last sent to this engine (None = fresh, needs full replay)
+        self.applied: synth_state.SynthState | None = None
+        # Set by stop(): an exit from here on is not a crash
+        self.stopping = False
+        # Last lines the engine wrote to stderr (for crash reports)
+        self.stderr_tail: deque[str] = deque(maxlen=config.SUPERVISOR_STDERR_LINES)
+        # Loaded soundfont path -> FluidSynth's font id
+        self.font_ids: dict[str, int] = {}
+
+    @property
+    def is_running(self) -> bool:
+        raise NotImplementedError
+
+    @property
+    def pid(self) -> int | None:
+        """Process the engine runs in (for /proc sampling)."""
+        return None
+
+    @property
+    def child_pid(self) -> int | None:
+        """Pid of the engine's own child process (None when in-process)."""
+        return None
+
+    @property
+    def returncode(self) -> int | None:
+        """Exit status of the child once it has exited (negative = signal)."""
+        return None
+
+    def wait_exit(self):
+        """Block until the child process exits."""
+
+    @property
+    def seq_ident(self) -> str | None:
+        """Id in the engine's sequencer client name, "FLUID Synth (<id>)"."""
+        raise NotImplementedError
+
+    @property
+    def shell_connected(self) -> bool:
+        return False
+
+    def launch(self) -> bool:
+        """Start the engine and return once it can play (False on failure)."""
+        return self.spawn() and self.wait_ready()
+
+    def spawn(self) -> bool:
+        """Start loading the engine, without waiting for it to be ready."""
+        raise NotImplementedError
+
+    def wait_ready(self) -> bool:
+        """Block until a spawned engine can play; False (and cleaned up) if it can't."""
+        return self.is_running
+
+    def stop(self):
+        raise NotImplementedError
+
+    def apply(self, ops: list[tuple]) -> bool:
+        """Apply synth_state operations as one batch; True if confirmed."""
+        raise NotImplementedError
+
+    def load_soundfont(self, path: str, reset: bool = False) -> bool:
+        """
+        Load another soundfont (with its bank offset) into the running
+        engine. `reset` re-selects every channel's program from the new
+        stack (startup only: afterwards the channels keep theirs).
+        """
+        raise NotImplementedError
+
+    def unload_soundfont(self, path: str) -> bool:
+        """Unload a soundfont; channels still using it should be moved first."""
+        raise NotImplementedError
+
+    def _loaded(self, path: str, font_id: int):
+        self.font_ids[path] = font_id
+        if path not in self.soundfonts:
+            self.soundfonts = [*self.soundfonts, path]
+
+    def _unloaded(self, path: str):
+        self.font_ids.pop(path, None)
+        self.soundfonts = [p for p in self.soundfonts if p != path]
+
+    def _resolve(self, ops: list[tuple]) -> list[tuple]:
+        """Selects with the font path replaced by this engine's font id and bank offset."""
+        resolved = []
+        for op in ops:
+            if op[0] == "select":
+                _, ch, path, bank, program = op
+                font_id = self.font_ids.get(path)
+                if font_id is None:
+                    log.warning("Soundfont %s not loaded — can't select %d:%d on channel %d",
+                                path, bank, program, ch)
+                    continue
+                op = ("select", ch, font_id, bank + bank_offset(path), program)
+            resolved.append(op)
+        return resolved
+
+    def get_setting(self, name: str) -> str | None:
+        return None
+
+    def get_channels(self) -> dict[int, str] | None:
+        """Preset name currently selected on each channel."""
+        return None
+
+    def get_presets(self, font_id: int = 1) -> list[dict] | None:
+        """Presets in a loaded soundfont, as {"bank", "program", "name"}."""
+        return None
+
+    def active_voices(self) -> int | None:
+        return None
+
+    def rss_bytes(self) -> int | None:
+        return None
+
+
+# ---------------------------------------------------------------------------
+# FluidSynth CLI subprocess
+# ---------------------------------------------------------------------------
+
+class SubprocessBackend(SynthBackend):
+    """One `fluidsynth` process and its shell connection."""
+
+    def __init__(self, soundfonts: list[str], shell_port: int = 0,
+                 sample_loading: str = "preload"):
+        super().__init__(soundfonts, shell_port, sample_loading)
+        self._process = None
+        self._shell = None
+        self._launched = None
+        self._next_font_id = 1          # id FluidSynth gives the next font
+        self._deferred: list[str] = []  # fonts loaded after startup (bank offset)
+
+    @property
+    def pid(self) -> int | None:
+        return self._process.pid if self._process is not None else None
+
+    @property
+    def is_running(self) -> bool:
+        return self._process is not None and self._process.poll() is None
+
+    @property
+    def child_pid(self) -> int | None:
+        return self.pid
+
+    @property
+    def returncode(self) -> int | None:
+        process = self._process
+        return process.poll() if process is not None else None
+
+    def wait_exit(self):
+        process = self._process
+        if process is not None:
+            process.wait()
+
+    @property
+    def seq_ident(self) -> str | None:
+        return str(self.pid) if self.is_running else None
+
+    @property
+    def shell_connected(self) -> bool:
+        return self._shell is not None and self._shell.connected
+
+    def spawn(self) -> bool:
+        """Start the FluidSynth process; it loads the soundfont in the background."""
+        cmd = fluidsynth_cmd(self.soundfonts, self.sample_loading)
+        if self.shell_port:
+            cmd += ["-s", "-o", f"shell.port={self.shell_port}"]
+        # FluidSynth numbers soundfonts 1, 2, ... in command-line order. The
+        # command line can't give a font a bank offset: those are loaded
+        # over the shell once it's up.
+        wanted, self.soundfonts = self.soundfonts, []
+        self._next_font_id = 1
+        for path in wanted:
+            if bank_offset(path):
+                self._deferred.append(path)
+            else:
+                cmd.append(path)
+                self._loaded(path, self._next_font_id)
+                self._next_font_id += 1
+        log.info("Starting FluidSynth: %s", " ".join(cmd))
+
+        try:
+            self._launched = time.monotonic()
+            self._process = subprocess.Popen(
+                cmd,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.PIPE,
+            )
+            return True
+        except Exception as e:
+            log.error("Failed to start FluidSynth: %s", e)
+            self._process = None
+            return False
+
+    def wait_ready(self) -> bool:
+        """Wait until the spawned FluidSynth takes commands; kill it if it never does."""
+        if self._process is None:
+            return False
+        try:
+            if not self._wait_ready():
+                if self._process.poll() is not None:
+                    stderr = self._process.stderr.read().decode(errors="replace")
+                    log.error("FluidSynth exited during startup: %s", stderr)
+                else:
+                    log.error("FluidSynth not ready after %.0fs — killing it",
+                              config.FLUIDSYNTH_READY_TIMEOUT)
+                    self._process.kill()
+                    self._process.wait()
+                self._close_shell()
+                self._process = None
+                return False
+
+            threading.Thread(target=self._drain_stderr, args=(self._process.stderr,),
+                             daemon=True).start()
+            deferred, self._deferred = self._deferred, []
+            for path in deferred:
+                self.load_soundfont(path, reset=True)
+            self.ready_seconds = time.monotonic() - self._launched
+            log.info("FluidSynth ready in %.2fs (pid %d)",
+                     self.ready_seconds, self._process.pid)
+            return True
+
+        except Exception as e:
+            log.error("FluidSynth readiness check failed: %s", e)
+            # Don't leave it running with the shell port and audio device
+            self._close_shell()
+            if self._process.poll() is None:
+                self._process.kill()
+            self._process.wait()
+            self._process = None
+            return False
+
+    def stop(self):
+        """Stop FluidSynth gracefully."""
+        if self._process is None:
+            return
+
+        self.stopping = True
+        log.info("Stopping FluidSynth (pid %d)", self._process.pid)
+
+        self._close_shell()
+
+        try:
+            # "quit" on the socket only ends that session; stdin ends the synth
+            if self.is_running:
+                self._write_stdin("quit")
+            self._process.wait(timeout=5)
+        except Exception:
+            try:
+                self._process.terminate()
+                self._process.wait(timeout=3)
+            except Exception:
+                self._process.kill()
+
+        self._process = None
+        log.info("FluidSynth stopped")
+
+    def rss_bytes(self) -> int | None:
+        return procfs.process_rss(self.pid) if self.is_running else None
+
+    def _drain_stderr(self, stream):
+        """Keep the last lines of stderr (and the pipe from filling up)."""
+        try:
+            for line in iter(stream.readline, b""):
+                self.stderr_tail.append(line.decode(errors="replace").rstrip())
+        except (OSError, ValueError):
+            pass
+        finally:
+            stream.close()
+
+    def _wait_ready(self) -> bool:
+        """
+        Poll until FluidSynth can take commands, instead of sleeping a
+        fixed time. FluidSynth opens its shell server only after the
+        soundfont is loaded and the MIDI driver is up, so a shell round
+        trip means ready; without a shell, wait for its sequencer client.
+        """
+        deadline = time.monotonic() + config.FLUIDSYNTH_READY_TIMEOUT
+        shell = FluidShell(port=self.shell_port) if self.shell_port else None
+
+        while self._process.poll() is None:
+            if shell is not None:
+                if shell.connect(timeout=0.5):
+                    try:
+                        shell.request("echo ready", timeout=1.0)
+                        self._shell = shell
+                        return True
+                    except ShellError:
+                        shell.close()
+            elif topology.take_snapshot().find_fluidsynth(str(self._process.pid)):
+                return True
+
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(config.FLUIDSYNTH_READY_POLL)
+
+        return False
+
+    def _close_shell(self):
+        if self._shell is not None:
+            self._shell.close()
+            self._shell = None
+
+    # --- Commands ---------------------------------------------------------
+
+    def apply(self, ops: list[tuple]) -> bool:
+        resolved = self._resolve(ops)
+        replies = self.send([synth_state.shell_command(op) for op in resolved])
+        return len(resolved) == len(ops) and replies is not None and all(r.ok for r in replies)
+
+    def load_soundfont(self, path: str, reset: bool = False) -> bool:
+        if path in self.font_ids:
+            return True
+        started = time.monotonic()
+        replies = self.send([f"load {_quote(path)} {int(reset)} {bank_offset(path)}"],
+                            timeout=config.FLUIDSYNTH_READY_TIMEOUT)
+        if replies is None:
+            if not self.is_running or self.shell_connected:
+                return False
+            font_id = self._next_font_id    # stdin: assume it loaded
+        else:
+            m = re.search(r"ID\s+(\d+)", " ".join(replies[0].lines))
+            if not replies[0].ok or not m:
+                log.error("FluidSynth could not load %s", path)
+                return False
+            font_id = int(m.group(1))
+        self._next_font_id = font_id + 1
+        self._loaded(path, font_id)
+        log.info("Loaded soundfont %s as font %d in %.2fs",
+                 os.path.basename(path), font_id, time.monotonic() - started)
+        return True
+
+    def unload_soundfont(self, path: str) -> bool:
+        font_id = self.font_ids.get(path)
+        if font_id is None:
+            return True
+        replies = self.send([f"unload {font_id} 0"], timeout=config.FLUIDSYNTH_READY_TIMEOUT)
+        if replies is not None and not replies[0].ok:
+            return False
+        self._unloaded(path)
+        log.info("Unloaded soundfont %s (font %d)", os.path.basename(path), font_id)
+        return True
+
+    def send(self, commands: list[str], timeout: float | None = None) -> list[ShellReply] | None:
+        """
+        Send commands in one pipelined write and wait for FluidSynth to
+        acknowledge them (within `timeout`, default FLUIDSYNTH_SHELL_TIMEOUT).
+        Falls back to fire-and-forget stdin (returning None) when the shell
+        socket is unavailable.
+        """
+        if not self.is_running:
+            log.warning("Cannot send command — FluidSynth not running")
+            return None
+
+        if self.shell_connected:
+            try:
+                with tracing.span("fluidsynth.send", "synth", commands=len(commands)):
+                    replies = self._shell.send(
+                        commands, timeout=timeout or config.FLUIDSYNTH_SHELL_TIMEOUT)
+            except ShellError as e:
+                log.error("FluidSynth shell error: %s", e)
+                return None
+            for reply in replies:
+                if not reply.ok:
+                    log.warning("FluidSynth rejected '%s': %s",
+                                reply.command, "; ".join(reply.lines))
+            return replies
+
+        for command in commands:
+            self._write_stdin(command)
+        return None
+
+    def _write_stdin(self, command: str):
+        try:
+            self._process.stdin.write(f"{command}\n".encode())
+            self._process.stdin.flush()
+        except (BrokenPipeError, OSError) as e:
+            log.error("Failed to send command to FluidSynth: %s", e)
+
+    # --- Queries (shell socket only) ---------------------------------------
+
+    def query(self, command: str) -> list[str] | None:
+        """Run a read-only shell command; None if the shell is unavailable."""
+        if not self.shell_connected:
+            return None
+        replies = self.send([command])
+        return replies[0].lines if replies and replies[0].ok else None
+
+    def get_setting(self, name: str) -> str | None:
+        lines = self.query(f"get {name}")
+        return lines[0].strip() if lines else None
+
+    def get_channels(self) -> dict[int, str] | None:
+        lines = self.query("channels")
+        if lines is None:
+            return None
+        channels = {}
+        for line in lines:
+            # "chan 0, Yamaha Grand Piano"
+            m = re.match(r"chan\s+(\d+),\s*(.*)", line)
+            if m:
+                channels[int(m.group(1))] = m.group(2).strip()
+        return channels
+
+    def get_presets(self, font_id: int = 1) -> list[dict] | None:
+        lines = self.query(f"inst {font_id}")
+        if lines is None:
+            return None
+        presets = []
+        for line in lines:
+            # "000-004 Rhodes Piano"
+            m = re.match(r"(\d+)-(\d+)\s+(.*)", line.strip())
+            if m:
+                presets.append({
+                    "bank": int(m.group(1)),
+                    "program": int(m.group(2)),
+                    "name": m.group(3).strip(),
+                })
+        return presets
+
+
+# ---------------------------------------------------------------------------
+# In-process libfluidsynth
+# ---------------------------------------------------------------------------
+
+# CLI flags in FLUIDSYNTH_CMD -> FluidSynth settings
+_CLI_SETTINGS = {
+    "-a": "audio.driver",
+    "-m": "midi.driver",
+    "-r": "synth.sample-rate",
+    "-c": "audio.periods",
+    "-z": "audio.period-size",
+    "-g": "synth.gain",
+    "-K": "synth.midi-channels",
+    "-L": "synth.audio-channels",
+}
+
+_CLI_FLAGS = {name: flag for flag, name in _CLI_SETTINGS.items()}
+
+DYNAMIC_SAMPLES = "synth.dynamic-sample-loading"
+
+FLUID_OK = 0
+FLUID_NUM_TYPE, FLUID_INT_TYPE, FLUID_STR_TYPE = 0, 1, 2
+
+
+def cli_settings(cmd: list[str]) -> dict[str, str]:
+    """Translate a fluidsynth command line into a settings dict."""
+    settings = {}
+    args = iter(cmd[1:])
+    for arg in args:
+        if arg in _CLI_SETTINGS:
+            settings[_CLI_SETTINGS[arg]] = next(args, "")
+        elif arg == "-o":
+            key, _, value = next(args, "").partition("=")
+            settings[key] = value
+        elif arg.startswith("-C"):
+            settings["synth.chorus.active"] = arg[2:] or next(args, "0")
+        elif arg.startswith("-R"):
+            settings["synth.reverb.active"] = arg[2:] or next(args, "0")
+    return settings
+
+
+def apply_settings(cmd: list[str], settings: dict) -> list[str]:
+    """
+    Copy of a fluidsynth command line with `settings` overridden: the
+    value after a matching flag (-z) or `-o name=` is replaced, anything
+    not on the command line is appended as `-o name=value`.
+    """
+    cmd = list(cmd)
+    for name, value in settings.items():
+        flag = _CLI_FLAGS.get(name)
+        i = 1
+        while i < len(cmd):
+            if cmd[i] == flag:
+                cmd[i + 1] = str(value)
+                break
+            if cmd[i] == "-o" and cmd[i + 1].partition("=")[0] == name:
+                cmd[i + 1] = f"{name}={value}"
+                break
+            i += 2 if cmd[i] in _CLI_SETTINGS or cmd[i] == "-o" else 1
+        else:
+            cmd += ["-o", f"{name}={value}"]
+    return cmd
+
+
+def bank_offset(path: str) -> int:
+    """Bank offset configured for soundfont `path` (0 = none)."""
+    return config.SOUNDFONT_BANK_OFFSETS.get(path, 0)
+
+
+def _quote(arg: str) -> str:
+    """`arg` as one word for the FluidSynth shell."""
+    if arg and not any(c.isspace() or c in "\"'\\" for c in arg):
+        return arg
+    return '"' + arg.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def fluidsynth_cmd(soundfonts: list[str], sample_loading: str = "preload") -> list[str]:
+    """
+    config.FLUIDSYNTH_CMD with the calibrated profile for `soundfonts`
+    applied, and dynamic sample loading switched on if asked for.
+    """
+    cmd = list(config.FLUIDSYNTH_CMD)
+    tuned = tuning.lookup(soundfonts)
+    if tuned:
+        log.info("Using calibrated FluidSynth settings: %s", tuned)
+        cmd = apply_settings(cmd, tuned)
+    if sample_loading == "dynamic":
+        # FluidSynth >= 2.0.7; older versions ignore it and preload
+        cmd = apply_settings(cmd, {DYNAMIC_SAMPLES: 1})
+    return cmd
+
+
+def _load_library():
+    """libfluidsynth handle with the prototypes we use, or None."""
+    names = [ctypes.util.find_library("fluidsynth"),
+             "libfluidsynth.so.3", "libfluidsynth.so.2", "libfluidsynth.so.1"]
+    for name in filter(None, names):
+        try:
+            lib = ctypes.CDLL(name)
+            break
+        except OSError:
+            continue
+    else:
+        return None
+
+    p, i, d, c = ctypes.c_void_p, ctypes.c_int, ctypes.c_double, ctypes.c_char_p
+    protos = {
+        "new_fluid_settings": (p, []),
+        "delete_fluid_settings": (None, [p]),
+        "fluid_settings_get_type": (i, [p, c]),
+        "fluid_settings_setstr": (i, [p, c, c]),
+        "fluid_settings_setint": (i, [p, c, i]),
+        "fluid_settings_setnum": (i, [p, c, d]),
+        "fluid_settings_copystr": (i, [p, c, ctypes.c_char_p, i]),
+        "fluid_settings_getint": (i, [p, c, ctypes.POINTER(i)]),
+        "fluid_settings_getnum": (i, [p, c, ctypes.POINTER(d)]),
+        "new_fluid_synth": (p, [p]),
+        "delete_fluid_synth": (None, [p]),
+        "fluid_synth_sfload": (i, [p, c, i]),
+        "fluid_synth_sfunload": (i, [p, i, i]),
+        "fluid_synth_set_bank_offset": (i, [p, i, i]),
+        "fluid_synth_program_select": (i, [p, i, i, i, i]),
+        "fluid_synth_get_program": (i, [p, i, ctypes.POINTER(i), ctypes.POINTER(i), ctypes.POINTER(i)]),
+        "fluid_synth_cc": (i, [p, i, i, i]),
+        "fluid_synth_noteon": (i, [p, i, i, i]),
+        "fluid_synth_noteoff": (i, [p, i, i]),
+        "fluid_synth_set_gain": (None, [p, ctypes.c_float]),
+        "fluid_synth_get_active_voice_count": (i, [p]),
+        "fluid_synth_get_sfont_by_id": (p, [p, i]),
+        "fluid_sfont_get_preset": (p, [p, i, i]),
+        "fluid_sfont_iteration_start": (None, [p]),
+        "fluid_sfont_iteration_next": (p, [p]),
+        "fluid_preset_get_name": (c, [p]),
+        "fluid_preset_get_banknum": (i, [p]),
+        "fluid_preset_get_num": (i, [p]),
+        "new_fluid_audio_driver": (p, [p, p]),
+        "delete_fluid_audio_driver": (None, [p]),
+        "new_fluid_midi_driver": (p, [p, p, p]),
+        "delete_fluid_midi_driver": (None, [p]),
+    }
+    # Effect switches were renamed in 2.2; accept either spelling
+    optional = {
+        "fluid_synth_reverb_on": (i, [p, i, i]),
+        "fluid_synth_chorus_on": (i, [p, i, i]),
+        "fluid_synth_set_reverb_on": (None, [p, i]),
+        "fluid_synth_set_chorus_on": (None, [p, i]),
+        "fluid_synth_get_ticks": (ctypes.c_uint, [p]),
+    }
+
+    try:
+        for name, (restype, argtypes) in protos.items():
+            fn = getattr(lib, name)
+            fn.restype, fn.argtypes = restype, argtypes
+    except AttributeError as e:
+        log.error("libfluidsynth is missing %s", e)
+        return None
+    for name, (restype, argtypes) in optional.items():
+        fn = getattr(lib, name, None)
+        if fn is not None:
+            fn.restype, fn.argtypes = restype, argtypes
+    return lib
+
+
+_lib = None
+_ids = itertools.count(1)
+
+
+def libfluidsynth():
+    global _lib
+    if _lib is None:
+        _lib = _load_library() or False
+    return _lib or None
+
+
+class LibFluidSynthBackend(SynthBackend):
+    """FluidSynth running inside this process via libfluidsynth."""
+
+    def __init__(self, soundfonts: list[str], shell_port: int = 0,
+                 sample_loading: str = "preload"):
+        super().__init__(soundfonts, shell_port, sample_loading)
+        self._lib = libfluidsynth()
+        self._settings = None
+        self._synth = None
+        self._adriver = None
+        self._mdriver = None
+        # Distinct sequencer client name per instance (pid is shared)
+        self._ident = f"piano-pi-{next(_ids)}"
+        # Samples rendered so far, and when that last changed
+        self._ticks = None
+        self._ticks_changed = 0.0
+
+    @property
+    def is_running(self) -> bool:
+        """
+        The synth exists, its audio driver is open and has rendered
+        something within FLUIDSYNTH_STALL_SECONDS (a dead or hung audio
+        thread stops the tick counter, like an exited process).
+        """
+        if self._synth is None or not self._adriver:
+            return False
+        get_ticks = getattr(self._lib, "fluid_synth_get_ticks", None)
+        if get_ticks is None:
+            return True
+        ticks, now = get_ticks(self._synth), time.monotonic()
+        if ticks != self._ticks:
+            self._ticks, self._ticks_changed = ticks, now
+            return True
+        return now - self._ticks_changed < config.FLUIDSYNTH_STALL_SECONDS
+
+    @property
+    def pid(self) -> int | None:
+        return os.getpid() if self.is_running else None
+
+    @property
+    def seq_ident(self) -> str | None:
+        return self._ident if self.is_running else None
+
+    def spawn(self) -> bool:
+        # Loading is synchronous here: once spawned, the synth is ready
+        lib = self._lib
+        if lib is None:
+            log.error("libfluidsynth not found — can't use the in-process backend")
+            return False
+
+        launched = time.monotonic()
+        self._settings = lib.new_fluid_settings()
+        settings = cli_settings(fluidsynth_cmd(self.soundfonts, self.sample_loading))
+        settings["midi.alsa_seq.id"] = self._ident
+        for name, value in settings.items():
+            self._set(name, value)
+
+        self._synth = lib.new_fluid_synth(self._settings)
+        if not self._synth:
+            log.error("new_fluid_synth failed")
+            self.stop()
+            return False
+
+        wanted, self.soundfonts = self.soundfonts, []
+        for path in wanted:
+            # Ids are assigned 1, 2, ... in load order, as on the CLI
+            if not self.load_soundfont(path, reset=True):
+                self.stop()
+                return False
+
+        self._adriver = lib.new_fluid_audio_driver(self._settings, self._synth)
+        if not self._adriver:
+            log.error("Failed to open audio driver %s", settings.get("audio.driver"))
+            self.stop()
+            return False
+        self._ticks, self._ticks_changed = None, time.monotonic()
+
+        if settings.get("midi.driver"):
+            # The C handler is passed straight through: MIDI never enters Python
+            handler = ctypes.cast(lib.fluid_synth_handle_midi_event, ctypes.c_void_p)
+            self._mdriver = lib.new_fluid_midi_driver(self._settings, handler, self._synth)
+            if not self._mdriver:
+                log.warning("Failed to open MIDI driver %s", settings["midi.driver"])
+
+        self.ready_seconds = time.monotonic() - launched
+        log.info("libfluidsynth ready in %.2fs (%s)", self.ready_seconds, self._ident)
+        return True
+
+    def stop(self):
+        lib = self._lib
+        if self._synth:
+            self.stopping = True
+        if self._mdriver:
+            lib.delete_fluid_midi_driver(self._mdriver)
+        if self._adriver:
+            lib.delete_fluid_audio_driver(self._adriver)
+        if self._synth:
+            lib.delete_fluid_synth(self._synth)
+            log.info("libfluidsynth stopped (%s)", self._ident)
+        if self._settings:
+            lib.delete_fluid_settings(self._settings)
+        self._mdriver = self._adriver = self._synth = self._settings = None
+
+    def _set(self, name: str, value: str):
+        lib, key = self._lib, name.encode()
+        kind = lib.fluid_settings_get_type(self._settings, key)
+        try:
+            if kind == FLUID_INT_TYPE:
+                ok = lib.fluid_settings_setint(self._settings, key, int(value))
+            elif kind == FLUID_NUM_TYPE:
+                ok = lib.fluid_settings_setnum(self._settings, key, float(value))
+            else:
+                ok = lib.fluid_settings_setstr(self._settings, key, str(value).encode())
+        except ValueError:
+            ok = -1
+        if ok != FLUID_OK:
+            log.warning("libfluidsynth rejected setting %s=%s", name, value)
+
+    # --- Commands ---------------------------------------------------------
+
+    @tracing.traced("libfluidsynth.apply", "synth")
+    def apply(self, ops: list[tuple]) -> bool:
+        if self._synth is None:
+            log.warning("Cannot send command — FluidSynth not running")
+            return False
+
+        resolved = self._resolve(ops)
+        lib, synth, ok = self._lib, self._synth, len(resolved) == len(ops)
+        for kind, *args in resolved:
+            if kind == "select":
+                result = lib.fluid_synth_program_select(synth, *args)
+            elif kind == "cc":
+                result = lib.fluid_synth_cc(synth, *args)
+            elif kind == "noteon":
+                result = lib.fluid_synth_noteon(synth, *args)
+            elif kind == "noteoff":
+                result = lib.fluid_synth_noteoff(synth, *args)
+            elif kind == "gain":
+                lib.fluid_synth_set_gain(synth, float(args[0]))
+                result = FLUID_OK
+            elif kind in ("reverb", "chorus"):
+                result = self._set_effect(kind, bool(args[0]))
+            else:
+                result = -1
+            if result != FLUID_OK:
+                log.warning("libfluidsynth rejected %s %s", kind, args)
+                ok = False
+        return ok
+
+    def load_soundfont(self, path: str, reset: bool = False) -> bool:
+        if self._synth is None:
+            return False
+        if path in self.font_ids:
+            return True
+        lib = self._lib
+        font_id = lib.fluid_synth_sfload(self._synth, path.encode(), int(reset))
+        if font_id < 0:
+            log.error("Failed to load soundfont %s", path)
+            return False
+        offset = bank_offset(path)
+        if offset and lib.fluid_synth_set_bank_offset(self._synth, font_id, offset) != FLUID_OK:
+            log.warning("libfluidsynth rejected bank offset %d for %s", offset, path)
+        self._loaded(path, font_id)
+        return True
+
+    def unload_soundfont(self, path: str) -> bool:
+        font_id = self.font_ids.get(path)
+        if font_id is None or self._synth is None:
+            return True
+        if self._lib.fluid_synth_sfunload(self._synth, font_id, 0) != FLUID_OK:
+            log.error("Failed to unload soundfont %s", path)
+            return False
+        self._unloaded(path)
+        return True
+
+    def _set_effect(self, kind: str, on: bool) -> int:
+        new = getattr(self._lib, f"fluid_synth_{kind}_on", None)
+        if new is not None:
+            return new(self._synth, -1, int(on))
+        old = getattr(self._lib, f"fluid_synth_set_{kind}_on", None)
+        if old is None:
+            log.warning("libfluidsynth has no way to switch %s", kind)
+            return -1
+        old(self._synth, int(on))
+        return FLUID_OK
+
+    # --- Queries ------------------------------------------------------------
+
+    def get_setting(self, name: str) -> str | None:
+        if self._settings is None:
+            return None
+        lib, key = self._lib, name.encode()
+        kind = lib.fluid_settings_get_type(self._settings, key)
+        if kind == FLUID_INT_TYPE:
+            value = ctypes.c_int()
+            if lib.fluid_settings_getint(self._settings, key, ctypes.byref(value)) == FLUID_OK:
+                return str(value.value)
+        elif kind == FLUID_NUM_TYPE:
+            value = ctypes.c_double()
+            if lib.fluid_settings_getnum(self._settings, key, ctypes.byref(value)) == FLUID_OK:
+                return str(value.value)
+        elif kind == FLUID_STR_TYPE:
+            buf = ctypes.create_string_buffer(256)
+            if lib.fluid_settings_copystr(self._settings, key, buf, len(buf)) == FLUID_OK:
+                return buf.value.decode()
+        return None
+
+    def get_channels(self) -> dict[int, str] | None:
+        if self._synth is None:
+            return None
+        lib = self._lib
+        channels = {}
+        sfont_id, bank, program = ctypes.c_int(), ctypes.c_int(), ctypes.c_int()
+        count = int(self.get_setting("synth.midi-channels") or 16)
+        for ch in range(count):
+            if lib.fluid_synth_get_program(self._synth, ch, ctypes.byref(sfont_id),
+                                           ctypes.byref(bank), ctypes.byref(program)) != FLUID_OK:
+                continue
+            sfont = lib.fluid_synth_get_sfont_by_id(self._synth, sfont_id.value)
+            preset = lib.fluid_sfont_get_preset(sfont, bank.value, program.value) if sfont else None
+            if preset:
+                channels[ch] = lib.fluid_preset_get_name(preset).decode(errors="replace")
+        return channels
+
+    def get_presets(self, font_id: int = 1) -> list[dict] | None:
+        if self._synth is None:
+            return None
+        lib = self._lib
+        sfont = lib.fluid_synth_get_sfont_by_id(self._synth, font_id)
+        if not sfont:
+            return None
+        presets = []
+        lib.fluid_sfont_iteration_start(sfont)
+        while preset := lib.fluid_sfont_iteration_next(sfont):
+            presets.append({
+                "bank": lib.fluid_preset_get_banknum(preset),
+                "program": lib.fluid_preset_get_num(preset),
+                "name": lib.fluid_preset_get_name(preset).decode(errors="replace"),
+            })
+        return presets
+
+    def active_voices(self) -> int | None:
+        if self._synth is None:
+            return None
+        return self._lib.fluid_synth_get_active_voice_count(self._synth)
+
+
+BACKENDS = {
+    "subprocess": SubprocessBackend,
+    "libfluidsynth": LibFluidSynthBackend,
+}
+
+
+def create_backend(soundfonts: list[str], shell_port: int = 0,
+                   sample_loading: str = "preload") -> SynthBackend:
+    """Instantiate the backend selected by config.SYNTH_BACKEND."""
+    cls = BACKENDS.get(config.SYNTH_BACKEND)
+    if cls is None:
+        log.error("Unknown SYNTH_BACKEND %r — using subprocess", config.SYNTH_BACKEND)
+        cls = SubprocessBackend
+    return cls(soundfonts, shell_port, sample_loading)
@@ -0,0 +1,87 @@
+"""
+Piano Pi Brain — Synth State Mirror
+
+In-process copy of what FluidSynth *should* be doing: program, bank and
+CCs per channel plus synth-wide gain/reverb/chorus. The manager keeps one
+desired state and, per FluidSynth instance, the state last applied to it;
+diff() turns the difference into a minimal list of operations that are
+sent in a single batch. A fresh instance has no applied state, so the
+diff is the full replay.
+"""
+
+import copy
+
+
+class SynthState:
+    """Desired (or applied) state of one synth."""
+
+    def __init__(self):
+        # channel -> {"program": (soundfont, bank, program), "cc": {num: value}};
+        # the soundfont is a path, each instance knows its own font ids
+        self.channels: dict[int, dict] = {}
+        # "gain" -> float, "reverb"/"chorus" -> bool
+        self.settings: dict[str, object] = {}
+
+    def copy(self) -> "SynthState":
+        return copy.deepcopy(self)
+
+    def _channel(self, ch: int) -> dict:
+        return self.channels.setdefault(ch, {"program": None, "cc": {}})
+
+    def set_program(self, ch: int, soundfont: str, bank: int, program: int):
+        self._channel(ch)["program"] = (soundfont, bank, program)
+
+    def drop_soundfont(self, soundfont: str):
+        """Forget programs from an unloaded soundfont."""
+        for st in self.channels.values():
+            if st["program"] is not None and st["program"][0] == soundfont:
+                st["program"] = None
+
+    def set_cc(self, ch: int, num: int, value: int):
+        self._channel(ch)["cc"][num] = value
+
+    def set(self, name: str, value):
+        self.settings[name] = value
+
+    def as_dict(self) -> dict:
+        return {
+            "channels": {
+                ch: {"program": st["program"], "cc": dict(st["cc"])}
+                for ch, st in sorted(self.channels.items())
+            },
+            **self.settings,
+        }
+
+
+def diff(desired: SynthState, applied: SynthState | None) -> list[tuple]:
+    """
+    Operations that bring `applied` up to `desired`:
+        ("gain", value), ("reverb", on), ("chorus", on),
+        ("select", ch, soundfont, bank, program), ("cc", ch, num, value)
+    A backend turns the soundfont path into its font id (and bank offset)
+    before sending a select.
+    """
+    applied = applied or SynthState()
+    ops = []
+
+    for name, value in desired.settings.items():
+        if applied.settings.get(name) != value:
+            ops.append((name, value))
+
+    for ch, st in sorted(desired.channels.items()):
+        have = applied.channels.get(ch, {"program": None, "cc": {}})
+        if st["program"] is not None and st["program"] != have["program"]:
+            ops.append(("select", ch, *st["program"]))
+        for num, value in sorted(st["cc"].items()):
+            if have["cc"].get(num) != value:
+                ops.append(("cc", ch, num, value))
+
+    return ops
+
+
+def shell_command(op: tuple) -> str:
+    """Render an operation as a FluidSynth shell command."""
+    kind, *args = op
+    if kind in ("reverb", "chorus"):
+        return f"{kind} {'on' if args[0] else 'off'}"
+    return " ".join([kind, *map(str, args)])
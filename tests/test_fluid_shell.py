@@ -0,0 +1,103 @@
+"""FluidShell against FakeShellServer: framing, replies, errors, reconnect."""
+
+import time
+
+import pytest
+
+from fluid_shell import FakeShellServer, FluidShell, ShellError
+
+
+@pytest.fixture
+def server():
+    server = FakeShellServer(presets={(0, 0): "Grand Piano", (0, 4): "Rhodes"})
+    yield server
+    server.close()
+
+
+@pytest.fixture
+def shell(server):
+    shell = FluidShell(port=server.port)
+    assert shell.connect()
+    yield shell
+    shell.close()
+
+
+def _wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def test_each_command_is_framed_by_an_echo_token(shell, server):
+    reply = shell.request("echo hello")
+    assert reply.ok and reply.lines == ["hello"]
+    sent = [line for _, line in server.commands]
+    assert sent[0] == "echo hello"
+    assert sent[1].startswith("echo __pp_ack_")
+
+
+def test_pipelined_replies_are_matched_to_their_commands(shell, server):
+    replies = shell.send(["select 0 1 0 4", "gain 0.5", "channels", "get synth.gain"])
+    assert [r.command for r in replies] == ["select 0 1 0 4", "gain 0.5", "channels",
+                                            "get synth.gain"]
+    assert replies[0].lines == [] and replies[1].lines == []
+    assert replies[2].lines == ["chan 0, Rhodes"]
+    assert replies[3].lines == ["0.5"]
+    assert all(r.ok for r in replies)
+
+
+def test_multi_line_replies(shell):
+    reply = shell.request("inst 1")
+    assert reply.ok
+    assert reply.lines == ["000-000 Grand Piano", "000-004 Rhodes"]
+
+
+def test_errors_are_detected_from_the_reply_text(shell):
+    unknown, bad_select, fine = shell.send(["frobnicate", "select 0 1 0 99", "echo ok"])
+    assert not unknown.ok and "unknown command" in unknown.lines[0]
+    assert not bad_select.ok
+    assert fine.ok
+
+
+def test_load_and_unload_soundfonts(shell, server, tmp_path):
+    font = tmp_path / "extra.sf2"
+    font.write_bytes(b"")
+    loaded = shell.request(f"load {font} 0 128")
+    assert loaded.ok and loaded.lines == ["loaded SoundFont has ID 2"]
+    assert server.fonts[2] == (str(font), 128)
+
+    assert shell.request("select 3 2 128 4").ok
+    assert shell.request("unload 2 0").ok
+    assert 3 not in server.channels
+    assert not shell.request("unload 2 0").ok
+    assert not shell.request(f"load {tmp_path / 'missing.sf2'} 0 0").ok
+
+
+def test_reconnect_after_the_server_drops(shell, server):
+    assert shell.request("echo before").ok
+    server.drop_clients()
+    assert _wait_for(lambda: not shell.connected)
+    with pytest.raises(ShellError):
+        shell.request("echo while down")
+
+    assert shell.connect()
+    assert shell.request("echo after").lines == ["after"]
+
+
+def test_submit_fails_once_the_shell_is_closed(server):
+    shell = FluidShell(port=server.port)
+    assert shell.connect()
+    futures = shell.submit(["echo a"])
+    futures[0].result(timeout=2)
+    shell.close()
+    with pytest.raises(ShellError):
+        shell.submit(["echo b"])
+
+
+def test_connect_fails_while_nothing_listens(server):
+    port = server.port
+    server.close()
+    assert not FluidShell(port=port).connect(timeout=0.2)
@@ -0,0 +1,160 @@
+"""MidiMonitor routing, driven by FakeSequencer over the bench's fake ALSA graph."""
+
+import os
+import sys
+import time
+
+import pytest
+
+import alsa_seq
+import config
+import topology
+from midi_monitor import MidiMonitor
+
+BENCH_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "bench")
+sys.path.insert(0, BENCH_DIR)
+import fakeseq  # noqa: E402
+
+SYNTH = "100"
+STANDBY = "200"
+
+
+@pytest.fixture
+def seq(tmp_path, monkeypatch):
+    """A fresh fake sequencer graph, with the stub aconnect on PATH."""
+    monkeypatch.setenv("BENCH_SEQ_STATE", str(tmp_path / "seq.json"))
+    monkeypatch.setenv("BENCH_SEQ_PROC", str(tmp_path / "clients"))
+    monkeypatch.setenv("BENCH_ACONNECT_LOG", str(tmp_path / "aconnect.log"))
+    monkeypatch.setenv("PATH", os.path.join(BENCH_DIR, "stubs") + os.pathsep + os.environ["PATH"])
+    monkeypatch.setattr(topology, "PROC_CLIENTS", str(tmp_path / "clients"))
+    monkeypatch.setattr(config, "MIDI_POLL_INTERVAL", 3600.0)
+    fakeseq.reset()
+    return alsa_seq.FakeSequencer()
+
+
+def add_synth(ident: str) -> int:
+    return fakeseq.add_client(f"FLUID Synth ({ident})",
+                              [(f"Synth input port ({ident}:0)", "-We-")], user=True)
+
+
+def add_keyboard(name="Keyboard") -> int:
+    return fakeseq.add_client(name, [("MIDI 1", "R-e-")])
+
+
+def add_sink(name: str) -> int:
+    return fakeseq.add_client(name, [("in", "-We-")], user=True)
+
+
+def links(cid: int) -> set[str]:
+    return set(fakeseq.snapshot()["clients"][str(cid)]["ports"]["0"]["to"])
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+class Events:
+    def __init__(self):
+        self.connected = []
+        self.disconnected = 0
+
+    def on_connected(self, name):
+        self.connected.append(name)
+
+    def on_disconnected(self):
+        self.disconnected += 1
+
+
+@pytest.fixture
+def monitor(seq):
+    events = Events()
+    monitor = MidiMonitor(events.on_connected, events.on_disconnected,
+                          sequencer=seq, synth_ident=lambda: SYNTH)
+    monitor.events = events
+    yield monitor
+    monitor.stop()
+
+
+def test_announced_controller_is_connected_to_fluidsynth(seq, monitor):
+    fs = add_synth(SYNTH)
+    monitor.start()
+
+    kb = add_keyboard()
+    seq.push(alsa_seq.CLIENT_START, kb)
+    seq.push(alsa_seq.PORT_START, kb, 0)
+
+    assert wait_for(lambda: monitor.events.connected == ["Keyboard"])
+    assert links(kb) == {f"{fs}:0"}
+    assert monitor.has_midi
+
+
+def test_controller_is_moved_off_the_standby_synth(seq, monitor):
+    fs = add_synth(SYNTH)
+    standby = add_synth(STANDBY)
+    kb = add_keyboard()
+    fakeseq.set_connected(f"{kb}:0", f"{standby}:0", True)
+    monitor.start()
+
+    seq.push(alsa_seq.CLIENT_START, standby)
+
+    assert wait_for(lambda: links(kb) == {f"{fs}:0"})
+
+
+def test_unplugged_controller_reports_disconnect(seq, monitor):
+    add_synth(SYNTH)
+    kb = add_keyboard()
+    monitor.start()
+    seq.push(alsa_seq.CLIENT_START, kb)
+    assert wait_for(lambda: monitor.has_midi)
+
+    fakeseq.remove_client(kb)
+    seq.push(alsa_seq.CLIENT_EXIT, kb)
+
+    assert wait_for(lambda: monitor.events.disconnected == 1)
+    assert not monitor.has_midi
+
+
+def test_divert_routes_controllers_to_the_divert_port(seq, monitor):
+    fs = add_synth(SYNTH)
+    arp = add_sink("Piano Pi Arpeggiator")
+    kb = add_keyboard()
+    monitor.connect_all()
+    assert links(kb) == {f"{fs}:0"}
+
+    monitor.divert((arp, 0))
+    monitor.connect_all()
+    assert links(kb) == {f"{arp}:0"}
+
+    monitor.divert(None)
+    monitor.connect_all()
+    assert links(kb) == {f"{fs}:0"}
+
+
+def test_taps_receive_every_controller_alongside_fluidsynth(seq, monitor):
+    fs = add_synth(SYNTH)
+    capture = add_sink("Piano Pi Capture")
+    monitor.add_tap((capture, 0))
+    monitor.start()
+
+    kb = add_keyboard()
+    seq.push(alsa_seq.CLIENT_START, kb)
+
+    assert wait_for(lambda: links(kb) == {f"{fs}:0", f"{capture}:0"})
+    # The tap's own client is never treated as a controller
+    assert monitor.events.connected == ["Keyboard"]
+
+
+def test_nothing_is_routed_while_fluidsynth_is_down(seq, monitor):
+    kb = add_keyboard()
+    monitor.connect_all()
+    assert links(kb) == set()
+    assert not monitor.has_midi
+
+    fs = add_synth(SYNTH)
+    monitor.connect_all()
+    assert links(kb) == {f"{fs}:0"}
@@ -0,0 +1,66 @@
+"""FluidSynthManager state sync against a scripted backend."""
+
+import pytest
+
+import config
+from synth import FluidSynthManager
+from synth_backend import SynthBackend
+
+
+class ScriptedBackend(SynthBackend):
+    """Records every batch; apply() answers with `confirm`."""
+
+    def __init__(self):
+        super().__init__([config.SOUNDFONT_PATH])
+        self.batches = []
+        self.confirm = True
+
+    @property
+    def is_running(self) -> bool:
+        return True
+
+    @property
+    def seq_ident(self) -> str | None:
+        return "test"
+
+    def apply(self, ops):
+        self.batches.append(ops)
+        return self.confirm
+
+
+@pytest.fixture
+def manager():
+    manager = FluidSynthManager()
+    manager.make_active(ScriptedBackend())
+    return manager
+
+
+def test_only_differences_are_sent(manager):
+    backend = manager.active
+    manager.set_gain(0.5)
+    manager.set_cc(0, 7, 100)
+    assert backend.batches == [[("gain", 0.5)], [("cc", 0, 7, 100)]]
+
+
+def test_unconfirmed_batch_is_sent_again(manager):
+    backend = manager.active
+    backend.confirm = False
+    manager.set_gain(0.5)
+    backend.confirm = True
+    manager.set_cc(0, 7, 100)
+    assert backend.batches == [[("gain", 0.5)], [("gain", 0.5), ("cc", 0, 7, 100)]]
+
+    manager.set_effect("reverb", True)
+    assert backend.batches[-1] == [("reverb", True)]
+
+
+def test_select_before_its_font_loads_is_retried(manager):
+    backend = manager.active
+    backend.confirm = False
+    manager.select_instrument(0)
+    select = backend.batches[-1]
+    assert select and all(op[0] == "select" for op in select)
+
+    backend.confirm = True
+    manager.set_gain(0.5)
+    assert backend.batches[-1] == [("gain", 0.5), *select]
@@ -0,0 +1,136 @@
+"""
+Both synth backends against a real FluidSynth rendering to a file.
+
+Skipped when the fluidsynth binary / libfluidsynth, or a GM soundfont
+to load, isn't installed.
+"""
+
+import os
+import shutil
+import socket
+
+import pytest
+
+import config
+import synth_backend
+
+SOUNDFONTS = [
+    config.SOUNDFONT_FALLBACK,
+    "/usr/share/sounds/sf2/FluidR3_GM.sf2",
+    "/usr/share/sounds/sf2/default-GM.sf2",
+    "/usr/share/soundfonts/default.sf2",
+]
+SOUNDFONT = next((path for path in SOUNDFONTS if os.path.isfile(path)), None)
+
+
+def _available(name: str) -> bool:
+    if name == "subprocess":
+        return shutil.which("fluidsynth") is not None
+    return synth_backend.libfluidsynth() is not None
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture(params=list(synth_backend.BACKENDS))
+def backend(request, tmp_path, monkeypatch):
+    """An unstarted backend that renders to a file instead of ALSA."""
+    if not _available(request.param):
+        pytest.skip(f"{request.param} backend: FluidSynth not installed")
+    if SOUNDFONT is None:
+        pytest.skip("no GM soundfont installed")
+
+    monkeypatch.setattr(config, "SYNTH_BACKEND", request.param)
+    monkeypatch.setattr(config, "SOUNDFONT_BANK_OFFSETS", {})
+    monkeypatch.setattr(config, "FLUIDSYNTH_CMD", [
+        "fluidsynth",
+        "-a", "file",
+        "-o", f"audio.file.name={tmp_path / 'out.wav'}",
+        "-r", "44100",
+        "-g", "1.0",
+        "-C0",
+        "-R0",
+    ])
+    backend = synth_backend.create_backend([SOUNDFONT], shell_port=_free_port())
+    yield backend
+    backend.stop()
+
+
+@pytest.fixture
+def running(backend):
+    assert backend.launch()
+    return backend
+
+
+def _two_presets(backend) -> list[dict]:
+    presets = [p for p in backend.get_presets(backend.font_ids[SOUNDFONT]) if p["bank"] == 0]
+    assert len(presets) >= 2
+    return presets[:2]
+
+
+def test_spawn_and_wait_ready(backend):
+    assert backend.spawn()
+    assert backend.wait_ready()
+    assert backend.is_running
+    assert backend.seq_ident is not None
+    assert backend.ready_seconds is not None
+    assert backend.font_ids == {SOUNDFONT: 1}
+
+
+def test_apply_program_cc_and_gain_batch(running):
+    first, second = _two_presets(running)
+    ops = [
+        ("select", 0, SOUNDFONT, 0, first["program"]),
+        ("select", 1, SOUNDFONT, 0, second["program"]),
+        ("cc", 0, 7, 100),
+        ("gain", 0.5),
+    ]
+    assert running.apply(ops)
+    assert running.get_channels()[1] == second["name"]
+
+
+def test_get_channels_reports_the_selected_presets(running):
+    first, second = _two_presets(running)
+    assert running.apply([("select", 0, SOUNDFONT, 0, first["program"]),
+                          ("select", 1, SOUNDFONT, 0, second["program"])])
+    channels = running.get_channels()
+    assert channels[0] == first["name"]
+    assert channels[1] == second["name"]
+
+
+def test_select_from_an_unloaded_soundfont_is_not_confirmed(running, tmp_path):
+    assert not running.apply([("select", 0, str(tmp_path / "missing.sf2"), 0, 0)])
+
+
+def test_load_and_unload_soundfont(running, tmp_path):
+    # A second path to the same file loads as a separate font
+    extra = tmp_path / "extra.sf2"
+    extra.symlink_to(SOUNDFONT)
+    extra = str(extra)
+
+    assert running.load_soundfont(extra)
+    assert running.font_ids[extra] == 2
+    assert extra in running.soundfonts
+    first, _ = _two_presets(running)
+    assert running.apply([("select", 2, extra, 0, first["program"])])
+
+    assert running.apply([("select", 2, SOUNDFONT, 0, first["program"])])
+    assert running.unload_soundfont(extra)
+    assert extra not in running.font_ids
+    assert extra not in running.soundfonts
+    assert running.is_running
+
+
+def test_load_of_a_missing_soundfont_fails(running, tmp_path):
+    assert not running.load_soundfont(str(tmp_path / "missing.sf2"))
+    assert running.is_running
+
+
+def test_stop(running):
+    running.stop()
+    assert running.stopping
+    assert not running.is_running
+    assert running.seq_ident is None
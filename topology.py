@@ -0,0 +1,237 @@
+"""
+Piano Pi Brain — ALSA Sequencer Topology
+
+One snapshot of the sequencer graph: every client, every port and every
+existing subscription. The MIDI monitor takes one snapshot per cycle and
+diffs it against the previous one, so `aconnect` only runs for
+connections that are actually missing.
+
+Snapshots come from /proc/asound/seq/clients (no fork, includes port
+capabilities) with `aconnect -l` as the fallback.
+"""
+
+import logging
+import re
+import subprocess
+from typing import NamedTuple
+
+import tracing
+
+log = logging.getLogger(__name__)
+
+PROC_CLIENTS = "/proc/asound/seq/clients"
+
+# FluidSynth's ALSA sequencer client name
+FLUIDSYNTH_CLIENT = "FLUID Synth"
+
+# System (timer/announce) and Midi Through are never controllers
+SYSTEM_CLIENTS = (0, 14)
+
+Addr = tuple[int, int]
+
+
+class Port(NamedTuple):
+    client: int
+    port: int
+    name: str
+    readable: bool | None      # None = unknown (aconnect doesn't report caps)
+    writable: bool | None
+    connects_to: frozenset     # of Addr
+
+
+class Client(NamedTuple):
+    id: int
+    name: str
+    ports: dict                # port number -> Port
+
+
+class TopologyDiff(NamedTuple):
+    added_clients: set
+    removed_clients: set
+    added_ports: set           # of Addr
+    removed_ports: set
+    changed_subscriptions: set  # source Addrs whose subscriptions changed
+
+    def __bool__(self):
+        return any(self)
+
+
+class Snapshot:
+    """Immutable view of the sequencer graph at one point in time."""
+
+    def __init__(self, clients: dict[int, Client]):
+        self.clients = clients
+
+    def __repr__(self):
+        return f"<Snapshot {len(self.clients)} clients>"
+
+    def ports(self):
+        for client in self.clients.values():
+            yield from client.ports.values()
+
+    def find_fluidsynth(self, ident: str | None = None) -> Client | None:
+        """
+        FluidSynth's client, optionally the one whose `midi.alsa_seq.id`
+        (the pid by default) is `ident`.
+        """
+        for client in self.clients.values():
+            if ident is None:
+                if client.name.startswith(FLUIDSYNTH_CLIENT):
+                    return client
+            elif client.name == f"{FLUIDSYNTH_CLIENT} ({ident})":
+                return client
+        return None
+
+    def fluidsynth_clients(self) -> list[Client]:
+        return [c for c in self.clients.values()
+                if c.name.startswith(FLUIDSYNTH_CLIENT)]
+
+    def controllers(self) -> list[Client]:
+        """Clients that may send MIDI to FluidSynth (skips system + synths)."""
+        return [
+            c for c in self.clients.values()
+            if c.id not in SYSTEM_CLIENTS
+            and not c.name.startswith(FLUIDSYNTH_CLIENT)
+            and self.source_ports(c)
+        ]
+
+    def source_ports(self, client: Client) -> list[Port]:
+        """Ports we can subscribe to (readable, or unknown caps)."""
+        return [p for p in client.ports.values() if p.readable is not False]
+
+    def input_port(self, client: Client) -> Addr:
+        """First writable port of `client` (FluidSynth's input)."""
+        for num in sorted(client.ports):
+            if client.ports[num].writable is not False:
+                return (client.id, num)
+        return (client.id, 0)
+
+    def is_connected(self, source: Addr, dest: Addr) -> bool:
+        client = self.clients.get(source[0])
+        if client is None or source[1] not in client.ports:
+            return False
+        return dest in client.ports[source[1]].connects_to
+
+    def diff(self, prev: "Snapshot | None") -> TopologyDiff:
+        """What changed since `prev` (everything, if there is no prev)."""
+        before = prev.clients if prev is not None else {}
+        old_ports = {(p.client, p.port): p for c in before.values() for p in c.ports.values()}
+        new_ports = {(p.client, p.port): p for p in self.ports()}
+
+        return TopologyDiff(
+            added_clients=self.clients.keys() - before.keys(),
+            removed_clients=before.keys() - self.clients.keys(),
+            added_ports=new_ports.keys() - old_ports.keys(),
+            removed_ports=old_ports.keys() - new_ports.keys(),
+            changed_subscriptions={
+                addr for addr in new_ports.keys() & old_ports.keys()
+                if new_ports[addr].connects_to != old_ports[addr].connects_to
+            },
+        )
+
+
+# ---------------------------------------------------------------------------
+# Parsers
+# ---------------------------------------------------------------------------
+
+_ADDR_RE = re.compile(r"(\d+):(\d+)")
+
+
+def _parse_addrs(text: str) -> set:
+    return {(int(c), int(p)) for c, p in _ADDR_RE.findall(text)}
+
+
+def _build(raw: dict) -> Snapshot:
+    clients = {}
+    for cid, (name, ports) in raw.items():
+        clients[cid] = Client(cid, name, {
+            num: Port(cid, num, pname, rd, wr, frozenset(conns))
+            for num, (pname, rd, wr, conns) in ports.items()
+        })
+    return Snapshot(clients)
+
+
+def parse_proc_clients(text: str) -> Snapshot:
+    """
+    Parse /proc/asound/seq/clients. Lines look like:
+
+        Client  20 : "Keystation 49 MK3" [Kernel]
+          Port   0 : "Keystation 49 MK3 MIDI 1" (RWeX)
+            Connecting To: 128:0
+    """
+    raw = {}
+    client = port = None
+    for line in text.splitlines():
+        m = re.match(r'^Client\s+(\d+)\s*:\s*"(.*)"', line)
+        if m:
+            client = int(m.group(1))
+            raw[client] = (m.group(2), {})
+            port = None
+            continue
+
+        m = re.match(r'^\s+Port\s+(\d+)\s*:\s*"(.*)"\s*\((.)(.)', line)
+        if m and client is not None:
+            port = int(m.group(1))
+            # 'R'/'W' = readable/writable and subscribable
+            raw[client][1][port] = (m.group(2), m.group(3) == "R", m.group(4) == "W", set())
+            continue
+
+        m = re.match(r"^\s+Connecting To:\s*(.*)", line)
+        if m and client is not None and port is not None:
+            raw[client][1][port][3].update(_parse_addrs(m.group(1)))
+            continue
+
+        if line and not line[0].isspace():
+            client = port = None
+
+    return _build(raw)
+
+
+def parse_aconnect(text: str) -> Snapshot:
+    """
+    Parse `aconnect -l`. Lines look like:
+
+        client 20: 'Keystation 49 MK3' [type=kernel,card=1]
+            0 'Keystation 49 MK3 MIDI 1'
+                Connecting To: 128:0
+    """
+    raw = {}
+    client = port = None
+    for line in text.splitlines():
+        m = re.match(r"^client\s+(\d+):\s+'(.*?)'", line)
+        if m:
+            client = int(m.group(1))
+            raw[client] = (m.group(2), {})
+            port = None
+            continue
+
+        m = re.match(r"^\s+(\d+)\s+'(.*)'", line)
+        if m and client is not None:
+            port = int(m.group(1))
+            raw[client][1][port] = (m.group(2).strip(), None, None, set())
+            continue
+
+        m = re.match(r"^\s+Connecting To:\s*(.*)", line)
+        if m and client is not None and port is not None:
+            raw[client][1][port][3].update(_parse_addrs(m.group(1)))
+
+    return _build(raw)
+
+
+def take_snapshot() -> Snapshot:
+    """Read the current sequencer graph (empty snapshot on failure)."""
+    try:
+        with open(PROC_CLIENTS) as f:
+            return parse_proc_clients(f.read())
+    except OSError:
+        pass
+
+    try:
+        with tracing.span("aconnect -l", "midi"):
+            result = subprocess.run(
+                ["aconnect", "-l"],
+                capture_output=True, text=True, timeout=5
+            )
+    except (FileNotFoundError, subprocess.TimeoutExpired):
+        return Snapshot({})
+    return parse_aconnect(result.stdout)
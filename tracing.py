@@ -0,0 +1,157 @@
+"""
+Piano Pi Brain — Tracing
+
+Spans around the control path (button callbacks, controller actions,
+FluidSynth command batches, aconnect runs, restart phases, HTTP
+requests), for finding out why a press "felt slow" on a device in the
+field.
+
+Spans go into a ring of TRACE_RING_SIZE slots allocated once up front
+(parallel arrays, no per-span objects kept), with nanosecond monotonic
+timestamps, the OS thread id and the thread's name. GET /api/trace downloads the ring as
+Chrome trace JSON, which chrome://tracing and ui.perfetto.dev open.
+
+Tracing starts off unless TRACE_ENABLED is set, and can be switched on
+at runtime (POST /api/trace). While off, span() returns a shared no-op
+context manager and traced() functions make one extra flag check.
+"""
+
+import functools
+import itertools
+import os
+import threading
+import time
+from array import array
+from contextlib import nullcontext
+
+import config
+
+_NULL = nullcontext()
+
+_enabled = config.TRACE_ENABLED
+_size = config.TRACE_RING_SIZE
+_counter = itertools.count()        # next() is atomic under the GIL
+_lock = threading.Lock()            # only for clear() / export()
+
+# The ring: slot i holds one span across these arrays
+_names: list = [None] * _size
+_cats: list = [None] * _size
+_args: list = [None] * _size
+_starts = array("q", bytes(8 * _size))
+_durations = array("q", bytes(8 * _size))
+_tids = array("q", bytes(8 * _size))
+# Thread name per slot: Flask starts a thread (and TID) per request, so a
+# tid -> name map would grow forever, and TIDs get reused
+_threads: list = [None] * _size
+
+now = time.monotonic_ns
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+def enable(on: bool = True):
+    global _enabled
+    _enabled = bool(on)
+
+
+def clear():
+    global _counter
+    with _lock:
+        _counter = itertools.count()
+        for i in range(_size):
+            _names[i] = None
+
+
+def record(name: str, cat: str, start_ns: int, end_ns: int, args: dict | None = None):
+    """Store one finished span (start/end from tracing.now())."""
+    if not _enabled:
+        return
+    i = next(_counter) % _size
+    _names[i] = None            # invalidate while the slot is rewritten
+    _cats[i] = cat
+    _args[i] = args
+    _starts[i] = start_ns
+    _durations[i] = end_ns - start_ns
+    _tids[i] = threading.get_native_id()
+    _threads[i] = threading.current_thread().name
+    _names[i] = name
+
+
+class _Span:
+    __slots__ = ("name", "cat", "args", "start")
+
+    def __init__(self, name, cat, args):
+        self.name = name
+        self.cat = cat
+        self.args = args
+
+    def __enter__(self):
+        self.start = now()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        args = self.args
+        if exc_type is not None:
+            args = {**(args or {}), "error": exc_type.__name__}
+        record(self.name, self.cat, self.start, now(), args)
+        return False
+
+
+def span(name: str, cat: str = "", **args):
+    """Context manager timing its block as one span (a no-op while tracing is off)."""
+    if not _enabled:
+        return _NULL
+    return _Span(name, cat, args or None)
+
+
+def traced(name: str, cat: str = ""):
+    """Decorator: trace every call of the function as a span."""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*a, **kw):
+            if not _enabled:
+                return fn(*a, **kw)
+            start = now()
+            try:
+                return fn(*a, **kw)
+            finally:
+                record(name, cat, start, now())
+        return wrapper
+    return decorate
+
+
+def export() -> dict:
+    """The ring as Chrome trace JSON (microsecond timestamps, ns precision)."""
+    pid = os.getpid()
+    events = []
+    thread_names = {}
+    with _lock:
+        for i in range(_size):
+            name = _names[i]
+            if name is None:
+                continue
+            event = {
+                "name": name,
+                "cat": _cats[i] or "default",
+                "ph": "X",
+                "ts": _starts[i] / 1000,
+                "dur": _durations[i] / 1000,
+                "pid": pid,
+                "tid": _tids[i],
+            }
+            if _args[i]:
+                event["args"] = _args[i]
+            events.append(event)
+            # A reused TID is named after its latest thread
+            latest = thread_names.get(event["tid"])
+            if latest is None or latest[0] < event["ts"]:
+                thread_names[event["tid"]] = (event["ts"], _threads[i])
+    events.sort(key=lambda e: e["ts"])
+    for tid, (_, thread_name) in thread_names.items():
+        events.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": tid,
+                       "args": {"name": thread_name}})
+    events.append({"name": "process_name", "ph": "M", "pid": pid,
+                   "args": {"name": "piano-pi"}})
+    return {"traceEvents": events, "displayTimeUnit": "ns"}
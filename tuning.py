@@ -0,0 +1,77 @@
+"""
+Piano Pi Brain — FluidSynth Tuning Profiles
+
+Stores the settings found by calibrate.py, keyed by the exact soundfont
+set (file name + size) and the device (board model + CPU count), so a
+profile measured on a Pi 3 with Salamander is never applied to a Pi 4 or
+to a different soundfont. Matching profiles override FLUIDSYNTH_CMD when
+FluidSynth is launched.
+"""
+
+import json
+import logging
+import os
+
+import config
+import procfs
+
+log = logging.getLogger(__name__)
+
+
+def fonts_key(soundfonts: list[str]) -> list[dict]:
+    """Identity of a soundfont set: name and size of each file, in load order."""
+    key = []
+    for path in soundfonts:
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            size = None
+        key.append({"name": os.path.basename(path), "size": size})
+    return key
+
+
+def device_key() -> dict:
+    return {"model": procfs.device_model(), "cpu_count": os.cpu_count()}
+
+
+def load(path: str | None = None) -> list[dict]:
+    """Every stored profile ([] if the file is missing or unreadable)."""
+    path = path or config.FLUIDSYNTH_TUNING_FILE
+    try:
+        with open(path) as f:
+            return json.load(f).get("profiles", [])
+    except FileNotFoundError:
+        return []
+    except (OSError, ValueError, AttributeError) as e:
+        log.warning("Ignoring unreadable tuning file %s: %s", path, e)
+        return []
+
+
+def lookup(soundfonts: list[str]) -> dict | None:
+    """Settings tuned for this soundfont set on this device, if any."""
+    if not config.FLUIDSYNTH_AUTOTUNE or not soundfonts:
+        return None
+    fonts, device = fonts_key(soundfonts), device_key()
+    for profile in load():
+        if profile.get("fonts") == fonts and profile.get("device") == device:
+            return profile.get("settings") or None
+    return None
+
+
+def save(soundfonts: list[str], settings: dict, measured: dict | None = None,
+         path: str | None = None):
+    """Store (or replace) the profile for this soundfont set and device."""
+    path = path or config.FLUIDSYNTH_TUNING_FILE
+    fonts, device = fonts_key(soundfonts), device_key()
+    profiles = [
+        p for p in load(path)
+        if not (p.get("fonts") == fonts and p.get("device") == device)
+    ]
+    profiles.append({"fonts": fonts, "device": device,
+                     "settings": settings, "measured": measured or {}})
+
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump({"profiles": profiles}, f, indent=2)
+    os.replace(tmp, path)
+    log.info("Saved tuning profile to %s: %s", path, settings)
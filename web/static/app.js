@@ -0,0 +1,180 @@
+let currentState = {};
+let lastEventId = null;
+
+// Fetch state: the full state once, then only what changed since our version
+async function fetchState() {
+  try {
+    const since = currentState.version !== undefined
+      ? `?since=${currentState.epoch}-${currentState.version}` : '';
+    const res = await fetch('/api/state' + since);
+    const data = await res.json();
+    // Served by the service worker from its cache: the Pi isn't answering yet
+    const stale = res.headers.get('X-Served-From') === 'cache';
+    if (data.delta && data.epoch === currentState.epoch) {
+      delete data.delta;
+      updateUI({ ...currentState, ...data });
+    } else {
+      updateUI(data);
+    }
+    if (stale) {
+      setStatus('offline', 'Offline');
+      setTimeout(fetchState, 3000);
+    }
+  } catch (e) {
+    setStatus('offline', 'Offline');
+  }
+}
+
+// Update UI from state
+function updateUI(state) {
+  currentState = state;
+
+  // Status dot
+  const booting = state.boot && state.boot.phases.synth && state.boot.phases.synth.end === null;
+  if (!state.synth_running && booting) {
+    setStatus('no-midi', 'Loading sounds…');
+  } else if (!state.synth_running) {
+    setStatus('error', 'Error');
+  } else if (state.midi_connected) {
+    setStatus('ready', 'Ready');
+  } else {
+    setStatus('no-midi', 'No MIDI');
+  }
+
+  // Current instrument
+  document.getElementById('currentInstrument').textContent = state.instrument;
+
+  // MIDI info
+  document.getElementById('midiInfo').textContent =
+    state.midi_connected ? '🎹 MIDI controller connected' : 'No MIDI controller detected';
+
+  // Instrument list
+  renderInstruments(state.instruments, state.instrument_index);
+}
+
+function setStatus(cls, text) {
+  const dot = document.getElementById('statusDot');
+  dot.className = 'status-dot ' + cls;
+  document.getElementById('statusText').textContent = text;
+}
+
+function renderInstruments(instruments, activeIndex) {
+  const list = document.getElementById('instrumentList');
+  let html = '';
+  let lastCore = null;
+
+  instruments.forEach(inst => {
+    const isCore = inst.core;
+    if (isCore && lastCore !== true) {
+      html += '<div class="section-label">Core</div>';
+    } else if (!isCore && lastCore !== false) {
+      html += '<div class="section-label">Extras</div>';
+    }
+    lastCore = isCore;
+
+    const activeClass = inst.index === activeIndex ? ' active' : '';
+    const coreClass = isCore ? ' core' : '';
+    const star = isCore ? '★' : '○';
+
+    html += `<button class="inst-btn${activeClass}${coreClass}"
+                     onclick="selectInstrument(${inst.index})"
+                     data-index="${inst.index}">
+               <span class="star">${star}</span>
+               ${inst.name}
+             </button>`;
+  });
+
+  list.innerHTML = html;
+}
+
+// Actions
+async function selectInstrument(index) {
+  try {
+    const res = await fetch(`/api/instrument/${index}`, { method: 'POST' });
+    const data = await res.json();
+    showToast(`🎵 ${data.instrument}`);
+    fetchState();
+  } catch (e) {
+    showToast('❌ Failed');
+  }
+}
+
+async function restartSynth() {
+  showToast('🔄 Restarting...');
+  try {
+    await fetch('/api/restart', { method: 'POST' });
+  } catch (e) {
+    showToast('❌ Failed');
+  }
+}
+
+async function shutdownPi() {
+  if (!confirm('Shut down Piano Pi? You\'ll need to unplug and replug to restart.')) return;
+  showToast('⏻ Shutting down...');
+  try {
+    await fetch('/api/shutdown', { method: 'POST' });
+  } catch (e) {
+    // Expected — Pi shuts down
+  }
+}
+
+// Toast
+function showToast(msg) {
+  const toast = document.getElementById('toast');
+  toast.textContent = msg;
+  toast.classList.add('show');
+  setTimeout(() => toast.classList.remove('show'), 2000);
+}
+
+// Restart progress (one event per phase; the final one has every timing)
+const RESTART_PHASES = {
+  stopping: 'Stopping', switching: 'Switching to standby', loading: 'Loading soundfont',
+  ready_check: 'Waiting for synth', restoring: 'Restoring sound', reconnecting: 'Reconnecting MIDI',
+};
+
+function showRestart(r) {
+  if (r.final) {
+    showToast(r.status === 'done' ? `✅ Restarted in ${r.total.toFixed(1)}s` : '❌ Restart failed');
+  } else if (r.status === 'failed' && r.retry_in) {
+    showToast(`⚠️ ${RESTART_PHASES[r.phase] || r.phase} failed — retrying`);
+  } else if (r.status === 'started') {
+    showToast(`🔄 ${RESTART_PHASES[r.phase] || r.phase}...`);
+  }
+}
+
+// SSE — versioned state changes; resumes where it left off after a drop
+function connectSSE() {
+  const resume = lastEventId ? `?last_event_id=${encodeURIComponent(lastEventId)}` : '';
+  const es = new EventSource('/api/events' + resume);
+
+  es.onmessage = (e) => {
+    lastEventId = e.lastEventId || lastEventId;
+    try {
+      const data = JSON.parse(e.data);
+      if (data.type === 'instrument') {
+        showToast(`🎵 ${data.name}`);
+      } else if (data.type === 'restart') {
+        showRestart(data);
+      } else if (data.type === 'state') {
+        const epoch = lastEventId.split('-')[0];
+        const base = data.full ? {} : currentState;
+        updateUI({ ...base, ...data.changes, version: data.version, epoch });
+      }
+    } catch (err) {}
+  };
+
+  es.onerror = () => {
+    es.close();
+    setTimeout(connectSSE, 3000);
+  };
+}
+
+// Service worker: the page shell loads from cache, even before the Pi answers
+// (browsers only allow this on https:// or localhost)
+if ('serviceWorker' in navigator) {
+  navigator.serviceWorker.register('/sw.js').catch(() => {});
+}
+
+// Init
+fetchState();
+connectSSE();
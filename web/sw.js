@@ -0,0 +1,73 @@
+// Piano Pi service worker
+//
+// The page shell (index + hashed assets) is served cache-first and
+// refreshed in the background, so the UI appears instantly even on slow
+// WiFi. /api/state is network-first; when the Pi doesn't answer, the last
+// full state comes from the cache, marked with X-Served-From: cache.
+// __VERSION__ and __PRECACHE__ are filled in by assets.py.
+
+const VERSION = '__VERSION__';
+const SHELL_CACHE = 'piano-pi-shell-' + VERSION;
+const API_CACHE = 'piano-pi-api';
+const PRECACHE = __PRECACHE__;
+
+self.addEventListener('install', (event) => {
+  event.waitUntil(
+    caches.open(SHELL_CACHE)
+      .then((cache) => cache.addAll(PRECACHE))
+      .then(() => self.skipWaiting())
+  );
+});
+
+self.addEventListener('activate', (event) => {
+  event.waitUntil(
+    caches.keys()
+      .then((keys) => Promise.all(keys
+        .filter((key) => key.startsWith('piano-pi-shell-') && key !== SHELL_CACHE)
+        .map((key) => caches.delete(key))))
+      .then(() => self.clients.claim())
+  );
+});
+
+self.addEventListener('fetch', (event) => {
+  const request = event.request;
+  const url = new URL(request.url);
+  if (request.method !== 'GET' || url.origin !== self.location.origin) return;
+
+  if (url.pathname === '/api/state') {
+    event.respondWith(apiState(request, url));
+  } else if (url.pathname === '/' || url.pathname.startsWith('/static/')) {
+    event.respondWith(shell(event, request));
+  }
+  // Everything else (SSE, other API calls) goes straight to the network
+});
+
+async function shell(event, request) {
+  const cache = await caches.open(SHELL_CACHE);
+  const cached = await cache.match(request);
+  const network = fetch(request).then((response) => {
+    if (response.ok) cache.put(request, response.clone());
+    return response;
+  });
+  if (cached) {
+    event.waitUntil(network.catch(() => {}));
+    return cached;
+  }
+  return network;
+}
+
+async function apiState(request, url) {
+  const cache = await caches.open(API_CACHE);
+  try {
+    const response = await fetch(request);
+    // Only full states are worth keeping; deltas are relative to a version
+    if (response.ok && !url.search) cache.put('/api/state', response.clone());
+    return response;
+  } catch (e) {
+    const cached = await cache.match('/api/state');
+    if (!cached) throw e;
+    const headers = new Headers(cached.headers);
+    headers.set('X-Served-From', 'cache');
+    return new Response(await cached.blob(), { status: 200, headers });
+  }
+}
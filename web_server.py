@@ -5,29 +5,55 @@ Lightweight Flask server for phone-based control.
 Runs in a background thread inside piano_pi.py.
 
 API:
-  GET  /                    → Mobile UI
-  GET  /api/state           → Current state (JSON)
+  GET  /                    → Mobile UI (precompressed, ETag; see assets.py)
+  GET  /sw.js               → Service worker (offline shell)
+  GET  /api/state           → Current state (JSON; ETag, ?since=<version> for a delta)
+  GET  /api/synth           → Live FluidSynth state (gain, channels, presets)
+  POST /api/synth           → Set gain / reverb / chorus / CCs
   POST /api/instrument/<n>  → Select instrument by index
-  POST /api/restart         → Restart FluidSynth
+  GET  /api/soundfonts      → Soundfonts in use, files available, memory
+  POST /api/soundfonts      → Switch the primary soundfont without a restart
+  POST /api/restart         → Restart FluidSynth (progress arrives as "restart" events)
   POST /api/shutdown        → Safe OS shutdown
-  GET  /api/events          → SSE stream for real-time updates
+  GET  /api/events          → SSE stream of versioned changes (resumes from Last-Event-ID)
+  GET  /api/metrics         → FluidSynth load + control latency (Prometheus text)
+  GET  /api/supervisor      → FluidSynth crash statistics (exit status, stderr tail)
+  GET  /api/capture         → MIDI recording status (current take, events, drops)
+  GET  /api/metronome       → Metronome state (running, bpm, time signature, accents)
+  POST /api/metronome       → Start/stop, set bpm / time signature / accents
+  GET  /api/arp             → Arpeggiator state (pattern, tempo, held keys)
+  POST /api/arp             → Switch on/off, set pattern / bpm / rate / octaves / gate / swing
+  GET  /api/player          → Backing-track player state (file, position, files available)
+  POST /api/player          → Load a file, play/stop, loop, tempo factor, seek
+  GET  /api/trace           → Recent control-path spans (Chrome/Perfetto trace JSON)
+  POST /api/trace           → Switch tracing on/off, clear it
+  POST /api/config/reload   → Re-read config.py, apply what changed (see config_reload.py)
 """
 
 import json
 import logging
-import queue
+import os
 import threading
+import time
+from concurrent.futures import TimeoutError as FutureTimeout
 
-from flask import Flask, Response, jsonify, send_from_directory
+import assets
+import config
+import metrics
+import procfs
+import tracing
+from state_store import StateStore, coalesce
 
 log = logging.getLogger(__name__)
 
-# Global event queues for SSE clients
-_sse_clients: list[queue.Queue] = []
-_sse_lock = threading.Lock()
+# Everything the UI shows; SSE clients follow its event ring
+_store = StateStore()
 
+SSE_KEEPALIVE_SECONDS = 15
 
-def create_app(synth, midi, leds, restart_cb, shutdown_cb):
+
+def create_app(synth, midi, leds, controller, shutdown_cb, supervisor=None, capture=None,
+               metronome=None, arp=None, player=None, reloader=None):
     """
     Create the Flask app with references to the running components.
 
@@ -35,10 +61,19 @@ def create_app(synth, midi, leds, restart_cb, shutdown_cb):
         synth: FluidSynthManager instance
         midi: MidiMonitor instance
         leds: StatusLEDs instance
-        restart_cb: Callable for restarting FluidSynth
+        controller: Controller that runs every synth action (see controller.py)
         shutdown_cb: Callable for safe shutdown
+        supervisor: Supervisor watching FluidSynth for crashes (optional)
+        capture: MidiCapture recording what is played (optional)
+        metronome: Metronome (optional)
+        arp: Arpeggiator (optional)
+        player: Backing-track Player (optional)
+        reloader: ConfigReloader for config.py (optional)
     """
-    import config
+    # Imported here, not at the top: Flask takes a while to import on a Pi,
+    # and this runs in its own boot phase while the soundfont loads.
+    # Importing web_server for publish_state() etc. stays cheap.
+    from flask import Flask, Response, g, jsonify, request, send_from_directory
 
     app = Flask(__name__, static_folder=None)
     app.logger.setLevel(logging.WARNING)  # Suppress Flask's request logs
@@ -47,17 +82,53 @@ def create_app(synth, midi, leds, restart_cb, shutdown_cb):
     werkzeug_log = logging.getLogger("werkzeug")
     werkzeug_log.setLevel(logging.WARNING)
 
+    # One trace span per request (see tracing.py)
+    @app.before_request
+    def trace_start():
+        if tracing.enabled():
+            g.trace_start = tracing.now()
+
+    @app.teardown_request
+    def trace_end(exc):
+        start = g.pop("trace_start", None)
+        if start is not None:
+            rule = request.url_rule.rule if request.url_rule else request.path
+            tracing.record(f"{request.method} {rule}", "http", start, tracing.now(),
+                           {"path": request.full_path.rstrip("?")})
+
     # ---------------------------------------------------------------
-    # Static files (serve from web/ directory)
+    # Static files (built once from web/, see assets.py)
     # ---------------------------------------------------------------
 
+    bundle = assets.AssetBundle()
+
+    def send_asset(asset):
+        encoding = assets.choose_encoding(asset, request.headers.get("Accept-Encoding", ""))
+        headers = {
+            "ETag": f'"{asset.etag(encoding)}"',
+            "Cache-Control": asset.cache_control,
+            "Vary": "Accept-Encoding",
+        }
+        if any(request.if_none_match.contains(tag) for tag in asset.etags()):
+            return Response(status=304, headers=headers)
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        return Response(asset.bodies[encoding], content_type=asset.content_type, headers=headers)
+
     @app.route("/")
     def index():
-        return send_from_directory("web", "index.html")
+        return send_asset(bundle.get("/"))
+
+    @app.route("/sw.js")
+    def service_worker():
+        return send_asset(bundle.get("/sw.js"))
 
     @app.route("/static/<path:filename>")
     def static_files(filename):
-        return send_from_directory("web/static", filename)
+        asset = bundle.get(f"/static/{filename}")
+        if asset is None:
+            return send_from_directory(os.path.join(assets.WEB_DIR, "static"), filename)
+        return send_asset(asset)
 
     # ---------------------------------------------------------------
     # REST API
@@ -65,47 +136,124 @@ def create_app(synth, midi, leds, restart_cb, shutdown_cb):
 
     @app.route("/api/state")
     def get_state():
-        """Return current state as JSON."""
-        instruments = []
-        for i, inst in enumerate(config.INSTRUMENTS):
-            instruments.append({
-                "index": i,
-                "name": inst["name"],
-                "program": inst["program"],
-                "core": inst.get("core", False),
-                "active": i == synth._current_instrument_index,
-            })
-
-        return jsonify({
-            "instrument": synth.get_current_instrument(),
-            "instrument_index": synth._current_instrument_index,
-            "instruments": instruments,
-            "synth_running": synth.is_running,
-            "midi_connected": midi.has_midi,
-        })
+        """
+        Current state as JSON, tagged with its version. Conditional GETs
+        (If-None-Match) get a 304 while nothing changed; ?since=<version>
+        returns only the keys changed after that version ("delta": true).
+        """
+        version = _store.version
+        if request.if_none_match.contains(f"{_store.epoch}-{version}"):
+            return Response(status=304, headers={"ETag": _store.etag})
+
+        since = _store.parse_id(request.args.get("since"))
+        if since is not None:
+            version, values = _store.delta(since)
+            body = {**values, "delta": True}
+        else:
+            version, values = _store.snapshot()
+            body = _with_active(values)
+
+        response = jsonify({**body, "version": version, "epoch": _store.epoch})
+        response.headers["ETag"] = f'"{_store.epoch}-{version}"'
+        response.headers["Cache-Control"] = "no-cache"
+        return response
+
+    @app.route("/api/synth")
+    def get_synth():
+        """Read state back from FluidSynth's shell (null fields if unavailable)."""
+        state = synth.get_state()
+        state["presets"] = synth.get_presets()
+        return jsonify(state)
+
+    @app.route("/api/synth", methods=["POST"])
+    def set_synth():
+        """
+        Update synth state, e.g. {"gain": 0.8, "reverb": true,
+        "cc": [{"channel": 0, "control": 7, "value": 100}]}.
+        """
+        body = request.get_json(silent=True) or {}
+
+        def apply():
+            if "gain" in body:
+                synth.set_gain(float(body["gain"]))
+            for effect in ("reverb", "chorus"):
+                if effect in body:
+                    synth.set_effect(effect, bool(body[effect]))
+            for cc in body.get("cc", []):
+                synth.set_cc(int(cc["channel"]), int(cc["control"]), int(cc["value"]))
+
+        try:
+            controller.call(apply, source="web").result(timeout=config.CONTROL_ACTION_TIMEOUT)
+        except (KeyError, TypeError, ValueError):
+            return jsonify({"error": "Invalid synth settings"}), 400
+        except FutureTimeout:
+            return jsonify({"error": "Synth busy"}), 504
+        return jsonify(synth.get_state())
 
     @app.route("/api/instrument/<int:index>", methods=["POST"])
     def select_instrument(index):
         """Select an instrument by index."""
-        if index < 0 or index >= len(config.INSTRUMENTS):
+        if index < 0 or index >= len(synth.instruments):
             return jsonify({"error": "Invalid instrument index"}), 400
 
-        synth._current_instrument_index = index
-        name = synth._apply_instrument()
+        # A burst of selects (or button presses) collapses to the last one,
+        # so `name` may be a later request's choice
+        future = controller.select_instrument(index, source="web")
+        try:
+            name = future.result(timeout=config.CONTROL_ACTION_TIMEOUT)
+        except IndexError:
+            return jsonify({"error": "Invalid instrument index"}), 400
+        except FutureTimeout:
+            return jsonify({"error": "Synth busy"}), 504
         log.info("🌐 Web: instrument -> %s", name)
 
-        broadcast_event("instrument", {
-            "name": name,
-            "index": index,
-        })
-
-        return jsonify({"instrument": name, "index": index})
+        return jsonify({"instrument": name, "index": synth.current_index})
+
+    def soundfonts_state():
+        available = procfs.mem_available()
+        return {
+            "soundfonts": synth.soundfont_info(),
+            "available": synth.available_soundfonts(),
+            "mem_available_mb": available // 2**20 if available is not None else None,
+            "min_free_mb": config.SOUNDFONT_MIN_FREE_MB,
+            "sample_loading": synth.sample_loading_info(),
+        }
+
+    @app.route("/api/soundfonts")
+    def get_soundfonts():
+        return jsonify(soundfonts_state())
+
+    @app.route("/api/soundfonts", methods=["POST"])
+    def set_soundfonts():
+        """
+        {"primary": "/path/GM.sf2"}: load it next to the current fonts, move
+        the instruments over, then unload what's no longer used.
+        """
+        body = request.get_json(silent=True) or {}
+        path = body.get("primary")
+        if path not in synth.available_soundfonts():
+            return jsonify({"error": "Unknown soundfont"}), 400
+        log.info("🌐 Web: soundfont -> %s", path)
+        try:
+            ok = controller.call(synth.switch_soundfont, path, source="web").result(
+                timeout=config.CONTROL_ACTION_TIMEOUT)
+        except FutureTimeout:
+            return jsonify({"error": "Synth busy"}), 504
+        if not ok:
+            return jsonify({"error": f"Could not load {os.path.basename(path)} next to the "
+                                     "current soundfonts (memory budget, see log)"}), 503
+        publish_state(synth, midi)
+        return jsonify(soundfonts_state())
 
     @app.route("/api/restart", methods=["POST"])
     def restart():
         """Restart FluidSynth."""
         log.info("🌐 Web: restart requested")
-        threading.Thread(target=restart_cb, daemon=True).start()
+        if controller.restart_pending:
+            return jsonify({"status": "already_restarting"})
+        if supervisor:
+            supervisor.reset()
+        controller.restart()
         return jsonify({"status": "restarting"})
 
     @app.route("/api/shutdown", methods=["POST"])
@@ -115,30 +263,178 @@ def create_app(synth, midi, leds, restart_cb, shutdown_cb):
         threading.Thread(target=shutdown_cb, daemon=True).start()
         return jsonify({"status": "shutting_down"})
 
+    @app.route("/api/supervisor")
+    def get_supervisor():
+        """Crash statistics: exit status, signal and stderr tail of recent crashes."""
+        if supervisor is None:
+            return jsonify({"error": "Supervisor not running"}), 404
+        return jsonify(supervisor.stats())
+
+    @app.route("/api/capture")
+    def get_capture():
+        """MIDI recording: current take, events written, events dropped."""
+        if capture is None:
+            return jsonify({"error": "MIDI capture not enabled"}), 404
+        return jsonify(capture.stats())
+
+    @app.route("/api/metronome")
+    def get_metronome():
+        if metronome is None:
+            return jsonify({"error": "Metronome not available"}), 404
+        return jsonify(metronome.state())
+
+    @app.route("/api/metronome", methods=["POST"])
+    def set_metronome():
+        """
+        Update the metronome, e.g. {"running": true, "bpm": 100, "beats": 3,
+        "unit": 4, "accents": [2, 1, 0]} (all keys optional).
+        """
+        if metronome is None:
+            return jsonify({"error": "Metronome not available"}), 404
+        body = request.get_json(silent=True) or {}
+        try:
+            metronome.set(bpm=body.get("bpm"), beats=body.get("beats"),
+                          unit=body.get("unit"), accents=body.get("accents"))
+        except (TypeError, ValueError) as e:
+            return jsonify({"error": f"Invalid metronome settings: {e}"}), 400
+        if "running" in body:
+            if body["running"]:
+                metronome.start()
+            else:
+                metronome.stop()
+        return jsonify(metronome.state())
+
+    @app.route("/api/arp")
+    def get_arp():
+        if arp is None:
+            return jsonify({"error": "Arpeggiator not available"}), 404
+        return jsonify(arp.state())
+
+    @app.route("/api/arp", methods=["POST"])
+    def set_arp():
+        """
+        Update the arpeggiator, e.g. {"enabled": true, "pattern": "updown",
+        "bpm": 110, "rate": 4, "octaves": 2, "gate": 0.6, "swing": 0.2}
+        (all keys optional).
+        """
+        if arp is None:
+            return jsonify({"error": "Arpeggiator not available"}), 404
+        body = request.get_json(silent=True) or {}
+        try:
+            arp.set(**{key: body[key] for key in
+                       ("pattern", "bpm", "rate", "octaves", "gate", "swing") if key in body})
+        except (TypeError, ValueError) as e:
+            return jsonify({"error": f"Invalid arpeggiator settings: {e}"}), 400
+        if "enabled" in body:
+            if not body["enabled"]:
+                arp.disable()
+            elif not arp.enable():
+                return jsonify({"error": "No MIDI input for the arpeggiator"}), 503
+        return jsonify(arp.state())
+
+    @app.route("/api/player")
+    def get_player():
+        if player is None:
+            return jsonify({"error": "Player not available"}), 404
+        return jsonify(player.state())
+
+    @app.route("/api/player", methods=["POST"])
+    def set_player():
+        """
+        Control the backing track, e.g. {"file": "blues.mid", "playing": true,
+        "loop": true, "tempo": 0.8, "position": 30} (all keys optional;
+        applied in that order).
+        """
+        if player is None:
+            return jsonify({"error": "Player not available"}), 404
+        body = request.get_json(silent=True) or {}
+        try:
+            if "file" in body:
+                player.load(str(body["file"]))
+            player.set(loop=body.get("loop"), tempo=body.get("tempo"))
+            if "position" in body:
+                player.seek(body["position"])
+            if "playing" in body:
+                if body["playing"]:
+                    player.play()
+                else:
+                    player.stop()
+        except (TypeError, ValueError) as e:
+            return jsonify({"error": f"Invalid player request: {e}"}), 400
+        except OSError as e:
+            return jsonify({"error": f"Could not read file: {e}"}), 500
+        return jsonify(player.state())
+
+    @app.route("/api/config/reload", methods=["POST"])
+    def reload_config():
+        """Apply edits to config.py; 400 with the errors if it doesn't validate."""
+        if reloader is None:
+            return jsonify({"error": "Config reload not available"}), 404
+        log.info("🌐 Web: config reload requested")
+        report = reloader.reload()
+        return jsonify(report), 400 if report["status"] == "invalid" else 200
+
+    @app.route("/api/trace")
+    def get_trace():
+        """The trace ring as Chrome trace JSON (open in ui.perfetto.dev)."""
+        return Response(json.dumps(tracing.export()), mimetype="application/json",
+                        headers={"Content-Disposition": "attachment; filename=piano-pi-trace.json"})
+
+    @app.route("/api/trace", methods=["POST"])
+    def set_trace():
+        """Switch tracing on/off and/or clear the ring: {"enabled": true, "clear": true}."""
+        body = request.get_json(silent=True) or {}
+        if body.get("clear"):
+            tracing.clear()
+        if "enabled" in body:
+            tracing.enable(bool(body["enabled"]))
+            log.info("🌐 Web: tracing %s", "on" if tracing.enabled() else "off")
+        return jsonify({"enabled": tracing.enabled()})
+
+    @app.route("/api/metrics")
+    def get_metrics():
+        """Prometheus scrape endpoint."""
+        return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
     # ---------------------------------------------------------------
     # Server-Sent Events (SSE) for real-time updates
     # ---------------------------------------------------------------
 
     @app.route("/api/events")
     def sse_stream():
-        """SSE endpoint — clients receive real-time state changes."""
-        q = queue.Queue(maxsize=50)
-        with _sse_lock:
-            _sse_clients.append(q)
+        """
+        SSE endpoint. Every event has an id ("<epoch>-<version>"); a
+        client reconnecting with Last-Event-ID (header, or ?last_event_id=)
+        gets what it missed, otherwise it starts with the full state.
+        """
+        resume = request.headers.get("Last-Event-ID") or request.args.get("last_event_id")
+        last = _store.parse_id(resume)
 
         def generate():
-            try:
-                while True:
-                    try:
-                        data = q.get(timeout=30)
-                        yield f"data: {json.dumps(data)}\n\n"
-                    except queue.Empty:
-                        # Send keepalive to prevent connection timeout
-                        yield ": keepalive\n\n"
-            finally:
-                with _sse_lock:
-                    if q in _sse_clients:
-                        _sse_clients.remove(q)
+            nonlocal last
+            if last is None:
+                last, values = _store.snapshot()
+                yield _sse_state(last, values, full=True)
+
+            while True:
+                events = _store.wait(last, timeout=SSE_KEEPALIVE_SECONDS)
+                if events is None:
+                    # Fell behind the ring: resync with the full state
+                    last, values = _store.snapshot()
+                    yield _sse_state(last, values, full=True)
+                    continue
+                if not events:
+                    yield ": keepalive\n\n"
+                    continue
+
+                for event in coalesce(events):
+                    if event.type == "state":
+                        yield _sse_state(event.version, event.data, full=False)
+                    else:
+                        yield _sse_format(event.version, {"type": event.type, **event.data})
+                last = events[-1].version
+                # Let a burst (e.g. several button presses) pile up into one send
+                time.sleep(config.SSE_COALESCE_SECONDS)
 
         return Response(
             generate(),
@@ -152,26 +448,66 @@ def create_app(synth, midi, leds, restart_cb, shutdown_cb):
     return app
 
 
+def _with_active(values: dict) -> dict:
+    """Add the per-instrument "active" flag older clients expect."""
+    if "instruments" not in values:
+        return values
+    current = values.get("instrument_index")
+    return {**values, "instruments": [
+        {**inst, "active": inst["index"] == current} for inst in values["instruments"]
+    ]}
+
+
+def _sse_format(version: int, data: dict) -> str:
+    return f"id: {_store.event_id(version)}\ndata: {json.dumps(data)}\n\n"
+
+
+def _sse_state(version: int, values: dict, full: bool) -> str:
+    return _sse_format(version, {"type": "state", "version": version,
+                                 "full": full, "changes": values})
+
+
+def collect_state(synth, midi) -> dict:
+    """The UI state, read from the running components."""
+    return {
+        "instrument": synth.get_current_instrument(),
+        "instrument_index": synth.current_index,
+        "instruments": [
+            {
+                "index": i,
+                "name": inst["name"],
+                "program": inst["program"],
+                "bank": inst.get("bank", 0),
+                "preset": inst.get("preset"),
+                "core": inst.get("core", False),
+            }
+            for i, inst in enumerate(synth.instruments)
+        ],
+        "synth_running": synth.is_running,
+        "synth_ready_seconds": synth.last_ready_seconds,
+        "synth_standby": synth.standby_ready,
+        "midi_connected": midi.has_midi if midi is not None else False,
+        "soundfonts": synth.soundfont_info(),
+        "sample_loading": synth.sample_loading_info(),
+    }
+
+
+def publish_state(synth, midi, **extra) -> int:
+    """Refresh the store from the components (plus `extra` keys); only changed keys go out."""
+    return _store.update(**collect_state(synth, midi), **extra)
+
+
 def broadcast_event(event_type: str, data: dict):
-    """Send an event to all connected SSE clients."""
-    payload = {"type": event_type, **data}
-    with _sse_lock:
-        dead = []
-        for q in _sse_clients:
-            try:
-                q.put_nowait(payload)
-            except queue.Full:
-                dead.append(q)
-        for q in dead:
-            _sse_clients.remove(q)
+    """Send a one-off event to all SSE clients (and any that resume soon)."""
+    _store.publish(event_type, data)
 
 
 def start_server(app, host="0.0.0.0", port=8080):
-    """Start Flask in a background thread."""
-    def run():
-        app.run(host=host, port=port, threaded=True, use_reloader=False)
+    """Start Flask in a background thread (returns once the port is listening)."""
+    from werkzeug.serving import make_server
 
-    thread = threading.Thread(target=run, daemon=True)
+    server = make_server(host, port, app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
     thread.start()
     log.info("🌐 Web portal running at http://%s:%d", host, port)
     return thread